@@ -0,0 +1,130 @@
+"""
+candidate ranking for generated melodies
+
+melody_rnn is asked for num_outputs candidates per primer. Instead of playing whichever comes first,
+all candidates are scored in one vectorized pass over piano-roll arrays and the best is used:
+
+    tonal:  cosine distance between the candidate's and the primer's duration weighted chroma
+    rhythm: mean distance of onsets from the metronome grid (beat / subdivision), 0 on grid, 1 halfway between
+    density: relative difference between candidate and primer notes per second
+
+Each criterion is in [0, 1] and the score is minus their weighted sum, so higher is better.
+Only notes starting at or after since (the end of the primer) count towards a candidate.
+"""
+import time
+
+import numpy as np
+
+DEFAULT_QUARTERS_PER_MINUTE = 120.0
+
+
+def note_arrays(sequences, since=0.0):
+    """
+    flatten the non drum notes of several NoteSequences into arrays
+    :return: (index, start, end, pitch) numpy arrays, index is the position of the note's sequence
+    """
+    rows = [(i, n.start_time, n.end_time, n.pitch)
+            for i, sequence in enumerate(sequences)
+            for n in sequence.notes
+            if not n.is_drum and n.start_time >= since]
+    if not rows:
+        return np.zeros(0, np.int64), np.zeros(0), np.zeros(0), np.zeros(0, np.int64)
+    index, start, end, pitch = (np.array(column) for column in zip(*rows))
+    return index.astype(np.int64), start.astype(np.float64), end.astype(np.float64), pitch.astype(np.int64)
+
+
+def piano_rolls(sequences, since=0.0, resolution=0.01):
+    """
+    :return: (chroma_roll [n, frames, 12] active pitch classes, onset_roll [n, frames] onset counts, frame times)
+    """
+    index, start, end, pitch = note_arrays(sequences, since)
+    last = end.max() if len(end) else since
+    frames = int(np.ceil((last - since) / resolution)) + 1
+    start_frame = np.floor((start - since) / resolution).astype(np.int64)
+    end_frame = np.maximum(start_frame + 1, np.ceil((end - since) / resolution).astype(np.int64))
+
+    # difference array, cumsum turns +1 at note on and -1 at note off into active frames
+    chroma_roll = np.zeros((len(sequences), frames + 1, 12))
+    np.add.at(chroma_roll, (index, start_frame, pitch % 12), 1)
+    np.add.at(chroma_roll, (index, end_frame, pitch % 12), -1)
+    chroma_roll = np.cumsum(chroma_roll, axis=1)[:, :frames]
+
+    onset_roll = np.zeros((len(sequences), frames))
+    np.add.at(onset_roll, (index, start_frame), 1)
+    return chroma_roll, onset_roll, since + resolution * np.arange(frames)
+
+
+class CandidateRanker:
+
+    def __init__(self, qpm=DEFAULT_QUARTERS_PER_MINUTE, subdivision=4, grid_origin=0.0, resolution=0.01,
+                 tonal_weight=1.0, rhythm_weight=1.0, density_weight=0.5):
+        self.qpm = qpm
+        self.subdivision = subdivision
+        self.grid_origin = grid_origin
+        self.resolution = resolution
+        self.weights = np.array([tonal_weight, rhythm_weight, density_weight])
+        self.last_timing = None
+
+    @classmethod
+    def from_config(cls, syn_config):
+        ranking_config = syn_config["candidate_ranking"]
+        return cls(
+            qpm=syn_config.get("quarters_per_minute", DEFAULT_QUARTERS_PER_MINUTE),
+            subdivision=ranking_config["subdivision"],
+            tonal_weight=ranking_config["tonal_weight"],
+            rhythm_weight=ranking_config["rhythm_weight"],
+            density_weight=ranking_config["density_weight"],
+        )
+
+    def grid_distance(self, times):
+        """
+        :return: distance of each time from the nearest grid line, as a fraction of half a grid step
+        """
+        grid = 60.0 / self.qpm / self.subdivision
+        phase = np.mod(times - self.grid_origin, grid)
+        return np.minimum(phase, grid - phase) / (grid / 2)
+
+    def criteria(self, primer_sequence, candidates, since=None):
+        """
+        :return: [n, 3] array of tonal distance, grid misalignment and density difference per candidate
+        """
+        if since is None:
+            since = max((n.end_time for n in primer_sequence.notes), default=0.0)
+        chroma_roll, onset_roll, times = piano_rolls(candidates, since, self.resolution)
+        primer_roll, _, _ = piano_rolls([primer_sequence], 0.0, self.resolution)
+
+        chroma = chroma_roll.sum(axis=1)
+        primer_chroma = primer_roll.sum(axis=1)[0]
+        norms = np.linalg.norm(chroma, axis=1) * np.linalg.norm(primer_chroma)
+        similarity = np.divide(chroma @ primer_chroma, norms, out=np.zeros(len(candidates)), where=norms > 0)
+        tonal = np.where(norms > 0, 1.0 - similarity, 1.0)
+
+        onsets = onset_roll.sum(axis=1)
+        misalignment = np.divide(onset_roll @ self.grid_distance(times), onsets,
+                                 out=np.ones(len(candidates)), where=onsets > 0)
+
+        span = max(times[-1] - since, self.resolution)
+        density = onsets / span
+        primer_span = max(since - min((n.start_time for n in primer_sequence.notes), default=0.0), self.resolution)
+        primer_density = len(primer_sequence.notes) / primer_span
+        largest = np.maximum(density, primer_density)
+        density_difference = np.divide(np.abs(density - primer_density), largest,
+                                       out=np.zeros(len(candidates)), where=largest > 0)
+        return np.stack([tonal, misalignment, density_difference], axis=1)
+
+    def score(self, primer_sequence, candidates, since=None):
+        """
+        :return: (array) score per candidate, higher is better
+        """
+        return -(self.criteria(primer_sequence, candidates, since) @ self.weights)
+
+    def rank(self, primer_sequence, candidates, since=None):
+        """
+        :return: (list) candidate indices, best first
+        """
+        if len(candidates) < 2:
+            return list(range(len(candidates)))
+        started = time.perf_counter()
+        order = np.argsort(-self.score(primer_sequence, candidates, since), kind="stable")
+        self.last_timing = time.perf_counter() - started
+        return [int(i) for i in order]
@@ -0,0 +1,208 @@
+"""
+sliding window of musical context with inertia
+
+Keeps the "historical / recent / latest" split from the music_generator TODOs, with bounded memory
+however long the set runs:
+
+    latest:     last onset and last note end time, updated incrementally as notes arrive
+    open:       notes still sounding at the last capture, whose end times keep moving
+    recent:     raw notes from the last recent_seconds (at most max_recent_notes), used as the primer
+    historical: notes leaving the recent window are folded into decaying summaries of
+                pitch class content (chroma), note density and tempo
+
+The key is tracked separately by a decaying ChromaAccumulator, updated per note as notes arrive
+and sound on, so key() is cheap enough to call every tick.
+
+Notes are ingested by scanning the captured notes back from the end to the older of the last onset
+and the oldest open note, so each tick only touches the notes that are new or still sounding. Held
+notes keep extending their entry (and the key chroma) after later notes start.
+"""
+import math
+from collections import deque
+
+from utils.key_estimator import ChromaAccumulator
+
+DEFAULT_QUARTERS_PER_MINUTE = 120.0
+
+# indices into a recent note entry
+START, END, PITCH, VELOCITY, IS_DRUM, INSTRUMENT, PROGRAM = range(7)
+
+
+class ContextWindow:
+
+    def __init__(self, recent_seconds=8.0, max_recent_notes=128, half_life=30.0):
+        """
+        recent_seconds: how far back raw notes are kept
+        max_recent_notes: cap on raw notes kept, regardless of recent_seconds
+        half_life: seconds for historical summaries to lose half their weight
+        """
+        self.recent_seconds = recent_seconds
+        self.max_recent_notes = max_recent_notes
+        self.half_life = half_life
+        self.reset()
+
+    def reset(self):
+        self._recent = deque()
+        self._at_last_onset = {}  # pitch -> entry, notes already ingested at the last onset
+        self._open = {}  # (start, pitch) -> entry, notes still sounding at the last capture
+        self.last_onset = float("-inf")
+        self.last_end_time = 0.0
+        self.note_count = 0
+        self.chroma = [0.0] * 12
+        self.density = 0.0  # notes per second
+        self.qpm = None
+        self._summary_time = None
+        self.key_chroma = ChromaAccumulator(half_life=self.half_life)
+
+    def ingest(self, notes, now=None):
+        """
+        add the notes captured since the last call, and extend the notes still sounding
+        notes: notes in onset order, e.g. a captured NoteSequence's notes
+        now: time the notes were captured up to, notes ending at or after it are still sounding.
+             None when every note has ended
+        :return: (int) number of new notes
+        """
+        scan_from = self.last_onset
+        if self._open:
+            scan_from = min(scan_from, min(entry[START] for entry in self._open.values()))
+        fresh = []
+        for note in reversed(notes):
+            if note.start_time < scan_from:
+                break
+            fresh.append(note)
+
+        added = 0
+        for note in reversed(fresh):
+            key = (note.start_time, note.pitch)
+            entry = self._open.get(key)
+            if entry is None and note.start_time == self.last_onset:
+                entry = self._at_last_onset.get(note.pitch)
+            if entry is not None:
+                if note.end_time != entry[END]:
+                    self.key_chroma.extend(note.pitch, entry[VELOCITY], entry[START], entry[END], note.end_time,
+                                           note.is_drum)
+                    entry[END] = note.end_time
+            elif note.start_time >= self.last_onset:
+                if note.start_time > self.last_onset:
+                    self._at_last_onset = {}
+                    self.last_onset = note.start_time
+                entry = [note.start_time, note.end_time, note.pitch, note.velocity, note.is_drum,
+                         note.instrument, note.program]
+                self._recent.append(entry)
+                self._at_last_onset[note.pitch] = entry
+                self.key_chroma.add(note.pitch, note.velocity, note.start_time, note.end_time, note.is_drum)
+                self.note_count += 1
+                added += 1
+            else:
+                # ended and already ingested
+                continue
+            if now is not None and note.end_time >= now:
+                self._open[key] = entry
+            else:
+                self._open.pop(key, None)
+            if note.end_time > self.last_end_time:
+                self.last_end_time = note.end_time
+
+        if fresh:
+            self._evict(self.last_end_time)
+        return added
+
+    def recent_start(self, now):
+        """
+        :return: (float) time before which raw notes are only kept as summaries
+        """
+        return now - self.recent_seconds
+
+    def _evict(self, now):
+        horizon = self.recent_start(now)
+        while self._recent and (len(self._recent) > self.max_recent_notes or self._recent[0][END] < horizon):
+            entry = self._recent.popleft()
+            if self._at_last_onset.get(entry[PITCH]) is entry:
+                del self._at_last_onset[entry[PITCH]]
+            if self._open.get((entry[START], entry[PITCH])) is entry:
+                del self._open[(entry[START], entry[PITCH])]
+            self._fold(entry)
+
+    def _fold(self, entry):
+        """move a note leaving the recent window into the historical summaries"""
+        start, end = entry[START], entry[END]
+        if self._summary_time is not None:
+            elapsed = max(0.0, start - self._summary_time)
+            decay = math.pow(0.5, elapsed / self.half_life)
+            self.chroma = [c * decay for c in self.chroma]
+            if elapsed > 0:
+                rate = 1.0 / elapsed
+                self.density = decay * self.density + (1 - decay) * rate
+            ioi_qpm = 60.0 / elapsed if elapsed > 0 else None
+            if ioi_qpm is not None:
+                # fold the inter onset interval into 60-240 qpm before averaging
+                while ioi_qpm < 60.0:
+                    ioi_qpm *= 2
+                while ioi_qpm > 240.0:
+                    ioi_qpm /= 2
+                self.qpm = ioi_qpm if self.qpm is None else decay * self.qpm + (1 - decay) * ioi_qpm
+        self.chroma[entry[PITCH] % 12] += max(0.0, end - start)
+        self._summary_time = start
+
+    def recent_notes(self, since=float("-inf")):
+        """
+        :return: (list) [start, end, pitch, velocity, is_drum, instrument, program] entries with onsets at or
+            after since
+        """
+        notes = []
+        for entry in reversed(self._recent):
+            if entry[START] < since:
+                break
+            notes.append(entry)
+        notes.reverse()
+        return notes
+
+    def primer(self, start_time, end_time, qpm=DEFAULT_QUARTERS_PER_MINUTE, max_notes=None):
+        """
+        bounded primer for the generator from the recent window
+        start_time: earliest onset to include
+        end_time: total_time of the primer
+        max_notes: keep only the latest notes, defaults to max_recent_notes
+        :return: (NoteSequence)
+        """
+        from magenta.protobuf import music_pb2
+
+        sequence = music_pb2.NoteSequence()
+        sequence.tempos.add(qpm=qpm)
+        sequence.ticks_per_quarter = 220
+        notes = self.recent_notes(since=start_time)
+        notes = notes[-(max_notes or self.max_recent_notes):]
+        for start, end, pitch, velocity, is_drum, instrument, program in notes:
+            if start >= end_time:
+                continue
+            sequence.notes.add(start_time=start, end_time=min(end, end_time), pitch=pitch, velocity=velocity,
+                               is_drum=is_drum, instrument=instrument, program=program)
+        sequence.total_time = end_time
+        return sequence
+
+    def key(self):
+        """
+        :return: (key name, correlation) estimated from the decaying chroma of everything ingested
+        """
+        return self.key_chroma.key()
+
+    def summary(self):
+        """
+        :return: (dict) chroma (normalized), density and qpm of the historical context plus the recent window
+        """
+        chroma = list(self.chroma)
+        for start, end, pitch, *_ in self._recent:
+            chroma[pitch % 12] += max(0.0, end - start)
+        total = sum(chroma)
+        if total > 0:
+            chroma = [c / total for c in chroma]
+        recent_density = len(self._recent) / self.recent_seconds
+        return {
+            "chroma": chroma,
+            "density": recent_density if not self.density else 0.5 * (recent_density + self.density),
+            "recent_density": recent_density,
+            "qpm": self.qpm,
+            "key": self.key()[0],
+            "last_end_time": self.last_end_time,
+            "note_count": self.note_count,
+        }
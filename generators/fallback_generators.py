@@ -0,0 +1,137 @@
+"""
+fast fallback tiers for real-time generation
+
+When the neural generator can't answer within the tick, these answer in well under a millisecond:
+
+    MarkovMelodyGenerator: n-gram model over (pitch, duration, inter onset interval) tokens in model
+                           steps, trained incrementally on the notes captured this session, with
+                           backoff to shorter contexts
+    DrumPatternTable:      precomputed one bar patterns for the drum path, picked by how busy the
+                           captured input is
+
+Both return NoteSequences in the same system time as RealTimeMidiInteraction._generate.
+"""
+import random
+from collections import Counter, defaultdict, deque
+
+MAX_STEPS = 16  # longest duration / inter onset interval kept, in steps
+BAR_STEPS = 16  # 4/4 at 4 steps per quarter, as drum_kit_rnn
+DEFAULT_VELOCITY = 100
+
+KICK, SNARE, CLOSED_HAT, OPEN_HAT = 36, 38, 42, 46
+
+# one bar of 16th notes per pattern, sparsest first
+DRUM_PATTERNS = (
+    ("sparse", {KICK: (0,), SNARE: (8,), CLOSED_HAT: (0, 8)}),
+    ("half_time", {KICK: (0, 10), SNARE: (8,), CLOSED_HAT: (0, 4, 8, 12)}),
+    ("rock", {KICK: (0, 8), SNARE: (4, 12), CLOSED_HAT: (0, 2, 4, 6, 8, 10, 12, 14)}),
+    ("four_on_the_floor", {KICK: (0, 4, 8, 12), SNARE: (4, 12), CLOSED_HAT: (2, 6, 10, 14), OPEN_HAT: (14,)}),
+    ("busy", {KICK: (0, 3, 8, 11), SNARE: (4, 12, 15), CLOSED_HAT: tuple(range(16))}),
+)
+
+
+def _new_sequence(qpm):
+    from magenta.protobuf import music_pb2
+
+    sequence = music_pb2.NoteSequence()
+    sequence.tempos.add(qpm=qpm)
+    sequence.ticks_per_quarter = 220
+    return sequence
+
+
+class MarkovMelodyGenerator:
+
+    def __init__(self, order=2, seed=None):
+        self.order = order
+        self._counts = [defaultdict(Counter) for _ in range(order + 1)]
+        self._history = deque(maxlen=order)
+        self._pending = None  # [start, end, pitch, ...] waiting for the next onset
+        self._rng = random.Random(seed)
+        self.observed = 0
+
+    def observe(self, note, seconds_per_step):
+        """
+        add a captured note, in onset order. A note becomes a token once the next onset gives its interval.
+        note: [start, end, pitch, ...], e.g. a ContextWindow entry. It is kept until then, so the
+              duration is read from its end as updated while it was still sounding
+        """
+        start_time = note[0]
+        if self._pending is not None:
+            pending_start, pending_end, pending_pitch = self._pending[:3]
+            ioi = min(MAX_STEPS, max(1, int(round((start_time - pending_start) / seconds_per_step))))
+            duration = min(ioi, max(1, int(round((pending_end - pending_start) / seconds_per_step))))
+            self._add((pending_pitch, duration, ioi))
+        self._pending = note
+
+    def _add(self, token):
+        history = tuple(self._history)
+        for n in range(len(history) + 1):
+            self._counts[n][history[len(history) - n:] if n else ()][token] += 1
+        self._history.append(token)
+        self.observed += 1
+
+    def _sample(self, history):
+        # back off to shorter contexts until one has been seen
+        for n in range(min(self.order, len(history)), -1, -1):
+            counter = self._counts[n].get(history[len(history) - n:] if n else ())
+            if counter:
+                tokens, weights = zip(*counter.items())
+                return self._rng.choices(tokens, weights)[0]
+        return None
+
+    def generate(self, start_time, end_time, seconds_per_step, qpm, velocity=DEFAULT_VELOCITY):
+        """
+        :return: (NoteSequence) continuation of the observed notes between start_time and end_time
+        """
+        sequence = _new_sequence(qpm)
+        history = deque(self._history, maxlen=self.order)
+        time = start_time
+        while time < end_time - 1e-6:
+            token = self._sample(tuple(history))
+            if token is None:
+                break
+            pitch, duration, ioi = token
+            sequence.notes.add(pitch=pitch, velocity=velocity, start_time=time,
+                               end_time=min(end_time, time + duration * seconds_per_step))
+            history.append(token)
+            time += ioi * seconds_per_step
+        sequence.total_time = end_time
+        return sequence
+
+
+class DrumPatternTable:
+
+    def __init__(self, patterns=DRUM_PATTERNS, velocity=DEFAULT_VELOCITY):
+        """
+        patterns: (name, {drum pitch: steps}) one bar patterns, sparsest first
+        """
+        self.names = [name for name, _ in patterns]
+        # (step, pitch) events per pattern, sorted once
+        self.events = [sorted((step, pitch) for pitch, steps in hits.items() for step in steps)
+                       for _, hits in patterns]
+        self.velocity = velocity
+
+    def select(self, onsets_per_bar):
+        """
+        :return: (int) pattern index, busier input gets a busier pattern
+        """
+        index = int(onsets_per_bar // 4)
+        return min(len(self.events) - 1, max(0, index))
+
+    def generate(self, start_time, end_time, seconds_per_step, qpm, onsets_per_bar=8):
+        """
+        :return: (NoteSequence) the selected pattern repeated from start_time to end_time
+        """
+        sequence = _new_sequence(qpm)
+        events = self.events[self.select(onsets_per_bar)]
+        bar_start = start_time
+        while bar_start < end_time - 1e-6:
+            for step, pitch in events:
+                onset = bar_start + step * seconds_per_step
+                if onset >= end_time:
+                    break
+                sequence.notes.add(pitch=pitch, velocity=self.velocity, start_time=onset, is_drum=True,
+                                   instrument=9, end_time=min(end_time, onset + seconds_per_step))
+            bar_start += BAR_STEPS * seconds_per_step
+        sequence.total_time = end_time
+        return sequence
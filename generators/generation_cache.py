@@ -0,0 +1,142 @@
+"""
+generation result cache
+
+Live sets repeat motifs, so identical primers with identical generation settings are
+answered from an LRU cache instead of another melody_rnn run. Keys are a sha256 over a
+canonical form of the primer NoteSequence plus the whole generation config (the melody model
+settings, backend included, the candidate ranking settings and the tempo candidates are ranked at),
+so any setting added later is part of the key without being listed here.
+Entries expire after ttl seconds, and an optional on-disk tier keeps results across restarts.
+"""
+import hashlib
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# magenta melody settings from config.yml that only drive playback and the state machine
+RUNTIME_SETTINGS = ("volume", "state", "stop", "mutate")
+
+
+def generation_settings(syn_config, qpm=None):
+    """
+    :return: (dict) the config that decides what generating from a primer returns
+    """
+    melody_config = syn_config["magenta"]["melody"]
+    return {
+        "melody": {k: v for k, v in melody_config.items() if k not in RUNTIME_SETTINGS},
+        "candidate_ranking": syn_config["candidate_ranking"],
+        "quarters_per_minute": qpm,
+    }
+
+
+def primer_key(primer_sequence, settings):
+    """
+    settings: (dict) as generation_settings()
+    :return: (str) hex digest identifying the primer notes, tempo and generation settings
+    """
+    digest = hashlib.sha256()
+    qpm = primer_sequence.tempos[0].qpm if primer_sequence.tempos else 0.0
+    digest.update(repr(round(qpm, 3)).encode())
+    notes = sorted(
+        (round(n.start_time, 4), round(n.end_time, 4), n.pitch, n.velocity, n.instrument, n.program, n.is_drum)
+        for n in primer_sequence.notes
+    )
+    digest.update(repr(notes).encode())
+    digest.update(json.dumps(settings, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+class GenerationCache:
+
+    def __init__(self, maxsize=128, ttl=None, disk_dir=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    @classmethod
+    def from_config(cls, syn_config):
+        cache_config = syn_config["generation_cache"]
+        disk_dir = cache_config.get("disk_dir")
+        if disk_dir and not os.path.isabs(disk_dir):
+            disk_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), disk_dir)
+        return cls(maxsize=cache_config["maxsize"], ttl=cache_config.get("ttl"), disk_dir=disk_dir)
+
+    def _expired(self, stored_at, now):
+        return self.ttl is not None and now - stored_at > self.ttl
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key + ".pkl")
+
+    def get(self, key):
+        """
+        :return: the cached value, or None on a miss
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if not self._expired(stored_at, now):
+                    self._entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return value
+                del self._entries[key]
+                self.stats["expirations"] += 1
+        if self.disk_dir:
+            value = self._read_disk(key, now)
+            if value is not None:
+                with self._lock:
+                    self.stats["disk_hits"] += 1
+                    self._store(key, value, now)
+                return value
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._store(key, value, now)
+        if self.disk_dir:
+            tmp_path = self._disk_path(key) + ".tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump((now, value), f)
+            os.replace(tmp_path, self._disk_path(key))
+
+    def _store(self, key, value, now):
+        self._entries[key] = (now, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _read_disk(self, key, now):
+        try:
+            with open(self._disk_path(key), "rb") as f:
+                stored_at, value = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            logger.warning("unreadable generation cache entry %s", key)
+            return None
+        if self._expired(stored_at, now):
+            os.remove(self._disk_path(key))
+            with self._lock:
+                self.stats["expirations"] += 1
+            return None
+        return value
+
+    def counters(self):
+        with self._lock:
+            return dict(self.stats, size=len(self._entries))
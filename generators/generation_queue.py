@@ -0,0 +1,108 @@
+"""
+bounded work queue between OSC receive and generation
+
+A single worker thread runs generation requests one at a time, so a burst of incoming
+phrases can't start concurrent model runs that fight over the CPU. When requests arrive
+faster than they are generated, the coalescing policy decides what waits:
+
+    latest_wins: only the newest pending request is kept, older pending ones are replaced, maxsize is unused
+    drop_oldest: up to maxsize requests wait, the oldest pending one is dropped when full
+    reject:      up to maxsize requests wait, new requests are refused when full
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+COALESCING_POLICIES = ("latest_wins", "drop_oldest", "reject")
+
+
+class GenerationQueue:
+
+    def __init__(self, handler, maxsize=4, policy="latest_wins"):
+        if policy not in COALESCING_POLICIES:
+            raise ValueError(f"unknown coalescing policy '{policy}', expected one of {COALESCING_POLICIES}")
+        self.handler = handler
+        # latest_wins keeps only the newest pending request, whatever maxsize is
+        self.maxsize = 1 if policy == "latest_wins" else maxsize
+        self.policy = policy
+        self._pending = deque()
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._worker = threading.Thread(target=self._run, name="generation-worker", daemon=True)
+        self._stats = {
+            "submitted": 0,
+            "processed": 0,
+            "failed": 0,
+            "coalesced": 0,
+            "dropped": 0,
+            "rejected": 0,
+            "max_depth": 0,
+            "total_wait": 0.0,
+            "total_run": 0.0,
+        }
+
+    @classmethod
+    def from_config(cls, handler, syn_config):
+        queue_config = syn_config["generation_queue"]
+        return cls(handler, maxsize=queue_config["maxsize"], policy=queue_config["policy"])
+
+    def start(self):
+        self._worker.start()
+        return self
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+
+    def submit(self, *args):
+        """
+        :return: (bool) False if the request was rejected
+        """
+        with self._condition:
+            self._stats["submitted"] += 1
+            if len(self._pending) >= self.maxsize:
+                if self.policy == "reject":
+                    self._stats["rejected"] += 1
+                    logger.info("generation queue full (%d), rejecting request", len(self._pending))
+                    return False
+                self._pending.popleft()
+                self._stats["coalesced" if self.policy == "latest_wins" else "dropped"] += 1
+            self._pending.append((time.time(), args))
+            self._stats["max_depth"] = max(self._stats["max_depth"], len(self._pending))
+            self._condition.notify()
+        return True
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                submitted_at, args = self._pending.popleft()
+            started_at = time.time()
+            try:
+                self.handler(*args)
+                failed = False
+            except Exception:
+                logger.exception("generation request failed")
+                failed = True
+            with self._condition:
+                self._stats["failed" if failed else "processed"] += 1
+                self._stats["total_wait"] += started_at - submitted_at
+                self._stats["total_run"] += time.time() - started_at
+
+    def metrics(self):
+        """
+        :return: (dict) queue depth and request counters
+        """
+        with self._condition:
+            metrics = dict(self._stats, depth=len(self._pending), policy=self.policy, maxsize=self.maxsize)
+        finished = metrics["processed"] + metrics["failed"]
+        metrics["mean_wait"] = metrics.pop("total_wait") / finished if finished else 0.0
+        metrics["mean_run"] = metrics.pop("total_run") / finished if finished else 0.0
+        return metrics
@@ -0,0 +1,240 @@
+"""
+generation service: each model in its own worker process
+
+Running drums and piano generators as threads of one interpreter makes inference contend for the
+GIL with MIDI capture, playback and metronome threads, which is audible as timing jitter.
+A GenerationService starts a spawned worker process that loads one bundle and answers requests
+over a Pipe. Requests and results are serialized NoteSequence / GeneratorOptions protos, so only
+bytes cross the process boundary, and the calling thread waits in a blocking poll that releases
+the GIL while the worker saturates another core. A worker that dies or doesn't answer within
+start_timeout / request_timeout raises GenerationServiceError; one that timed out is stopped, so its
+late answer can't be taken for the next request's, and respawned in the background.
+
+GeneratorProxy looks like a SequenceGenerator to the midi interactions (generate, details,
+bundle_details, steps_per_quarter) and forwards generate() to its service.
+"""
+import logging
+import multiprocessing
+import threading
+import traceback
+
+logger = logging.getLogger(__name__)
+
+STOP = None
+# seconds between checks that the worker is still alive while waiting for it
+POLL_INTERVAL = 0.5
+
+
+class GenerationServiceError(Exception):
+    pass
+
+
+def _serve(conn, bundle_file, backend):
+    """
+    worker process: load the generator, report its details, then answer requests until STOP
+    """
+    from magenta.protobuf import generator_pb2
+    from magenta.protobuf import music_pb2
+    from generators.interfaces.synmag_midi import _load_generator_from_bundle_file
+
+    generator = _load_generator_from_bundle_file(bundle_file, backend)
+    if generator is None:
+        conn.send(("error", f"could not load generator bundle: {bundle_file}"))
+        return
+    conn.send(("ready", (
+        generator.details.SerializeToString(),
+        generator.bundle_details.SerializeToString() if generator.bundle_details else b"",
+        getattr(generator, "steps_per_quarter", None),
+        getattr(generator, "steps_per_second", None),
+    )))
+
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            return
+        if request is STOP:
+            return
+        input_bytes, options_bytes = request
+        try:
+            input_sequence = music_pb2.NoteSequence.FromString(input_bytes)
+            generator_options = generator_pb2.GeneratorOptions.FromString(options_bytes)
+            result = generator.generate(input_sequence, generator_options)
+            conn.send(("ok", result.SerializeToString()))
+        except Exception:
+            conn.send(("error", traceback.format_exc()))
+
+
+class GenerationService:
+
+    def __init__(self, bundle_file, backend="tensorflow", start_timeout=120.0, request_timeout=30.0):
+        """
+        start_timeout: seconds the worker gets to load its bundle
+        request_timeout: seconds a generate request may take, None to wait as long as the worker lives
+        """
+        self.bundle_file = bundle_file
+        self.backend = backend
+        self.start_timeout = start_timeout
+        self.request_timeout = request_timeout
+        self._context = multiprocessing.get_context("spawn")
+        self._conn = None
+        self._process = None
+        self._lock = threading.Lock()
+        self._restarting = False
+        self._stopped = False
+        self.restarts = 0
+        self.info = None
+
+    def _spawn(self):
+        """
+        start a worker and wait until its bundle is loaded
+        :return: (conn, process, ready payload)
+        """
+        conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_serve, args=(child_conn, self.bundle_file, self.backend),
+            name=f"generation-{self.bundle_file}", daemon=True)
+        process.start()
+        child_conn.close()
+        try:
+            status, payload = self._recv(conn, process, self.start_timeout, "load its bundle")
+            if status != "ready":
+                raise GenerationServiceError(payload)
+        except GenerationServiceError:
+            self._kill(conn, process, 0.0)
+            raise
+        return conn, process, payload
+
+    def start(self):
+        """
+        spawn the worker and wait until its bundle is loaded
+        """
+        conn, process, self.info = self._spawn()
+        with self._lock:
+            self._conn, self._process = conn, process
+            self._stopped = False
+        logger.info("generation worker %d serving %s", process.pid, self.bundle_file)
+        return self
+
+    def request(self, input_bytes, options_bytes):
+        """
+        A worker that failed is respawned in the background, requests raise until it is ready again.
+        :return: (bytes) serialized generated NoteSequence
+        """
+        with self._lock:
+            if self._process is None or not self._process.is_alive():
+                self._restart()
+                raise GenerationServiceError(f"generation worker for {self.bundle_file} is not running")
+            try:
+                self._conn.send((input_bytes, options_bytes))
+                status, payload = self._recv(self._conn, self._process, self.request_timeout, "generate")
+            except (GenerationServiceError, BrokenPipeError, OSError) as e:
+                # a late answer from this worker would be taken for the next request's
+                self._kill(self._conn, self._process, 0.0)
+                self._process = None
+                self._restart()
+                if isinstance(e, GenerationServiceError):
+                    raise
+                raise GenerationServiceError(f"generation worker for {self.bundle_file} exited") from e
+        if status != "ok":
+            raise GenerationServiceError(payload)
+        return payload
+
+    def _restart(self):
+        """
+        respawn the worker in a background thread, called with the lock held
+        """
+        if self._restarting or self._stopped:
+            return
+        self._restarting = True
+        threading.Thread(target=self._respawn, name=f"restart-{self.bundle_file}", daemon=True).start()
+
+    def _respawn(self):
+        try:
+            conn, process, _ = self._spawn()
+        except GenerationServiceError:
+            logger.exception("could not restart the generation worker for %s", self.bundle_file)
+            with self._lock:
+                self._restarting = False
+            return
+        with self._lock:
+            self._restarting = False
+            if self._stopped:
+                self._kill(conn, process, 0.0)
+                return
+            self._conn, self._process = conn, process
+            self.restarts += 1
+        logger.warning("restarted generation worker %d for %s", process.pid, self.bundle_file)
+
+    def _recv(self, conn, process, timeout, action):
+        """
+        wait for the worker's answer, checking every POLL_INTERVAL that it is still alive
+        :return: (status, payload)
+        """
+        waited = 0.0
+        while timeout is None or waited < timeout:
+            interval = POLL_INTERVAL if timeout is None else min(POLL_INTERVAL, timeout - waited)
+            if conn.poll(interval):
+                try:
+                    return conn.recv()
+                except EOFError:
+                    break
+            if not process.is_alive() and not conn.poll():
+                break
+            waited += interval
+        else:
+            raise GenerationServiceError(
+                f"generation worker for {self.bundle_file} did not {action} within {timeout}s")
+        raise GenerationServiceError(f"generation worker for {self.bundle_file} exited")
+
+    def stop(self, timeout=5.0):
+        with self._lock:
+            self._stopped = True
+            if self._process is not None:
+                self._kill(self._conn, self._process, timeout)
+                self._process = None
+
+    @staticmethod
+    def _kill(conn, process, timeout):
+        try:
+            conn.send(STOP)
+        except (BrokenPipeError, OSError):
+            pass
+        process.join(timeout)
+        if process.is_alive():
+            process.terminate()
+        conn.close()
+
+
+class GeneratorProxy:
+    """
+    SequenceGenerator stand in that generates in a GenerationService worker process
+    """
+
+    def __init__(self, service):
+        from magenta.protobuf import generator_pb2
+
+        self.service = service
+        details_bytes, bundle_details_bytes, self.steps_per_quarter, steps_per_second = service.info
+        self.details = generator_pb2.GeneratorDetails.FromString(details_bytes)
+        self.bundle_details = (generator_pb2.GeneratorBundle.BundleDetails.FromString(bundle_details_bytes)
+                               if bundle_details_bytes else None)
+        if steps_per_second is not None:
+            self.steps_per_second = steps_per_second
+
+    @classmethod
+    def start(cls, bundle_file, backend="tensorflow", **service_kwargs):
+        return cls(GenerationService(bundle_file, backend, **service_kwargs).start())
+
+    def initialize(self):
+        pass
+
+    def generate(self, input_sequence, generator_options):
+        from magenta.protobuf import music_pb2
+
+        result_bytes = self.service.request(input_sequence.SerializeToString(),
+                                            generator_options.SerializeToString())
+        return music_pb2.NoteSequence.FromString(result_bytes)
+
+    def close(self):
+        self.service.stop()
@@ -1,15 +1,39 @@
 import abc
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
 from absl import logging
 
 import magenta
 from magenta.protobuf import generator_pb2
 from magenta.protobuf import music_pb2
-import tensorflow as tf
 
 from magenta.interfaces.midi.midi_interaction import MidiInteraction, adjust_sequence_times
 
+from generators.context_window import ContextWindow, START
+from generators.fallback_generators import DrumPatternTable, MarkovMelodyGenerator, BAR_STEPS
+from generators.generation_service import GenerationServiceError
+from generators.metronome import SynMetronome
+from generators.models.streaming_rnn import StreamingMelodyRnn
+from generators.tempo_tracker import TempoTracker
+
+
+class _Speculation(object):
+    """
+    A response generated in the background while still LISTENING, as if the call ended at `response_start_time`.
+
+    `fingerprint` identifies the captured input it was generated from, so it is only used
+    if no new notes arrived before the call actually ended. Setting `cancelled` stops the
+    generation between chunks once it is running.
+    """
+
+    def __init__(self, future, cancelled, fingerprint, response_start_time, response_duration):
+        self.future = future
+        self.cancelled = cancelled
+        self.fingerprint = fingerprint
+        self.response_start_time = response_start_time
+        self.response_duration = response_duration
+
 
 class RealTimeMidiInteraction(MidiInteraction):
     """
@@ -94,6 +118,24 @@ class RealTimeMidiInteraction(MidiInteraction):
       state_control_number: The optinal control change number to use for sending
           state update control changes. The values are 0 for `IDLE`, 1 for
           `LISTENING`, and 2 for `RESPONDING`.
+      step_batch: The number of model steps generated per chunk when a response
+          has a deadline. Generation stops between chunks once the next one is
+          not expected to finish in time.
+      streaming: A boolean specifying whether melody_rnn generators keep their RNN
+          state between ticks, encoding only newly captured notes each tick
+          instead of re-encoding the whole capture for every response.
+      context_window: An optional ContextWindow holding the recent notes used as
+          the generation primer and summaries of older ones. The captor is
+          trimmed to its recent window while listening, so long calls stay
+          bounded in memory and per-tick work.
+      fallback: A boolean specifying whether responses start from a fast
+          fallback tier (an n-gram model trained on the session's notes, or a
+          drum pattern table for drum generators). Neural generation replaces
+          as much of it as finishes by the response deadline.
+      tempo_tracker: An optional TempoTracker fed the onsets of captured notes
+          each tick. Defaults to one centered on `qpm`.
+      follow_tempo: A boolean specifying whether the metronome, and the qpm of
+          responses, follow the tracked tempo and beat phase of the performer.
 
       Raises:
         ValueError: If exactly one of `clock_signal` or `tick_duration` is not
@@ -135,7 +177,13 @@ class RealTimeMidiInteraction(MidiInteraction):
                  tempo_control_number=None,
                  temperature_control_number=None,
                  loop_control_number=None,
-                 state_control_number=None):
+                 state_control_number=None,
+                 step_batch=16,
+                 streaming=False,
+                 context_window=None,
+                 fallback=True,
+                 tempo_tracker=None,
+                 follow_tempo=True):
         super(RealTimeMidiInteraction, self).__init__(
             midi_hub, sequence_generators, qpm, generator_select_control_number,
             tempo_control_number, temperature_control_number)
@@ -160,6 +208,27 @@ class RealTimeMidiInteraction(MidiInteraction):
         self._panic = threading.Event()
         # Even for signalling when to mutate response.
         self._mutate = threading.Event()
+        # Background worker for speculative generation while listening.
+        self._speculation_executor = ThreadPoolExecutor(max_workers=1)
+        self._speculation_stats = {'hits': 0, 'misses': 0, 'cancelled': 0, 'extended': 0}
+        # Deadline-aware generation: steps per chunk, measured seconds per step.
+        self._step_batch = step_batch
+        self._step_cost = None
+        self._deadline_stats = {'met': 0, 'missed': 0, 'truncated': 0, 'fallback': 0}
+        # Speculations update the step cost and deadline stats from the executor thread.
+        self._stats_lock = threading.Lock()
+        # Streaming generation: persistent RNN state fed incrementally each tick.
+        self._streaming = streaming
+        self._streamer = None
+        self._context = context_window or ContextWindow()
+        # Fallback tier answering when neural generation misses the deadline.
+        self._fallback = fallback
+        self._markov = MarkovMelodyGenerator()
+        self._drum_patterns = DrumPatternTable()
+        # Onset based tempo tracking, followed by the metronome.
+        self._tempo_tracker = tempo_tracker or TempoTracker(initial_qpm=qpm, prior_qpm=qpm)
+        self._follow_tempo = follow_tempo
+        self._metronome = None
 
     def _update_state(self, state):
         """Logs and sends a control change with the state."""
@@ -201,8 +270,8 @@ class RealTimeMidiInteraction(MidiInteraction):
         return (self._loop_control_number and
                 self._midi_hub.control_value(self._loop_control_number) == 127)
 
-    def _generate(self, input_sequence, zero_time, response_start_time,
-                  response_end_time):
+    def _generate_section(self, input_sequence, zero_time, response_start_time,
+                          response_end_time):
         """Generates a response sequence with the currently-selected generator.
 
         Args:
@@ -245,6 +314,353 @@ class RealTimeMidiInteraction(MidiInteraction):
             response_sequence, response_start_time, response_end_time)
         return adjust_sequence_times(response_sequence, zero_time)
 
+    def _seconds_per_step(self):
+        """Returns the duration of one model step for the selected generator."""
+        steps_per_quarter = getattr(self._sequence_generator, 'steps_per_quarter', None)
+        if steps_per_quarter:
+            return 60.0 / self._qpm / steps_per_quarter
+        return 1.0 / getattr(self._sequence_generator, 'steps_per_second', 100)
+
+    def _generate(self, input_sequence, zero_time, response_start_time,
+                  response_end_time, deadline=None, fallback=None, cancelled=None):
+        """Generates a response sequence, optionally returning by `deadline`.
+
+        Without a deadline or `cancelled` the whole response is generated in one pass.
+        Otherwise it is generated in chunks of `step_batch` steps, each primed with the
+        input and the response so far. Before each chunk the measured per-step cost
+        predicts whether it finishes in time; if not, the response is truncated there and
+        the rest is taken from `fallback`, or the generated part is looped to fill the
+        requested length, since a slightly repetitive response is much better than a late
+        one. A generation worker failing (GenerationServiceError) truncates the response
+        the same way, so one bad request doesn't end the interaction.
+
+        Args:
+          input_sequence: The NoteSequence to use as a generation seed.
+          zero_time: The float time in seconds to treat as the start of the input.
+          response_start_time: The float time in seconds for the start of
+              generation.
+          response_end_time: The float time in seconds for the end of generation.
+          deadline: The optional float time in seconds to return by.
+          fallback: An optional NoteSequence covering the whole response, used
+              for whatever the neural generator doesn't finish by `deadline`.
+          cancelled: An optional threading.Event checked before each chunk.
+
+        Returns:
+          The generated NoteSequence, or None if `cancelled` was set.
+        """
+        if deadline is None and cancelled is None:
+            try:
+                return self._generate_section(
+                    input_sequence, zero_time, response_start_time, response_end_time)
+            except GenerationServiceError as e:
+                logging.warning('Generation failed, using the fallback response: %s', e)
+                if fallback is not None:
+                    return fallback
+                response_sequence = music_pb2.NoteSequence()
+                response_sequence.total_time = response_end_time
+                return response_sequence
+
+        seconds_per_step = self._seconds_per_step()
+        response_sequence = None
+        primer_sequence = music_pb2.NoteSequence()
+        primer_sequence.CopyFrom(input_sequence)
+        chunk_start_time = response_start_time
+        while chunk_start_time < response_end_time - 1e-6:
+            remaining_steps = int(round(
+                (response_end_time - chunk_start_time) / seconds_per_step))
+            steps = max(1, min(self._step_batch, remaining_steps))
+            if cancelled is not None and cancelled.is_set():
+                return None
+            step_cost = self._step_cost
+            budget = None if deadline is None else deadline - time.time()
+            if budget is not None and step_cost is not None and step_cost * steps > budget:
+                if chunk_start_time > response_start_time or fallback is not None:
+                    break
+                # Always generate something, as much as fits in the budget.
+                steps = max(1, min(steps, int(budget / step_cost)))
+            chunk_end_time = min(response_end_time,
+                                 chunk_start_time + steps * seconds_per_step)
+            started = time.time()
+            try:
+                chunk = self._generate_section(
+                    primer_sequence, zero_time, chunk_start_time, chunk_end_time)
+            except GenerationServiceError as e:
+                if deadline is None:
+                    # A speculation, which is given up on and generated again.
+                    raise
+                logging.warning('Generation failed, truncating the response: %s', e)
+                break
+            step_cost = (time.time() - started) / steps
+            with self._stats_lock:
+                self._step_cost = (step_cost if self._step_cost is None
+                                   else 0.8 * self._step_cost + 0.2 * step_cost)
+            if response_sequence is None:
+                response_sequence = chunk
+            else:
+                response_sequence.notes.extend(chunk.notes)
+            primer_sequence.notes.extend(chunk.notes)
+            primer_sequence.total_time = chunk_end_time
+            chunk_start_time = chunk_end_time
+
+        if response_sequence is None:
+            response_sequence = music_pb2.NoteSequence()
+        return self._complete_response(
+            response_sequence, response_start_time, chunk_start_time,
+            response_end_time, deadline=deadline, fallback=fallback)
+
+    def _complete_response(self, response_sequence, response_start_time,
+                           generated_end_time, response_end_time, deadline=None,
+                           fallback=None):
+        """Fills a response generated up to `generated_end_time` to its end.
+
+        The rest is taken from `fallback`, or the generated part is looped, and
+        the deadline stats are updated when there is a `deadline`.
+
+        Returns:
+          The NoteSequence, with `total_time` at `response_end_time`.
+        """
+        response_sequence.total_time = response_end_time
+        truncated = generated_end_time < response_end_time - 1e-6
+        if truncated:
+            if fallback is not None:
+                # Neural notes sustained past the splice would overlap the fallback's.
+                for note in response_sequence.notes:
+                    note.end_time = min(note.end_time, generated_end_time)
+                response_sequence.notes.extend(
+                    note for note in fallback.notes if note.start_time >= generated_end_time)
+            else:
+                response_sequence = self._loop_to_fill(
+                    response_sequence, response_start_time, generated_end_time,
+                    response_end_time)
+        if deadline is None:
+            return response_sequence
+        with self._stats_lock:
+            if truncated:
+                self._deadline_stats['truncated'] += 1
+                if fallback is not None:
+                    self._deadline_stats['fallback'] += 1
+            self._deadline_stats['met' if time.time() <= deadline else 'missed'] += 1
+            deadline_stats = dict(self._deadline_stats)
+            step_cost = self._step_cost
+        logging.info('Generation deadlines: %s (%.2fms/step)', deadline_stats,
+                     1000 * (step_cost or 0.0))
+        return response_sequence
+
+    @staticmethod
+    def _loop_to_fill(sequence, start_time, generated_end_time, end_time):
+        """Repeats the notes between start and generated_end_time until end_time."""
+        period = generated_end_time - start_time
+        if period <= 0:
+            return sequence
+        notes = list(sequence.notes)
+        offset = period
+        while start_time + offset < end_time:
+            for note in notes:
+                if start_time + offset + (note.start_time - start_time) >= end_time:
+                    continue
+                looped = sequence.notes.add()
+                looped.CopyFrom(note)
+                looped.start_time += offset
+                looped.end_time = min(note.end_time + offset, end_time)
+            offset += period
+        return sequence
+
+    def _stream(self, captured_sequence, tick_time):
+        """Feeds the notes captured since the last tick to the streaming generator.
+
+        The stream is restarted whenever the generator or tempo changes, since its
+        state and step grid depend on both.
+
+        Returns:
+          The StreamingMelodyRnn, or None if streaming is off or unsupported.
+        """
+        if not self._streaming:
+            return None
+        generator = self._sequence_generator
+        if (self._streamer is None or self._streamer._generator is not generator or
+                self._streamer.qpm != self._qpm):
+            if self._streamer is None or self._streamer._generator is not generator:
+                if self._streamer is not None:
+                    self._streamer.close()
+                    self._streamer = None
+                try:
+                    self._streamer = StreamingMelodyRnn(generator, self._qpm, tick_time)
+                except ValueError:
+                    logging.warning(
+                        "Generator '%s' does not support streaming.", generator.details.id)
+                    self._streaming = False
+                    return None
+            else:
+                self._streamer.reset(self._qpm, tick_time)
+        self._streamer.feed(captured_sequence.notes, tick_time)
+        return self._streamer
+
+    def _generate_streaming(self, streamer, response_start_time, response_duration,
+                            deadline=None, fallback=None):
+        """Samples a response from the streaming generator's current state.
+
+        Sampling stops at `deadline`, and the rest of the response is filled as
+        `_generate` fills a truncated one.
+
+        Returns:
+          The generated NoteSequence, moved to `response_start_time`.
+        """
+        num_steps = int(round(response_duration / streamer.seconds_per_step))
+        response_sequence = streamer.generate(
+            num_steps, temperature=self._temperature, deadline=deadline)
+        stream_start_time = (streamer.origin_time +
+                             streamer.position * streamer.seconds_per_step)
+        generated_steps = int(round(
+            (response_sequence.total_time - stream_start_time) / streamer.seconds_per_step))
+        response_end_time = response_start_time + response_duration
+        generated_end_time = (
+            response_end_time if generated_steps >= num_steps else
+            response_start_time + generated_steps * streamer.seconds_per_step)
+        response_sequence = adjust_sequence_times(
+            response_sequence, response_start_time - stream_start_time)
+        response_sequence = magenta.music.trim_note_sequence(
+            response_sequence, response_start_time, response_end_time)
+        return self._complete_response(
+            response_sequence, response_start_time, generated_end_time,
+            response_end_time, deadline=deadline, fallback=fallback)
+
+    def _learn(self, num_new_notes):
+        """Trains the fallback n-gram model on notes newly added to the context."""
+        if not num_new_notes:
+            return
+        seconds_per_step = self._seconds_per_step()
+        # The context updates the end of each entry while its note sounds.
+        for entry in self._context.recent_notes()[-num_new_notes:]:
+            self._markov.observe(entry, seconds_per_step)
+
+    def _track_tempo(self, num_new_notes, tick_time):
+        """Feeds new onsets to the tempo tracker and moves the metronome to it.
+
+        A qpm set by the tempo control restarts the tracking, so the metronome
+        keeps it until the performer's onsets agree on another tempo.
+        """
+        if self._metronome is not None and self._metronome.qpm != self._qpm:
+            self._metronome.update_metronome(self._qpm)
+            self._tempo_tracker.reset()
+        if num_new_notes:
+            self._tempo_tracker.add_onsets(
+                entry[START] for entry in self._context.recent_notes()[-num_new_notes:])
+        if (self._follow_tempo and self._metronome is not None and
+                self._metronome.follow(self._tempo_tracker, now=tick_time)):
+            logging.info('Following tempo: %.1f qpm', self._metronome.qpm)
+            self._qpm = self._metronome.qpm
+
+    def _fallback_response(self, input_sequence, response_start_time,
+                           response_end_time):
+        """Returns the fast fallback response, or None if there is none."""
+        if not self._fallback:
+            return None
+        seconds_per_step = self._seconds_per_step()
+        if 'drum' in self._sequence_generator.details.id:
+            bar_start_time = response_start_time - BAR_STEPS * seconds_per_step
+            onsets = sum(1 for note in input_sequence.notes
+                         if note.start_time >= bar_start_time)
+            return self._drum_patterns.generate(
+                response_start_time, response_end_time, seconds_per_step, self._qpm,
+                onsets_per_bar=onsets)
+        response_sequence = self._markov.generate(
+            response_start_time, response_end_time, seconds_per_step, self._qpm)
+        # Nothing learned yet, let the neural generator answer however late.
+        return response_sequence if response_sequence.notes else None
+
+    def _capture_fingerprint(self, call_start_time, last_end_time):
+        """Identifies the captured input and generation settings a response depends on."""
+        return (self._context.note_count, last_end_time, call_start_time,
+                self._temperature, self._sequence_generator.details.id)
+
+    def _primer(self, call_start_time, tick_time):
+        """Returns the bounded primer and its zero time from the context window."""
+        zero_time = max(call_start_time, self._context.recent_start(tick_time))
+        return self._context.primer(zero_time, tick_time, qpm=self._qpm), zero_time
+
+    def _response_duration(self, tick_duration, capture_duration):
+        """Duration of the response from the response ticks control, or the capture duration."""
+        num_ticks = self._midi_hub.control_value(
+            self._response_ticks_control_number)
+        if num_ticks:
+            return num_ticks * tick_duration
+        return capture_duration
+
+    def _speculate(self, speculation, input_sequence, zero_time, fingerprint,
+                   tick_time, response_duration):
+        """Starts generating a response as if the call ended at this tick.
+
+        If the next tick is silent the call ends there, with the capture shifted forward
+        by a tick, so the response generated now only needs the same shift to be used.
+        Any previous speculation is cancelled, since new notes have invalidated it.
+
+        Returns:
+          The new _Speculation.
+        """
+        self._cancel_speculation(speculation)
+        cancelled = threading.Event()
+        future = self._speculation_executor.submit(
+            self._generate, input_sequence, zero_time, tick_time,
+            tick_time + response_duration, cancelled=cancelled)
+        return _Speculation(future, cancelled, fingerprint, tick_time, response_duration)
+
+    def _cancel_speculation(self, speculation):
+        """Cancels a pending speculation, or stops a running one at its next chunk."""
+        if speculation is None or speculation.future.done():
+            return
+        speculation.cancelled.set()
+        speculation.future.cancel()
+        self._speculation_stats['cancelled'] += 1
+
+    def _take_speculation(self, speculation, fingerprint, response_start_time,
+                          response_duration, deadline=None, fallback=None):
+        """Returns the speculative response for this call, or None if it is stale.
+
+        The speculative response is moved to `response_start_time`, trimmed if it is
+        longer than `response_duration`, and cheaply extended by generating only the
+        missing tail if it is shorter. A speculation still running at `deadline` is
+        given up on.
+        """
+        if speculation is None or speculation.fingerprint != fingerprint:
+            self._cancel_speculation(speculation)
+            self._speculation_stats['misses'] += 1
+            return None
+        timeout = None if deadline is None else max(0.0, deadline - time.time())
+        try:
+            response_sequence = speculation.future.result(timeout=timeout)
+        except TimeoutError:
+            logging.info('Speculative response not ready by the deadline.')
+            # Free the worker for the generation that replaces it.
+            self._cancel_speculation(speculation)
+            self._speculation_stats['misses'] += 1
+            return None
+        except Exception:  # pylint: disable=broad-except
+            logging.exception('Speculative generation failed.')
+            self._cancel_speculation(speculation)
+            self._speculation_stats['misses'] += 1
+            return None
+        if response_sequence is None:
+            self._speculation_stats['misses'] += 1
+            return None
+        self._speculation_stats['hits'] += 1
+        response_sequence = adjust_sequence_times(
+            response_sequence,
+            response_start_time - speculation.response_start_time)
+        response_end_time = response_start_time + response_duration
+        speculation_end_time = response_start_time + speculation.response_duration
+        if speculation_end_time > response_end_time:
+            response_sequence = magenta.music.trim_note_sequence(
+                response_sequence, response_start_time, response_end_time)
+        elif speculation_end_time < response_end_time:
+            self._speculation_stats['extended'] += 1
+            extension = self._generate(
+                response_sequence, response_start_time, speculation_end_time,
+                response_end_time, deadline=deadline, fallback=fallback)
+            response_sequence.notes.extend(extension.notes)
+            response_sequence.total_time = response_end_time
+        logging.info('Using speculative response. %s', self._speculation_stats)
+        return response_sequence
+
     def run(self):
         """The main loop for a real-time call and response interaction.
 
@@ -263,8 +679,10 @@ class RealTimeMidiInteraction(MidiInteraction):
         self._captor = self._midi_hub.start_capture(self._qpm, start_time)
 
         if not self._clock_signal and self._metronome_channel is not None:
-            self._midi_hub.start_metronome(
-                self._qpm, start_time, channel=self._metronome_channel)
+            self._metronome = SynMetronome(
+                self._qpm, start_time, None, self._metronome_channel,
+                midi_hub=self._midi_hub)
+            self._metronome.start_metronome()
 
         # Set callback for end call signal.
         if self._end_call_signal is not None:
@@ -283,6 +701,10 @@ class RealTimeMidiInteraction(MidiInteraction):
         # Keep track of the duration of a listen state.
         listen_ticks = 0
 
+        # Start of the current call. The captor may be trimmed to the context
+        # window after it, so its start time can be later.
+        call_start_time = self._captor.start_time
+
         # Start with an empty response sequence.
         response_sequence = music_pb2.NoteSequence()
         response_start_time = 0
@@ -290,6 +712,9 @@ class RealTimeMidiInteraction(MidiInteraction):
         player = self._midi_hub.start_playback(
             response_sequence, allow_updates=True)
 
+        # Response being generated in the background while listening.
+        speculation = None
+
         # Enter loop at each clock tick.
         for captured_sequence in self._captor.iterate(signal=self._clock_signal,
                                                       period=self._tick_duration):
@@ -302,20 +727,19 @@ class RealTimeMidiInteraction(MidiInteraction):
 
             tick_time = captured_sequence.total_time
 
+            tick_duration = tick_time - last_tick_time
+            num_new_notes = self._context.ingest(captured_sequence.notes, now=tick_time)
+            self._learn(num_new_notes)
+
             # Set to current QPM, since it might have changed.
-            if not self._clock_signal and self._metronome_channel is not None:
-                self._midi_hub.start_metronome(
-                    self._qpm, tick_time, channel=self._metronome_channel)
+            self._track_tempo(num_new_notes, tick_time)
             captured_sequence.tempos[0].qpm = self._qpm
-
-            tick_duration = tick_time - last_tick_time
-            if captured_sequence.notes:
-                last_end_time = max(note.end_time for note in captured_sequence.notes)
-            else:
-                last_end_time = 0.0
+            last_end_time = self._context.last_end_time
 
             # True iff there was no input captured during the last tick.
             silent_tick = last_end_time <= last_tick_time
+            streamer = self._stream(captured_sequence, tick_time)
+            fingerprint = self._capture_fingerprint(call_start_time, last_end_time)
 
             if not silent_tick:
                 listen_ticks += 1
@@ -326,8 +750,11 @@ class RealTimeMidiInteraction(MidiInteraction):
                     self._update_state(self.State.IDLE)
                 if self._captor.start_time < tick_time:
                     self._captor.start_time = tick_time
+                call_start_time = self._captor.start_time
                 self._end_call.clear()
                 listen_ticks = 0
+                self._cancel_speculation(speculation)
+                speculation = None
             elif (self._end_call.is_set() or
                   silent_tick or
                   listen_ticks >= self._max_listen_ticks):
@@ -337,35 +764,50 @@ class RealTimeMidiInteraction(MidiInteraction):
                         listen_ticks,
                         self._min_listen_ticks)
                     self._captor.start_time = tick_time
+                    call_start_time = tick_time
                 else:
                     # Create response and start playback.
                     self._update_state(self.State.RESPONDING)
 
-                    capture_start_time = self._captor.start_time
+                    capture_start_time = call_start_time
+                    input_sequence, zero_time = self._primer(
+                        capture_start_time, tick_time)
 
                     if silent_tick:
                         # Move the sequence forward one tick in time.
-                        captured_sequence = adjust_sequence_times(
-                            captured_sequence, tick_duration)
-                        captured_sequence.total_time = tick_time
+                        input_sequence = adjust_sequence_times(
+                            input_sequence, tick_duration)
+                        input_sequence.total_time = tick_time
                         capture_start_time += tick_duration
+                        zero_time += tick_duration
 
                     # Compute duration of response.
-                    num_ticks = self._midi_hub.control_value(
-                        self._response_ticks_control_number)
-
-                    if num_ticks:
-                        response_duration = num_ticks * tick_duration
-                    else:
-                        # Use capture duration.
-                        response_duration = tick_time - capture_start_time
+                    response_duration = self._response_duration(
+                        tick_duration, tick_time - capture_start_time)
 
                     response_start_time = tick_time
-                    response_sequence = self._generate(
-                        captured_sequence,
-                        capture_start_time,
-                        response_start_time,
+                    # Responses later than this get pushed back a whole tick.
+                    deadline = response_start_time + tick_duration / 4
+                    fallback = self._fallback_response(
+                        input_sequence, response_start_time,
                         response_start_time + response_duration)
+                    if streamer is not None:
+                        response_sequence = self._generate_streaming(
+                            streamer, response_start_time, response_duration,
+                            deadline=deadline, fallback=fallback)
+                    else:
+                        response_sequence = self._take_speculation(
+                            speculation, fingerprint, response_start_time,
+                            response_duration, deadline=deadline, fallback=fallback)
+                    speculation = None
+                    if response_sequence is None:
+                        response_sequence = self._generate(
+                            input_sequence,
+                            zero_time,
+                            response_start_time,
+                            response_start_time + response_duration,
+                            deadline=deadline,
+                            fallback=fallback)
 
                     # If it took too long to generate, push response to next tick.
                     if (time.time() - response_start_time) >= tick_duration / 4:
@@ -387,13 +829,26 @@ class RealTimeMidiInteraction(MidiInteraction):
                         self._captor.start_time = response_start_time
                     else:
                         self._captor.start_time = response_start_time + response_duration
+                    call_start_time = self._captor.start_time
 
                 # Clear end signal and reset listen_ticks.
                 self._end_call.clear()
                 listen_ticks = 0
             else:
-                # Continue listening.
+                # Continue listening, and start generating in case the call ends now.
                 self._update_state(self.State.LISTENING)
+                if streamer is None:
+                    input_sequence, zero_time = self._primer(call_start_time, tick_time)
+                    speculation = self._speculate(
+                        speculation, input_sequence, zero_time, fingerprint, tick_time,
+                        self._response_duration(tick_duration, tick_time - call_start_time))
+
+                # Older notes live on in the context summaries, keep only the recent
+                # window (and any note still sounding) in the captor.
+                trim_time = min(self._context.recent_start(tick_time),
+                                self._context.last_onset)
+                if self._captor.start_time < trim_time:
+                    self._captor.start_time = trim_time
 
             # Potentially loop or mutate previous response.
             if self._mutate.is_set() and not response_sequence.notes:
@@ -421,10 +876,15 @@ class RealTimeMidiInteraction(MidiInteraction):
 
             last_tick_time = tick_time
 
+        self._cancel_speculation(speculation)
+        if self._streamer is not None:
+            self._streamer.close()
+            self._streamer = None
         player.stop()
 
     def stop(self):
         self._stop_signal.set()
+        self._speculation_executor.shutdown(wait=False)
         self._captor.stop()
         self._midi_hub.stop_metronome()
         super(RealTimeMidiInteraction, self).stop()
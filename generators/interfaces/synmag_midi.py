@@ -11,24 +11,16 @@ from __future__ import division
 from __future__ import print_function
 
 import functools
+import importlib
 import re
 import threading
 import time
 import os
 from absl import logging
 
-
-import magenta
-from magenta.interfaces.midi import midi_hub
-from magenta.interfaces.midi import midi_interaction
-from magenta.models.drums_rnn import drums_rnn_sequence_generator
-from magenta.models.melody_rnn import melody_rnn_sequence_generator
-from magenta.models.performance_rnn import performance_sequence_generator
-from magenta.models.pianoroll_rnn_nade import pianoroll_rnn_nade_sequence_generator
-from magenta.models.polyphony_rnn import polyphony_sequence_generator
-import tensorflow as tf
-
-from generators.interfaces.real_time_midi_interaction import RealTimeMidiInteraction
+# magenta and TensorFlow are imported where they are first needed, importing this module stays cheap.
+from generators.generation_service import GeneratorProxy, GenerationServiceError
+from generators.model_pool import ModelPool
 
 """
 change log:
@@ -63,6 +55,13 @@ default_midi_config = {
     "learn_controls": False,
     "log": "WARN",
     "real_time_midi": False,
+    "streaming": False,
+    "fallback": True,
+    "follow_tempo": True,
+    "backend": "tensorflow",
+    "generation_process": False,
+    "model_pool_max_mb": None,
+    "warmup": True,
 }
 
 _CONTROL_FLAGS = [
@@ -80,12 +79,56 @@ _CONTROL_FLAGS = [
     "state_control_number",
 ]
 
-# A map from a string generator name to its class.
-_GENERATOR_MAP = melody_rnn_sequence_generator.get_generator_map()
-_GENERATOR_MAP.update(drums_rnn_sequence_generator.get_generator_map())
-_GENERATOR_MAP.update(performance_sequence_generator.get_generator_map())
-_GENERATOR_MAP.update(pianoroll_rnn_nade_sequence_generator.get_generator_map())
-_GENERATOR_MAP.update(polyphony_sequence_generator.get_generator_map())
+# Generator families and the bundle ids they provide. A family is only imported when a bundle
+# with one of its ids is loaded.
+_GENERATOR_FAMILIES = {
+    "magenta.models.melody_rnn.melody_rnn_sequence_generator": (
+        "basic_rnn", "mono_rnn", "lookback_rnn", "attention_rnn"),
+    "magenta.models.drums_rnn.drums_rnn_sequence_generator": (
+        "one_drum", "drum_kit"),
+    "magenta.models.performance_rnn.performance_sequence_generator": (
+        "performance", "performance_with_dynamics", "performance_with_dynamics_and_modulo_encoding",
+        "density_conditioned_performance_with_dynamics", "pitch_conditioned_performance_with_dynamics",
+        "multiconditioned_performance_with_dynamics", "optional_multiconditioned_performance_with_dynamics"),
+    "magenta.models.pianoroll_rnn_nade.pianoroll_rnn_nade_sequence_generator": (
+        "rnn-nade", "rnn-nade_attn"),
+    "magenta.models.polyphony_rnn.polyphony_sequence_generator": (
+        "polyphony",),
+}
+
+# Warm generators shared by every runner in this process, one pool per backend.
+_MODEL_POOLS = {}
+_MODEL_POOLS_LOCK = threading.Lock()
+
+
+def get_model_pool(midi_config):
+    """Returns the process wide ModelPool for the config's backend."""
+    with _MODEL_POOLS_LOCK:
+        backend = midi_config["backend"]
+        if backend not in _MODEL_POOLS:
+            _MODEL_POOLS[backend] = ModelPool(
+                backend=backend,
+                max_memory_mb=midi_config["model_pool_max_mb"],
+                warmup=midi_config["warmup"])
+        return _MODEL_POOLS[backend]
+
+
+# A map from a string generator name to its class, filled as families are imported.
+_GENERATOR_MAP = {}
+_GENERATOR_MAP_LOCK = threading.Lock()
+
+
+def _generator_factory(generator_id):
+    """Returns the generator class for a bundle id, or None if no family provides it."""
+    with _GENERATOR_MAP_LOCK:
+        if generator_id not in _GENERATOR_MAP:
+            families = [f for f, ids in _GENERATOR_FAMILIES.items() if generator_id in ids]
+            # An id missing from the table may come from a newer magenta, so try every family.
+            for family in families or list(_GENERATOR_FAMILIES):
+                _GENERATOR_MAP.update(importlib.import_module(family).get_generator_map())
+                if generator_id in _GENERATOR_MAP:
+                    break
+        return _GENERATOR_MAP.get(generator_id)
 
 
 class CCMapper(object):
@@ -131,6 +174,8 @@ class CCMapper(object):
 
     def update_map(self):
         """Enters a loop that receives user input to set signal controls."""
+        from magenta.interfaces.midi import midi_hub
+
         while True:
             print("")
             self._print_instructions()
@@ -157,6 +202,8 @@ class CCMapper(object):
 def _validate_midi_config(midi_config):
     """Returns True if flag values are valid or prints error and returns False."""
     if midi_config["list_ports"]:
+        from magenta.interfaces.midi import midi_hub
+
         print("Input ports: '%s'" % ("', '".join(midi_hub.get_available_input_ports())))
         print(
             "Ouput ports: '%s'" % ("', '".join(midi_hub.get_available_output_ports()))
@@ -181,23 +228,48 @@ def _validate_midi_config(midi_config):
     return True
 
 
-def _load_generator_from_bundle_file(bundle_file):
-    """Returns initialized generator from bundle file path or None if fails."""
+def _read_bundle_file(bundle_file):
+    """Returns the parsed bundle from bundle file path or None if fails."""
+    from magenta.music import sequence_generator_bundle
+
     try:
-        bundle = magenta.music.sequence_generator_bundle.read_bundle_file(bundle_file)
-    except magenta.music.sequence_generator_bundle.GeneratorBundleParseError:
-        print("Failed to parse bundle file: %s" % default_midi_config["bundle_file"])
+        return sequence_generator_bundle.read_bundle_file(bundle_file)
+    except sequence_generator_bundle.GeneratorBundleParseError:
+        print("Failed to parse bundle file: %s" % bundle_file)
         return None
 
+
+def _load_generator_from_bundle_file(bundle_file, backend="tensorflow"):
+    """Returns initialized generator from bundle file path or None if fails.
+
+    backend: "tensorflow", or "numpy" to run melody_rnn bundles without a TF session
+    """
+    bundle = _read_bundle_file(bundle_file)
+    if bundle is None:
+        return None
+    return _load_generator_from_bundle(bundle, bundle_file, backend)
+
+
+def _load_generator_from_bundle(bundle, bundle_file, backend="tensorflow"):
+    """Returns initialized generator from a parsed bundle or None if fails."""
     generator_id = bundle.generator_details.id
-    if generator_id not in _GENERATOR_MAP:
+    generator_factory = None
+    if backend == "numpy":
+        from generators.models import numpy_rnn
+
+        generator_factory = numpy_rnn.get_generator_map().get(generator_id)
+        if generator_factory is None:
+            print("The numpy backend does not support '%s', using tensorflow." % generator_id)
+    if generator_factory is None:
+        generator_factory = _generator_factory(generator_id)
+    if generator_factory is None:
         print(
             "Unrecognized SequenceGenerator ID '%s' in bundle file: %s"
-            % (generator_id, default_midi_config["bundle_file"])
+            % (generator_id, bundle_file)
         )
         return None
 
-    generator = _GENERATOR_MAP[generator_id](checkpoint=None, bundle=bundle)
+    generator = generator_factory(checkpoint=None, bundle=bundle)
     generator.initialize()
     print(
         "Loaded '%s' generator bundle from file '%s'."
@@ -241,6 +313,8 @@ def get_real_time_midi_interaction(
     metronome_channel,
     control_map,
 ):
+    from generators.interfaces.real_time_midi_interaction import RealTimeMidiInteraction
+
     return RealTimeMidiInteraction(
         hub,
         generators,
@@ -260,6 +334,9 @@ def get_real_time_midi_interaction(
         temperature_control_number=control_map["temperature"],
         loop_control_number=control_map["loop"],
         state_control_number=control_map["state"],
+        streaming=default_midi_config["streaming"],
+        fallback=default_midi_config["fallback"],
+        follow_tempo=default_midi_config["follow_tempo"],
     )
 
 
@@ -274,6 +351,8 @@ def get_call_and_response_midi_interaction(
     metronome_channel,
     control_map,
 ):
+    from magenta.interfaces.midi import midi_interaction
+
     return midi_interaction.CallAndResponseMidiInteraction(
         hub,
         generators,
@@ -312,9 +391,10 @@ def get_drum_mag_path():
     return os.path.join(os.environ['SYNOSC_PATH'], "data", "mags", "drum_kit_rnn.mag")
 
 
-def run_default_drums():
+def run_default_drums(generation_process=False):
     """
     replaces the RUN_DEMO.sh script from ai-ableton-jam
+    generation_process: generate in a dedicated worker process
     """
     drum_mag_path = get_drum_mag_path()
     default_drums_default_midi_config = {
@@ -339,7 +419,8 @@ def run_default_drums():
         "bundle_files": drum_mag_path,
         "playback_offset": -0.035,
         "playback_channel": 2,
-        "log": "INFO"
+        "log": "INFO",
+        "generation_process": generation_process,
     }
 
     drums_config = default_midi_config.copy()
@@ -347,9 +428,10 @@ def run_default_drums():
     runner(drums_config)
 
 
-def run_default_piano():
+def run_default_piano(generation_process=False):
     """
     replaces the RUN_DEMO.sh script from ai-ableton-jam
+    generation_process: generate in a dedicated worker process
     """
     mag_bundle = get_piano_mag_paths()
     default_piano_default_midi_config = {
@@ -374,7 +456,8 @@ def run_default_piano():
             "mutate_control_number": 12,
             "bundle_files": mag_bundle,
             "playback_offset": -0.035,
-            "playback_channel": "1&"
+            "playback_channel": "1&",
+            "generation_process": generation_process,
     }
 
     piano_config = default_midi_config.copy()
@@ -383,17 +466,30 @@ def run_default_piano():
 
 
 def runner(midi_config):
+    from magenta.interfaces.midi import midi_hub
+
     logging.set_verbosity(midi_config['log'])
 
     if not _validate_midi_config(midi_config):
         return
 
-    # Load generators.
+    # Load generators, optionally each in its own worker process.
     generators = []
     for bundle_file in midi_config['bundle_files'].split(","):
-        generators.append(_load_generator_from_bundle_file(bundle_file))
-        if generators[-1] is None:
-            return
+        if midi_config["generation_process"]:
+            try:
+                generators.append(GeneratorProxy.start(bundle_file, midi_config["backend"]))
+            except GenerationServiceError as e:
+                print("Failed to start generation worker: %s" % e)
+                _close_generators(generators)
+                return
+        else:
+            # Bundles are parsed, loaded and warmed up once per process, later runners reuse them.
+            try:
+                generators.append(get_model_pool(midi_config).preload([bundle_file]).proxy(bundle_file))
+            except ValueError as e:
+                print(e)
+                return
 
     # Initialize MidiHub.
     hub = midi_hub.MidiHub(
@@ -461,10 +557,19 @@ def runner(midi_config):
             time.sleep(1)
     except KeyboardInterrupt:
         interaction.stop()
+    finally:
+        _close_generators(generators)
 
     print("Interaction stopped.")
 
 
+def _close_generators(generators):
+    """Stops the worker processes of generator proxies."""
+    for generator in generators:
+        if isinstance(generator, GeneratorProxy):
+            generator.close()
+
+
 def real_time_midi():
     pass
 
@@ -479,9 +584,10 @@ def console_entry_point():
 
     :return:
     """
-    thread1 = threading.Thread(target=run_default_drums)
+    # generation runs in worker processes, so inference doesn't hold the GIL from the MIDI threads
+    thread1 = threading.Thread(target=run_default_drums, kwargs={"generation_process": True})
     thread1.start()
-    thread2 = threading.Thread(target=run_default_piano)
+    thread2 = threading.Thread(target=run_default_piano, kwargs={"generation_process": True})
     thread2.start()
 
 
@@ -8,12 +8,16 @@ class SynMetronome:
     context manager for holding Magenta processes
     """
 
-    def __init__(self, qpm, start_time, signals, channel):
+    def __init__(self, qpm, start_time, signals, channel, midi_hub=None):
+        """
+        midi_hub: hub whose metronome is driven, a mock hub when None
+        """
         self.qpm = qpm
         self.start_time = start_time
         self.signals = signals
         self.channel = channel
-        self.initialize_metronome_mock(qpm, self.start_time, signals=self.signals, channel=self.channel)
+        self.initialize_metronome_mock(qpm, self.start_time, signals=self.signals, channel=self.channel,
+                                       midi_hub=midi_hub)
 
     def __enter__(self):
         self.start_time = time.time()
@@ -26,16 +30,17 @@ class SynMetronome:
     def get_qpm(self):
         return self.midi_hub._metronome.qpm
 
-    def initialize_metronome_mock(self, qpm, start_time, signals=None, channel=None):
+    def initialize_metronome_mock(self, qpm, start_time, signals=None, channel=None, midi_hub=None):
         """
         Synchronized with Ableton for tempo alignment
         :param qpm:
         :param start_time:
         :param signals:
         :param channel:
+        :param midi_hub:
         :return:
         """
-        self.midi_hub = get_midi_hub_mock()
+        self.midi_hub = midi_hub or get_midi_hub_mock()
         if self.midi_hub._metronome is not None and self.midi_hub._metronome.is_alive():
             self.midi_hub._metronome.update(
                 qpm, start_time, signals=signals, channel=channel)
@@ -43,8 +48,48 @@ class SynMetronome:
             self.midi_hub._metronome = Metronome(
                 self.midi_hub._outport, qpm, start_time, signals=signals, channel=channel)
 
+    def beat_duration(self):
+        return 60.0 / self.qpm
+
+    def next_beat_time(self, now=None, subdivision=1):
+        """
+        system time of the next beat (or 1/subdivision of a beat) at or after now,
+        used to timetag OSC bundles so receivers play events on the metronome grid
+        """
+        now = time.time() if now is None else now
+        grid = self.beat_duration() / subdivision
+        beats = max(0, -(-(now - self.start_time) // grid))
+        return self.start_time + beats * grid
+
     def start_metronome(self):
-        self.midi_hub.start_metronome(start_time=self.start_time, qpm=self.qpm)
+        self.midi_hub.start_metronome(self.qpm, self.start_time, signals=self.signals, channel=self.channel)
 
-    def update_metronome(self, qpm):
-        self.midi_hub._metronome.update(qpm=qpm, start_time=self.start_time)
\ No newline at end of file
+    def update_metronome(self, qpm, start_time=None):
+        self.qpm = qpm
+        if start_time is not None:
+            self.start_time = start_time
+        # update resets the signals and channel unless they are passed again
+        self.midi_hub._metronome.update(qpm, self.start_time, signals=self.signals, channel=self.channel)
+
+    def follow(self, tempo_tracker, now=None, min_confidence=0.2, tolerance=0.5, phase_tolerance=0.02):
+        """
+        follow the performer: move to the tracker's tempo and beat phase when it is confident enough
+        and the tempo moved by more than tolerance qpm, or the tracked beats drifted off the metronome's
+        by more than phase_tolerance seconds, so most ticks don't touch the metronome thread
+        :return: (bool) whether the metronome was updated
+        """
+        now = time.time() if now is None else now
+        qpm, beat_time, confidence = tempo_tracker.estimate(now)
+        if beat_time is None or confidence < min_confidence:
+            return False
+        if abs(qpm - self.qpm) <= tolerance and self.phase_error(beat_time) <= phase_tolerance:
+            return False
+        self.update_metronome(qpm, start_time=beat_time)
+        return True
+
+    def phase_error(self, beat_time):
+        """
+        :return: (float) seconds between beat_time and the nearest metronome beat
+        """
+        offset = (beat_time - self.start_time) % self.beat_duration()
+        return min(offset, self.beat_duration() - offset)
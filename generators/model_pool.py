@@ -0,0 +1,236 @@
+"""
+pool of warm sequence generators
+
+runner used to parse every .mag and initialize its generator each time it started, and the first
+generate() of each model still paid for graph building. The pool:
+
+    parses each bundle file once
+    keeps initialized generators warm, after a dummy warmup generation
+    hands out PooledGenerator stand ins, so switching with generator_select_control_number
+        picks an already loaded model instead of reloading
+    evicts (and closes) the least recently used idle models when the estimated memory use passes
+        max_memory_mb, models in use between acquire() and release() are never evicted
+
+Model memory is estimated from the bundle's checkpoint size, which is what dominates a loaded model.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+MEGABYTE = 1024 * 1024
+# loaded models hold the weights plus the TF graph and session around them
+CHECKPOINT_MEMORY_FACTOR = 2.0
+
+
+def warmup(generator, seconds=2.0, qpm=120.0):
+    """
+    run a short generation from an empty primer, so graph building isn't paid by the first real call
+    """
+    from magenta.protobuf import generator_pb2
+    from magenta.protobuf import music_pb2
+
+    input_sequence = music_pb2.NoteSequence()
+    input_sequence.tempos.add(qpm=qpm)
+    generator_options = generator_pb2.GeneratorOptions()
+    generator_options.generate_sections.add(start_time=0, end_time=seconds)
+    generator.generate(input_sequence, generator_options)
+
+
+class _PoolEntry:
+
+    def __init__(self, generator, memory):
+        self.generator = generator
+        self.memory = memory
+        self.active = 0
+
+
+class ModelPool:
+
+    def __init__(self, backend="tensorflow", max_memory_mb=None, warmup=True):
+        self.backend = backend
+        self.max_memory = max_memory_mb * MEGABYTE if max_memory_mb else None
+        self._warmup = warmup
+        self._bundles = {}
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self._loading = {}
+        self.stats = {"hits": 0, "loads": 0, "evictions": 0, "load_time": 0.0}
+
+    def bundle(self, bundle_file):
+        """
+        :return: the parsed bundle, read from disk only the first time
+        """
+        from generators.interfaces.synmag_midi import _read_bundle_file
+
+        with self._lock:
+            if bundle_file not in self._bundles:
+                bundle = _read_bundle_file(bundle_file)
+                if bundle is None:
+                    raise ValueError(f"could not parse generator bundle: {bundle_file}")
+                self._bundles[bundle_file] = bundle
+            return self._bundles[bundle_file]
+
+    @staticmethod
+    def estimate_memory(bundle):
+        return CHECKPOINT_MEMORY_FACTOR * sum(len(c) for c in bundle.checkpoint_file)
+
+    def get(self, bundle_file):
+        """
+        :return: the initialized, warm generator for the bundle, loading it if needed
+        """
+        with self._lock:
+            entry = self._entries.get(bundle_file)
+            if entry is not None:
+                self._entries.move_to_end(bundle_file)
+                self.stats["hits"] += 1
+                return entry.generator
+            # one load per bundle, concurrent callers wait for it
+            loading = self._loading.get(bundle_file)
+            if loading is None:
+                loading = self._loading[bundle_file] = threading.Event()
+                owner = True
+            else:
+                owner = False
+        if not owner:
+            loading.wait()
+            return self.get(bundle_file)
+        try:
+            return self._load(bundle_file)
+        finally:
+            with self._lock:
+                del self._loading[bundle_file]
+            loading.set()
+
+    def _load(self, bundle_file):
+        from generators.interfaces.synmag_midi import _load_generator_from_bundle
+
+        started = time.time()
+        bundle = self.bundle(bundle_file)
+        generator = _load_generator_from_bundle(bundle, bundle_file, self.backend)
+        if generator is None:
+            raise ValueError(f"could not load generator bundle: {bundle_file}")
+        if self._warmup:
+            try:
+                warmup(generator)
+            except Exception:
+                logger.warning("warmup generation failed for %s", bundle_file, exc_info=True)
+        with self._lock:
+            self._entries[bundle_file] = _PoolEntry(generator, self.estimate_memory(bundle))
+            self.stats["loads"] += 1
+            self.stats["load_time"] += time.time() - started
+            self._evict()
+        logger.info("loaded %s in %.2fs, pool: %s", bundle_file, time.time() - started, self.counters())
+        return generator
+
+    def memory(self):
+        with self._lock:
+            return sum(entry.memory for entry in self._entries.values())
+
+    def _evict(self):
+        """drop least recently used idle models until under the memory cap, the newest model always stays"""
+        if self.max_memory is None:
+            return
+        for bundle_file in list(self._entries)[:-1]:
+            if self.memory() <= self.max_memory:
+                return
+            if self._entries[bundle_file].active:
+                continue
+            entry = self._entries.pop(bundle_file)
+            self.stats["evictions"] += 1
+            try:
+                entry.generator.close()
+            except Exception:
+                logger.warning("closing evicted model %s failed", bundle_file, exc_info=True)
+            logger.info("evicted idle model %s", bundle_file)
+
+    def loaded(self, bundle_file):
+        """
+        :return: the generator if the bundle is loaded, else None, without loading it
+        """
+        with self._lock:
+            entry = self._entries.get(bundle_file)
+            return None if entry is None else entry.generator
+
+    def acquire(self, bundle_file):
+        """
+        :return: the generator, protected from eviction until release()
+        """
+        while True:
+            generator = self.get(bundle_file)
+            with self._lock:
+                entry = self._entries.get(bundle_file)
+                if entry is not None and entry.generator is generator:
+                    entry.active += 1
+                    self._entries.move_to_end(bundle_file)
+                    return generator
+
+    def release(self, bundle_file):
+        with self._lock:
+            entry = self._entries.get(bundle_file)
+            if entry is not None:
+                entry.active = max(0, entry.active - 1)
+                self._evict()
+
+    def preload(self, bundle_files):
+        """
+        load and warm up bundles ahead of use, as far as the memory cap allows
+        """
+        for bundle_file in bundle_files:
+            self.get(bundle_file)
+        return self
+
+    def proxy(self, bundle_file):
+        return PooledGenerator(self, bundle_file)
+
+    def counters(self):
+        with self._lock:
+            return dict(self.stats, models=len(self._entries), memory_mb=self.memory() / MEGABYTE)
+
+
+class PooledGenerator:
+    """
+    SequenceGenerator stand in that generates with the pool's warm generator for its bundle
+
+    Anything that keeps using the model between calls (e.g. StreamingMelodyRnn driving its session)
+    must hold it with acquire() / release(), the private _model etc. aren't handed out otherwise
+    since eviction closes them.
+    """
+
+    def __init__(self, pool, bundle_file):
+        self.pool = pool
+        self.bundle_file = bundle_file
+        bundle = pool.bundle(bundle_file)
+        self.details = bundle.generator_details
+        self.bundle_details = bundle.bundle_details
+
+    def initialize(self):
+        self.pool.get(self.bundle_file)
+
+    def generate(self, input_sequence, generator_options):
+        generator = self.pool.acquire(self.bundle_file)
+        try:
+            return generator.generate(input_sequence, generator_options)
+        finally:
+            self.pool.release(self.bundle_file)
+
+    def acquire(self):
+        """
+        :return: the pooled generator, kept loaded until release()
+        """
+        return self.pool.acquire(self.bundle_file)
+
+    def release(self):
+        self.pool.release(self.bundle_file)
+
+    def __getattr__(self, name):
+        # steps_per_quarter, ... come from the pooled generator
+        if name in ("pool", "bundle_file") or name.startswith("_"):
+            raise AttributeError(f"{name}: acquire() the pooled generator to use its internals")
+        generator = self.pool.loaded(self.bundle_file)
+        if generator is None:
+            logger.warning("reloading evicted model %s to read %s", self.bundle_file, name)
+            generator = self.pool.get(self.bundle_file)
+        return getattr(generator, name)
@@ -1,15 +1,164 @@
 import subprocess
+import threading
+import time
 import os
 
+from utils.midi_util import midi_bytes_to_sequence, sequence_to_midi_bytes
+
+
 class SynMelodyRNN:
+    """
+    melody_rnn generation
 
-    @staticmethod
-    def get_midi_str(primer_midi):
-        output_dir = "/tmp/mag_tmp1.midi"
-        SynMelodyRNN.midi_prior_generates_midi_melody(primer_midi, output_dir)
-        with open(output_dir, "r") as f:
-            midi_bytes = f.readlines()
-        return midi_bytes
+    midi_prior_generates_midi_melody() shells out to scripts/generate-rnn-midi.sh, paying for
+    interpreter startup, TensorFlow import and bundle loading on every call (cold).
+    An instance loads the bundle once and keeps the generator warm in-process, so each
+    request only pays for sampling.
+    """
+
+    def __init__(self, bundle_file=None, num_steps=128, num_outputs=10, temperature=1.0, backend="tensorflow",
+                 batch_size=4):
+        """
+        batch_size: candidates sampled per batch by a batching backend (numpy) when generating against a
+                    deadline, which is checked between batches
+        """
+        self.bundle_file = bundle_file
+        self.backend = backend
+        self.batch_size = batch_size
+        self.num_steps = num_steps
+        self.num_outputs = num_outputs
+        self.temperature = temperature
+        self.generator = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, syn_config):
+        melody_config = syn_config["magenta"]["melody"]
+        bundle_file = melody_config.get("bundle_file")
+        if bundle_file and not os.path.isabs(bundle_file):
+            bundle_file = os.path.join(os.environ.get("SYNOSC_PATH", ""), bundle_file)
+        return cls(
+            bundle_file=bundle_file,
+            num_steps=melody_config.get("num_steps", 128),
+            num_outputs=melody_config.get("num_outputs", 10),
+            temperature=melody_config.get("temperature", 1.0),
+            backend=melody_config.get("backend", "tensorflow"),
+            batch_size=melody_config.get("batch_size", 4),
+        )
+
+    def load(self):
+        """
+        parse the bundle and initialize the generator once, the same way synmag_midi.runner does
+        """
+        with self._lock:
+            if self.generator is None:
+                from generators.interfaces.synmag_midi import _load_generator_from_bundle_file, get_piano_mag_paths
+
+                bundle_file = self.bundle_file or get_piano_mag_paths()
+                generator = _load_generator_from_bundle_file(bundle_file, self.backend)
+                if generator is None:
+                    raise ValueError(f"could not load generator bundle: {bundle_file}")
+                self.generator = generator
+        return self
+
+    def generate(self, primer_sequence, num_steps=None, temperature=None, num_outputs=None, deadline=None):
+        """
+        generate melodies that continue the primer, mirroring melody_rnn_generate
+        primer_sequence: (NoteSequence) primer, may be empty
+        num_steps, temperature, num_outputs: the instance's settings when None
+        deadline: (float) system time after which no further candidates (or batches of batch_size candidates on a
+                  batching backend) are started, at least one is always generated
+        :return: (list) of generated NoteSequences
+        """
+        from magenta.music import constants
+        from magenta.protobuf import generator_pb2
+        from magenta.protobuf import music_pb2
+
+        self.load()
+        num_steps = self.num_steps if num_steps is None else num_steps
+        temperature = self.temperature if temperature is None else temperature
+        num_outputs = self.num_outputs if num_outputs is None else num_outputs
+
+        if primer_sequence.tempos:
+            qpm = primer_sequence.tempos[0].qpm
+        else:
+            qpm = constants.DEFAULT_QUARTERS_PER_MINUTE
+        seconds_per_step = 60.0 / qpm / self.generator.steps_per_quarter
+        total_seconds = num_steps * seconds_per_step
+
+        generator_options = generator_pb2.GeneratorOptions()
+        if primer_sequence.notes:
+            input_sequence = primer_sequence
+            last_end_time = max(n.end_time for n in primer_sequence.notes)
+            start_time = last_end_time + seconds_per_step
+        else:
+            input_sequence = music_pb2.NoteSequence()
+            input_sequence.tempos.add().qpm = qpm
+            start_time = 0
+        if start_time >= total_seconds:
+            raise ValueError(
+                f"primer ends at {start_time}s, which is past the {num_steps} steps ({total_seconds}s) to generate")
+        generator_options.generate_sections.add(start_time=start_time, end_time=total_seconds)
+        generator_options.args['temperature'].float_value = temperature
+
+        with self._lock:
+            # numpy backend samples candidates in batches, all at once without a deadline
+            batched = hasattr(self.generator, "generate_batch")
+            batch_size = num_outputs if deadline is None else max(1, self.batch_size)
+            sequences = []
+            while len(sequences) < num_outputs and (not sequences or deadline is None or time.time() < deadline):
+                if batched:
+                    sequences.extend(self.generator.generate_batch(
+                        input_sequence, generator_options, min(batch_size, num_outputs - len(sequences))))
+                else:
+                    sequences.append(self.generator.generate(input_sequence, generator_options))
+            return sequences
+
+    def generate_ranked(self, primer_sequence, ranker, budget=None, num_outputs=None):
+        """
+        generate candidates within budget seconds and order them with a CandidateRanker
+        :return: (list) of generated NoteSequences, best first
+        """
+        deadline = time.time() + budget if budget else None
+        candidates = self.generate(primer_sequence, num_outputs=num_outputs, deadline=deadline)
+        return [candidates[i] for i in ranker.rank(primer_sequence, candidates)]
+
+    def generate_midi_bytes(self, primer_midi_bytes, num_outputs=None):
+        """
+        bytes in, bytes out: the primer and generated melodies never touch the filesystem
+        :return: (list) of midi file contents
+        """
+        primer_sequence = midi_bytes_to_sequence(primer_midi_bytes)
+        return [sequence_to_midi_bytes(s) for s in self.generate(primer_sequence, num_outputs=num_outputs)]
+
+    def generate_to_dir(self, primer_midi, output_dir, ranker=None):
+        """
+        warm replacement for midi_prior_generates_midi_melody(), same file layout as melody_rnn_generate
+        ranker: optional CandidateRanker, files are then numbered best first
+        :return: (list) of the written midi paths, in generated (or ranked) order
+        """
+        from magenta.music import midi_io
+
+        primer_sequence = midi_io.midi_file_to_sequence_proto(primer_midi)
+        if ranker is None:
+            sequences = self.generate(primer_sequence)
+        else:
+            sequences = self.generate_ranked(primer_sequence, ranker)
+        os.makedirs(output_dir, exist_ok=True)
+        date_and_time = time.strftime('%Y-%m-%d_%H%M%S')
+        digits = len(str(len(sequences)))
+        midi_paths = []
+        for i, sequence in enumerate(sequences):
+            midi_path = os.path.join(output_dir, '%s_%s.mid' % (date_and_time, str(i + 1).zfill(digits)))
+            midi_io.sequence_proto_to_midi_file(sequence, midi_path)
+            midi_paths.append(midi_path)
+        return midi_paths
+
+    def get_midi_str(self, primer_midi_bytes):
+        """
+        :return: (bytes) contents of a single midi file generated from the primer
+        """
+        return self.generate_midi_bytes(primer_midi_bytes, num_outputs=1)[0]
 
     @staticmethod
     def midi_prior_generates_midi_melody(primer_midi, output_dir):
@@ -28,8 +177,6 @@ class SynMelodyRNN:
         """
         config = "attention_rnn"
 
-        # bundle_path = f"{os.environ['SYNOSC_PATH']}/data/attention_rnn.mag"
-        # cmd = f"{os.environ['SYNOSC_PATH']}/scripts/generate-rnn-midi.sh {config} {bundle_path} {output_dir} {primer_midi}"
-        bundle_path = f"/Users/davisdulin/src/synaesthesia/synosc/data/attention_rnn.mag"
-        cmd = f"/Users/davisdulin/src/synaesthesia/synosc/scripts/generate-rnn-midi.sh {config} {bundle_path} {output_dir} {primer_midi}"
+        bundle_path = f"{os.environ['SYNOSC_PATH']}/data/mags/attention_rnn.mag"
+        cmd = f"{os.environ['SYNOSC_PATH']}/scripts/generate-rnn-midi.sh {config} {bundle_path} {output_dir} {primer_midi}"
         subprocess.run(cmd, shell=True)
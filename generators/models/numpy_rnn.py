@@ -0,0 +1,370 @@
+"""
+NumPy backend for melody_rnn bundles
+
+Running melody_rnn through a TensorFlow session means building the graph and restoring the
+checkpoint at startup, then paying sess.run overhead on every step of what is a small LSTM.
+This backend reads the weights out of a .mag bundle once, caches them as .npy files
+(memory mapped on later loads, keyed by a digest of the bundle), and runs the forward pass
+and sampling loop in NumPy, batched across candidate outputs.
+
+The forward pass reproduces magenta's events_rnn_graph for generation:
+    cell_0: BasicLSTMCell, wrapped in tf.contrib.rnn.AttentionCellWrapper for attention_rnn
+    cell_n: BasicLSTMCell
+    fully_connected layer -> softmax(logits / temperature)
+
+NumpyMelodyRnnSequenceGenerator is a drop in MelodyRnnSequenceGenerator, so it works with
+synmag_midi.runner (backend: numpy). scripts/check_numpy_rnn.py compares it against the
+TensorFlow generator for a fixed seed.
+"""
+import functools
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "tmp", "npy")
+
+KERNEL_NAMES = ("kernel", "weights", "Linear/Matrix")
+BIAS_NAMES = ("bias", "biases", "Linear/Bias")
+LSTM_SCOPES = ("basic_lstm_cell/", "lstm_cell/", "BasicLSTMCell/")
+FORGET_BIAS = 1.0
+
+
+def bundle_digest(bundle):
+    """
+    :return: (str) hex digest of the bundle's checkpoint, identifies its weight cache
+    """
+    digest = hashlib.sha256()
+    digest.update(bundle.generator_details.id.encode())
+    for checkpoint_bytes in bundle.checkpoint_file:
+        digest.update(checkpoint_bytes)
+    return digest.hexdigest()
+
+
+def _lookup(variables, prefix, names):
+    for name in names:
+        if prefix + name in variables:
+            return variables[prefix + name]
+    raise KeyError(f"none of {[prefix + n for n in names]} in checkpoint")
+
+
+def _layer_prefix(variables, index):
+    """scope of the index'th cell in the MultiRNNCell, or None if there are no more layers"""
+    marker = f"cell_{index}/"
+    for name in sorted(variables):
+        if marker in name:
+            return name[:name.index(marker) + len(marker)]
+    return None
+
+
+def canonical_weights(variables):
+    """
+    map checkpoint variable names, which differ between TensorFlow versions, to fixed names
+    variables: (dict) checkpoint variable name -> array
+    :return: (dict) canonical name -> array
+    """
+    weights = {}
+    index = 0
+    prefix = _layer_prefix(variables, 0)
+    while prefix is not None:
+        wrapper = prefix + "attention_cell_wrapper/"
+        cell_prefix = wrapper if index == 0 and wrapper + "attention/attn_w" in variables else prefix
+        if cell_prefix == wrapper:
+            weights["attn_input_kernel"] = _lookup(variables, wrapper, KERNEL_NAMES)
+            weights["attn_input_bias"] = _lookup(variables, wrapper, BIAS_NAMES)
+            weights["attn_w"] = variables[wrapper + "attention/attn_w"]
+            weights["attn_v"] = variables[wrapper + "attention/attn_v"]
+            weights["attn_query_kernel"] = _lookup(variables, wrapper + "attention/", KERNEL_NAMES)
+            weights["attn_query_bias"] = _lookup(variables, wrapper + "attention/", BIAS_NAMES)
+            weights["attn_output_kernel"] = _lookup(variables, wrapper + "attn_output_projection/", KERNEL_NAMES)
+            weights["attn_output_bias"] = _lookup(variables, wrapper + "attn_output_projection/", BIAS_NAMES)
+        for scope in LSTM_SCOPES:
+            try:
+                weights[f"lstm_{index}_kernel"] = _lookup(variables, cell_prefix + scope, KERNEL_NAMES)
+                weights[f"lstm_{index}_bias"] = _lookup(variables, cell_prefix + scope, BIAS_NAMES)
+                break
+            except KeyError:
+                continue
+        else:
+            raise KeyError(f"no LSTM weights under {cell_prefix}")
+        index += 1
+        prefix = _layer_prefix(variables, index)
+    weights["softmax_kernel"] = _lookup(variables, "fully_connected/", KERNEL_NAMES)
+    weights["softmax_bias"] = _lookup(variables, "fully_connected/", BIAS_NAMES)
+    return weights
+
+
+def read_checkpoint_variables(bundle):
+    """
+    read every variable of the bundle's checkpoint, the only step that needs TensorFlow
+    :return: (dict) variable name -> array
+    """
+    import tensorflow as tf
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        checkpoint_path = os.path.join(tmp_dir, "model.ckpt")
+        with open(checkpoint_path, "wb") as f:
+            f.write(bundle.checkpoint_file[0])
+        reader = tf.train.NewCheckpointReader(checkpoint_path)
+        return {name: reader.get_tensor(name) for name in reader.get_variable_to_shape_map()}
+
+
+def load_weights(bundle, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    :return: (dict) canonical name -> array, memory mapped from the .npy cache, extracting it on first use
+    """
+    weights_dir = os.path.join(cache_dir, bundle_digest(bundle))
+    index_path = os.path.join(weights_dir, "index.json")
+    if not os.path.exists(index_path):
+        weights = canonical_weights(read_checkpoint_variables(bundle))
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=cache_dir)
+        for name, value in weights.items():
+            np.save(os.path.join(tmp_dir, name + ".npy"), np.asarray(value, dtype=np.float32))
+        with open(os.path.join(tmp_dir, "index.json"), "w") as f:
+            json.dump({"generator_id": bundle.generator_details.id, "weights": sorted(weights)}, f)
+        try:
+            os.rename(tmp_dir, weights_dir)
+        except OSError:
+            # another process extracted the same bundle first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    with open(index_path) as f:
+        index = json.load(f)
+    return {name: np.load(os.path.join(weights_dir, name + ".npy"), mmap_mode="r") for name in index["weights"]}
+
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def _softmax(x, axis=-1):
+    e = np.exp(x - x.max(axis=axis, keepdims=True))
+    return e / e.sum(axis=axis, keepdims=True)
+
+
+class NumpyMelodyRnn:
+    """
+    forward pass over canonical weights, state is a list with one entry per layer
+    """
+
+    def __init__(self, weights, attn_length=0):
+        self.attention = "attn_w" in weights
+        self.attn_length = attn_length if self.attention else 0
+        self.num_layers = sum(1 for name in weights if name.startswith("lstm_") and name.endswith("_kernel"))
+        self.w = {name: np.asarray(value) for name, value in weights.items()}
+        self.units = [self.w[f"lstm_{i}_bias"].shape[0] // 4 for i in range(self.num_layers)]
+        if self.attention:
+            self.attn_size = self.w["attn_output_bias"].shape[0]
+            self.attn_w = self.w["attn_w"].reshape(self.attn_size, -1)
+
+    def zero_state(self, batch_size):
+        state = []
+        for i, units in enumerate(self.units):
+            lstm_state = (np.zeros((batch_size, units), np.float32), np.zeros((batch_size, units), np.float32))
+            if i == 0 and self.attention:
+                state.append((lstm_state,
+                              np.zeros((batch_size, self.attn_size), np.float32),
+                              np.zeros((batch_size, self.attn_length, self.attn_size), np.float32)))
+            else:
+                state.append(lstm_state)
+        return state
+
+    @staticmethod
+    def repeat_state(state, batch_size):
+        return [tuple(np.repeat(s, batch_size, axis=0) if isinstance(s, np.ndarray) else
+                      tuple(np.repeat(x, batch_size, axis=0) for x in s) for s in layer) for layer in state]
+
+    def _lstm(self, index, inputs, c, h):
+        gates = np.concatenate([inputs, h], axis=1) @ self.w[f"lstm_{index}_kernel"] + self.w[f"lstm_{index}_bias"]
+        i, j, f, o = np.split(gates, 4, axis=1)
+        new_c = c * _sigmoid(f + FORGET_BIAS) + _sigmoid(i) * np.tanh(j)
+        new_h = np.tanh(new_c) * _sigmoid(o)
+        return new_c, new_h
+
+    def _attention_cell(self, inputs, state):
+        (c, h), attns, attn_states = state
+        inputs = np.concatenate([inputs, attns], axis=1) @ self.w["attn_input_kernel"] + self.w["attn_input_bias"]
+        c, h = self._lstm(0, inputs, c, h)
+        query = np.concatenate([c, h], axis=1) @ self.w["attn_query_kernel"] + self.w["attn_query_bias"]
+        hidden_features = attn_states @ self.attn_w
+        scores = np.sum(self.w["attn_v"] * np.tanh(hidden_features + query[:, None, :]), axis=2)
+        new_attns = np.sum(_softmax(scores, axis=1)[:, :, None] * attn_states, axis=1)
+        output = (np.concatenate([h, new_attns], axis=1) @ self.w["attn_output_kernel"]
+                  + self.w["attn_output_bias"])
+        new_attn_states = np.concatenate([attn_states[:, 1:, :], output[:, None, :]], axis=1)
+        return output, ((c, h), new_attns, new_attn_states)
+
+    def step(self, inputs, state):
+        """
+        inputs: [batch, input_size] encoded events for one step
+        :return: (logits [batch, num_classes], new state)
+        """
+        new_state = []
+        x = inputs
+        for i in range(self.num_layers):
+            if i == 0 and self.attention:
+                x, layer_state = self._attention_cell(x, state[0])
+            else:
+                c, h = self._lstm(i, x, *state[i])
+                x, layer_state = h, (c, h)
+            new_state.append(layer_state)
+        return x @ self.w["softmax_kernel"] + self.w["softmax_bias"], new_state
+
+    def run(self, inputs, state):
+        """
+        inputs: [batch, steps, input_size]
+        :return: (logits of the last step, final state)
+        """
+        logits = None
+        for t in range(inputs.shape[1]):
+            logits, state = self.step(inputs[:, t, :], state)
+        return logits, state
+
+
+class NumpyMelodyRnnModel:
+    """
+    the parts of MelodyRnnModel a sequence generator uses, without a TensorFlow session
+    """
+
+    def __init__(self, config, cache_dir=DEFAULT_CACHE_DIR):
+        self._config = config
+        self.cache_dir = cache_dir
+        self.rnn = None
+        self._lock = threading.Lock()
+
+    def initialize_from_bundle(self, bundle):
+        with self._lock:
+            if self.rnn is None:
+                attn_length = getattr(self._config.hparams, "attn_length", 0) or 0
+                self.rnn = NumpyMelodyRnn(load_weights(bundle, self.cache_dir), attn_length=attn_length)
+
+    def generate_melodies(self, num_steps, primer_melody, temperature=1.0, num_outputs=1):
+        """
+        sample num_outputs melodies as one batch, see MelodyRnnModel.generate_melody
+        num_steps: total length of each melody, primer included
+        :return: (list) of magenta.music.Melody
+        """
+        import copy
+        from magenta.music import melodies_lib
+
+        encoder_decoder = self._config.encoder_decoder
+        melody = copy.deepcopy(primer_melody)
+        transpose_amount = melody.squash(self._config.min_note, self._config.max_note, self._config.transpose_to_key)
+        if not melody:
+            melody.append(melodies_lib.MELODY_NO_EVENT)
+
+        # the primer is the same for every candidate, so it runs once and the state is copied
+        inputs = np.asarray(encoder_decoder.get_inputs_batch([melody], full_length=True), dtype=np.float32)
+        logits, state = self.rnn.run(inputs, self.rnn.zero_state(1))
+        state = self.rnn.repeat_state(state, num_outputs)
+        logits = np.repeat(logits, num_outputs, axis=0)
+
+        melodies = [copy.deepcopy(melody) for _ in range(num_outputs)]
+        while len(melodies[0]) < num_steps:
+            softmax = _softmax(logits.astype(np.float64) / temperature)
+            encoder_decoder.extend_event_sequences(melodies, softmax[:, None, :])
+            if len(melodies[0]) >= num_steps:
+                break
+            inputs = np.asarray(encoder_decoder.get_inputs_batch(melodies), dtype=np.float32)
+            logits, state = self.rnn.step(inputs[:, -1, :], state)
+
+        for generated in melodies:
+            generated.transpose(-transpose_amount)
+        return melodies
+
+    def generate_melody(self, num_steps, primer_melody, temperature=1.0, beam_size=1, branch_factor=1,
+                        steps_per_iteration=1):
+        """
+        single sample, beam search arguments are accepted for compatibility and ignored
+        """
+        return self.generate_melodies(num_steps, primer_melody, temperature=temperature)[0]
+
+
+def _build_generator_class():
+    from magenta.models.melody_rnn import melody_rnn_sequence_generator
+
+    class NumpyMelodyRnnSequenceGenerator(melody_rnn_sequence_generator.MelodyRnnSequenceGenerator):
+        """
+        MelodyRnnSequenceGenerator running on NumpyMelodyRnnModel
+        """
+
+        def initialize(self):
+            if self._initialized:
+                return
+            if self._bundle is None:
+                raise ValueError("the numpy backend only loads weights from a bundle")
+            self._model.initialize_from_bundle(self._bundle)
+            self._initialized = True
+
+        def generate_batch(self, input_sequence, generator_options, num_outputs):
+            """
+            num_outputs candidates for the same request, sampled as one batch
+            :return: (list) of NoteSequences
+            """
+            import magenta.music as mm
+
+            self.initialize()
+            qpm = input_sequence.tempos[0].qpm if input_sequence and input_sequence.tempos else \
+                mm.DEFAULT_QUARTERS_PER_MINUTE
+            steps_per_second = mm.steps_per_quarter_to_steps_per_second(self.steps_per_quarter, qpm)
+
+            generate_section = generator_options.generate_sections[0]
+            if generator_options.input_sections:
+                input_section = generator_options.input_sections[0]
+                primer_sequence = mm.trim_note_sequence(input_sequence, input_section.start_time,
+                                                        input_section.end_time)
+                input_start_step = mm.quantize_to_step(input_section.start_time, steps_per_second,
+                                                       quantize_cutoff=0)
+            else:
+                primer_sequence = input_sequence
+                input_start_step = 0
+
+            quantized_primer_sequence = mm.quantize_note_sequence(primer_sequence, self.steps_per_quarter)
+            extracted_melodies, _ = mm.extract_melodies(
+                quantized_primer_sequence, search_start_step=input_start_step, min_bars=0,
+                min_unique_pitches=1, gap_bars=float('inf'), ignore_polyphonic_notes=True)
+            start_step = mm.quantize_to_step(generate_section.start_time, steps_per_second, quantize_cutoff=0)
+            end_step = mm.quantize_to_step(generate_section.end_time, steps_per_second, quantize_cutoff=1.0)
+
+            if extracted_melodies and extracted_melodies[0]:
+                melody = extracted_melodies[0]
+            else:
+                steps_per_bar = int(mm.steps_per_bar_in_quantized_sequence(quantized_primer_sequence))
+                melody = mm.Melody([], start_step=max(0, start_step - 1), steps_per_bar=steps_per_bar,
+                                   steps_per_quarter=self.steps_per_quarter)
+            melody.set_length(start_step - melody.start_step)
+
+            temperature = generator_options.args['temperature'].float_value \
+                if 'temperature' in generator_options.args else 1.0
+            generated = self._model.generate_melodies(
+                end_step - melody.start_step, melody, temperature=temperature, num_outputs=num_outputs)
+            return [m.to_sequence(qpm=qpm) for m in generated]
+
+    return NumpyMelodyRnnSequenceGenerator
+
+
+@functools.lru_cache(maxsize=None)
+def generator_class():
+    """
+    :return: the NumpyMelodyRnnSequenceGenerator class, defined on first use since it subclasses magenta
+    """
+    return _build_generator_class()
+
+
+def get_generator_map(cache_dir=DEFAULT_CACHE_DIR):
+    """
+    same shape as melody_rnn_sequence_generator.get_generator_map(), for the numpy backend
+    """
+    from magenta.models.melody_rnn import melody_rnn_model
+
+    def create_sequence_generator(config, **kwargs):
+        return generator_class()(
+            NumpyMelodyRnnModel(config, cache_dir), config.details, steps_per_quarter=config.steps_per_quarter,
+            **kwargs)
+
+    return {key: functools.partial(create_sequence_generator, config)
+            for (key, config) in melody_rnn_model.default_configs.items()}
@@ -0,0 +1,228 @@
+"""
+streaming melody_rnn generation with persistent RNN state
+
+SequenceGenerator.generate() re-encodes the whole primer from time zero on every call, so
+per-tick cost grows with how long the performer has been playing. StreamingMelodyRnn keeps
+the RNN state and the position of the last encoded event between ticks:
+
+    feed(): quantizes only the newly captured notes into melody events, pads the silence up to
+            the current tick and runs the RNN over just those new steps
+    generate(): samples a continuation from a copy of the current state, leaving it untouched
+
+so per-tick cost depends on the tick length, not the session length.
+
+This drives the model's TF graph directly, the same way EventSequenceRnnModel._generate_step_for_batch
+does, so it only works for melody_rnn generators (basic_rnn, lookback_rnn, attention_rnn).
+A pooled generator is held with acquire() until close(), so the pool can't evict the model mid stream.
+Notes are treated as monophonic and, as MelodyRnnModel squashes its primer, transposed to the model's
+key (transpose_to_key) and octave folded into its note range. The RNN state can't be re-encoded, so
+the transposition is fixed by the notes of the first feed and kept until reset(); generated
+melodies are transposed back. A held note is ingested with the end time it had when first captured.
+
+Old events are dropped in whole periods of the encoder's step counter and bar, so the positions
+the encoder sees keep the phase of the absolute steps.
+"""
+import math
+import time
+
+import numpy as np
+
+NOTE_OFF = -1
+NO_EVENT = -2
+
+
+class StreamingMelodyRnn:
+
+    def __init__(self, generator, qpm, origin_time=0.0, history_steps=128):
+        """
+        generator: an initialized melody_rnn SequenceGenerator, or a PooledGenerator
+        qpm: tempo the stream is quantized at
+        origin_time: system time of stream step 0
+        history_steps: melody events kept for encoding, the RNN state carries everything older
+        """
+        self._generator = generator
+        leased = generator.acquire() if hasattr(generator, "acquire") else generator
+        self._leased = leased is not generator
+        if not hasattr(getattr(leased, "_model", None), "_session"):
+            self.close()
+            raise ValueError(f"generator {generator.details.id} does not support streaming")
+        self._model = leased._model
+        self._config = self._model._config
+        self._encoder_decoder = self._config.encoder_decoder
+        self._session = self._model._session
+        self.steps_per_quarter = leased.steps_per_quarter
+        self.history_steps = history_steps
+        graph = self._session.graph
+        self._graph_inputs = graph.get_collection('inputs')[0]
+        self._graph_initial_state = tuple(graph.get_collection('initial_state'))
+        self._graph_final_state = graph.get_collection('final_state')
+        self._graph_softmax = graph.get_collection('softmax')[0]
+        self._graph_temperature = graph.get_collection('temperature')
+        self._batch_size = self._graph_inputs.shape[0].value
+        self.reset(qpm, origin_time)
+
+    def close(self):
+        """
+        release a pooled generator's lease
+        """
+        if self._leased:
+            self._leased = False
+            self._generator.release()
+
+    def reset(self, qpm, origin_time):
+        """
+        forget all context, e.g. after a tempo change
+        """
+        self.qpm = qpm
+        self.origin_time = origin_time
+        self.seconds_per_step = 60.0 / qpm / self.steps_per_quarter
+        self._events = []
+        self._offset = 0  # absolute step of self._events[0]
+        self._encoded = 0  # absolute steps already run through the RNN
+        self._last_onset = float('-inf')
+        self._pending_off_step = None
+        self._transpose = None
+        self._state = self._session.run(self._graph_initial_state)
+        self._softmax = None
+
+    @property
+    def position(self):
+        """absolute step the next event goes to"""
+        return self._offset + len(self._events)
+
+    def _step(self, time_seconds):
+        return int(round((time_seconds - self.origin_time) / self.seconds_per_step))
+
+    def _trim_period(self):
+        """
+        :return: (int) steps the event history can be trimmed by without moving the encoder's binary
+            step counters or bar positions out of phase
+        """
+        period = 2 ** getattr(self._encoder_decoder, "_binary_counter_bits", 0)
+        return period * self.steps_per_quarter * 4 // math.gcd(period, self.steps_per_quarter * 4)
+
+    def _key_transpose(self, notes):
+        """
+        :return: (int) the transposition Melody.squash puts the notes' melody through
+        """
+        melody = self._melody([note.pitch for note in notes])
+        return melody.squash(self._config.min_note, self._config.max_note, self._config.transpose_to_key)
+
+    def _fold_pitch(self, pitch):
+        pitch += self._transpose
+        min_note, max_note = self._config.min_note, self._config.max_note
+        while pitch < min_note:
+            pitch += 12
+        while pitch >= max_note:
+            pitch -= 12
+        return pitch
+
+    def _pad_to(self, step):
+        """append NO_EVENTs (and the pending NOTE_OFF) until the next event goes to step"""
+        if self._pending_off_step is not None and self._pending_off_step < step:
+            while self.position < self._pending_off_step:
+                self._events.append(NO_EVENT)
+            if self.position == self._pending_off_step:
+                self._events.append(NOTE_OFF)
+            self._pending_off_step = None
+        while self.position < step:
+            self._events.append(NO_EVENT)
+
+    def new_notes(self, notes):
+        """
+        :return: the notes with onsets after the last ingested one, scanning back from the end
+        """
+        fresh = []
+        for note in reversed(notes):
+            if note.start_time <= self._last_onset:
+                break
+            fresh.append(note)
+        fresh.reverse()
+        return fresh
+
+    def feed(self, notes, now):
+        """
+        encode newly captured notes and the silence up to now, advancing the RNN state
+        notes: notes in capture order, only those newer than the last fed onset are used
+        now: system time the stream has been captured up to
+        """
+        fresh = self.new_notes(notes)
+        if fresh and self._transpose is None:
+            self._transpose = self._key_transpose(fresh)
+        for note in fresh:
+            start_step = max(self._step(note.start_time), self.position)
+            self._pad_to(start_step)
+            self._events.append(self._fold_pitch(note.pitch))
+            self._pending_off_step = max(start_step + 1, self._step(note.end_time))
+            self._last_onset = note.start_time
+        self._pad_to(self._step(now))
+
+        new_positions = range(self._encoded - self._offset, len(self._events))
+        if len(new_positions):
+            inputs = [self._encoder_decoder.events_to_input(self._melody(self._events), i) for i in new_positions]
+            self._state, softmax = self._run(inputs, self._state, 1.0)
+            self._softmax = softmax[0][-1]
+            self._encoded = self.position
+
+        # the RNN state carries the context, only a short history is needed for encoding
+        lookback_distances = getattr(self._encoder_decoder, "_lookback_distances", None) or []
+        keep = max([self.history_steps] + list(lookback_distances))
+        period = self._trim_period()
+        excess = (len(self._events) - keep) // period * period
+        if excess > 0:
+            del self._events[:excess]
+            self._offset += excess
+
+    def _melody(self, events):
+        import magenta.music as mm
+        return mm.Melody(events=events, steps_per_quarter=self.steps_per_quarter,
+                         steps_per_bar=4 * self.steps_per_quarter)
+
+    def _run(self, inputs, state, temperature):
+        batch = np.array([inputs] * self._batch_size)
+        feed_dict = {self._graph_inputs: batch, self._graph_initial_state: tuple(state)}
+        if self._graph_temperature:
+            feed_dict[self._graph_temperature[0]] = temperature
+        final_state, softmax = self._session.run([self._graph_final_state, self._graph_softmax], feed_dict)
+        return final_state, softmax
+
+    def generate(self, num_steps, temperature=1.0, deadline=None):
+        """
+        sample a continuation from the current position without changing the stream state
+        deadline: system time to stop sampling at, with fewer than num_steps steps
+        :return: (NoteSequence) starting at the current position, in system time, total_time at the end of
+            the steps sampled
+        """
+        from magenta.music import constants
+
+        events = list(self._events)
+        start = len(events)
+        state = self._state
+        if self._softmax is None:
+            probs = None
+        else:
+            probs = self._softmax ** (1.0 / temperature)
+            probs /= probs.sum()
+        for _ in range(num_steps):
+            if deadline is not None and time.time() >= deadline:
+                break
+            if probs is None:
+                events.append(NO_EVENT)
+            else:
+                index = np.random.choice(len(probs), p=probs)
+                events.append(self._encoder_decoder.class_index_to_event(index, self._melody(events)))
+            inputs = [self._encoder_decoder.events_to_input(self._melody(events), len(events) - 1)]
+            state, softmax = self._run(inputs, state, temperature)
+            probs = softmax[0][-1].astype(np.float64)
+            probs /= probs.sum()
+
+        generated = [e for e in events[start:]]
+        melody = self._melody(generated)
+        melody.transpose(-(self._transpose or 0))
+        sequence_start_time = self.origin_time + (self._offset + start) * self.seconds_per_step
+        sequence = melody.to_sequence(
+            velocity=100,
+            sequence_start_time=sequence_start_time,
+            qpm=self.qpm if self.qpm else constants.DEFAULT_QUARTERS_PER_MINUTE)
+        sequence.total_time = sequence_start_time + len(generated) * self.seconds_per_step
+        return sequence
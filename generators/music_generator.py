@@ -28,13 +28,15 @@ TODO:
 """
 
 
-from utils.wrench import get_syn_config
 from generators.models.melody_rnn import SynMelodyRNN
+from generators.generation_cache import GenerationCache, generation_settings, primer_key
+from generators.candidate_ranker import CandidateRanker
+from utils.midi_util import midi_bytes_to_sequence, sequence_to_midi_bytes
 from osc.synosc_client import SynOscClient
 import os
+import time
 
 DEFAULT_QUARTERS_PER_MINUTE = 120.0
-config = get_syn_config()
 
 
 class GenerativeMusicScene:
@@ -44,13 +46,19 @@ class GenerativeMusicScene:
 
     def __init__(self, syn_config):
         self.syn_config = syn_config
-        self.melody_model = SynMelodyRNN()
+        self.melody_model = SynMelodyRNN.from_config(syn_config)
+        self.generation_cache = GenerationCache.from_config(syn_config)
+        self.candidate_ranker = CandidateRanker.from_config(syn_config)
+        self.ranking_budget = syn_config["candidate_ranking"]["budget"]
         self.start_time = 0
         self.stop_signal = False
         self.signals = None
         self.channel = None
         self.qpm = self.syn_config['quarters_per_minute']
         self.synosc_client = SynOscClient(syn_config["default_ip"], syn_config["default_port"])
+        note_events_port = syn_config.get("note_events_port")
+        self.note_client = SynOscClient(syn_config["default_ip"], note_events_port) if note_events_port else None
+        self.metronome = None
         self.tmp_dir = os.path.join(os.path.dirname(__file__), "..", "tmp")
 
     def generation_alignment(self):
@@ -63,36 +71,70 @@ class GenerativeMusicScene:
         primer_midi = os.path.join(os.path.dirname(__file__), "data", "primer.midi")
         output_dir = os.path.join(self.tmp_dir, "data")
         print(f"out dir: {output_dir}")
-        SynMelodyRNN.midi_prior_generates_midi_melody(primer_midi, output_dir)
-        self.synosc_client.send_midi_dir(output_dir)
+        self.candidate_ranker.qpm = self.qpm
+        midi_paths = self.melody_model.generate_to_dir(primer_midi, output_dir, ranker=self.candidate_ranker)
+        # output_dir is reused across calls, send this call's best candidate
+        self.synosc_client.send_midi_file(midi_paths[0])
 
     def play_from_midi_bytes(self, midi_bytes):
-        primer_midi = os.path.join(self.tmp_dir, "primer.midi")
-        with open(primer_midi, "wb") as f:
-            f.write(midi_bytes)
-        output_dir = os.path.join(self.tmp_dir, "data")
-        print(f"out dir: {output_dir}")
-        SynMelodyRNN.midi_prior_generates_midi_melody(primer_midi, output_dir)
-        self.synosc_client.send_midi_dir(output_dir)
+        """
+        primer bytes in, generated bytes out over OSC, without writing to tmp
+        """
+        for generated_midi_bytes in self.generate_midi_bytes(midi_bytes):
+            self.synosc_client.send_midi_bytes(generated_midi_bytes)
+            self.send_note_events(generated_midi_bytes)
+            break
+
+    def send_note_events(self, midi_bytes):
+        """
+        schedule the response as timetagged /note bundles starting on the metronome's next beat, so
+        receivers play it on the grid however long generation took
+        :return: (int) number of datagrams sent
+        """
+        if self.note_client is None:
+            return 0
+        if self.metronome is None:
+            self.start_scene(self.qpm, time.time())
+        sequence = midi_bytes_to_sequence(midi_bytes)
+        return self.note_client.send_note_events(sequence, self.metronome.next_beat_time())
+
+    def generate_midi_bytes(self, midi_bytes):
+        """
+        generate from a primer, answering repeated primers with the same settings from the generation cache
+        :return: (list) of midi file contents, best ranked candidate first
+        """
+        primer_sequence = midi_bytes_to_sequence(midi_bytes)
+        key = primer_key(primer_sequence, generation_settings(self.syn_config, self.qpm))
+        generated = self.generation_cache.get(key)
+        if generated is None:
+            self.candidate_ranker.qpm = self.qpm
+            ranked = self.melody_model.generate_ranked(primer_sequence, self.candidate_ranker, budget=self.ranking_budget)
+            generated = [sequence_to_midi_bytes(s) for s in ranked]
+            self.generation_cache.put(key, generated)
+        return generated
 
     def start_scene(self, qpm, start_time):
         """
         define generator interface to use here
+        starts the beat grid responses are scheduled on
         """
+        from generators.metronome import SynMetronome
+
+        self.qpm = qpm
+        self.start_time = start_time
+        self.metronome = SynMetronome(qpm, start_time, self.signals, self.channel)
         # SynMelodyRNN.midi_prior_generates_midi_melody(primer_midi, output_dir)
 
         # output_dir = "mag_out1"
         # primer_midi = "data/primer.mid"
         # SynMelodyRNN.midi_prior_generates_midi_melody(primer_midi, output_dir)
-        # next_mid_out = "tmp-glob.midi"
-        # midi_data = get_midi_aggr_dir(output_dir, next_mid_out)
-        # gen_qpm_est = estimate_tempo(midi_data)
+        # tempo_tracker = TempoTracker(initial_qpm=qpm)
+        # each tick: tempo_tracker.add_onsets(onset times of the newly captured notes)
         # before = sme.get_qpm()
-        # sme.update_metronome()
+        # sme.follow(tempo_tracker)
         # after = sme.get_qpm()
         # print(f"BEFORE metronome qpm: {before}")
         # print(f"AFTER metronome qpm: {after}")
-        pass
 
 
 def test():
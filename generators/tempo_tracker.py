@@ -0,0 +1,161 @@
+"""
+online tempo and beat phase tracking from note onsets
+
+estimate_tempo clusters the inter onset intervals of a whole file. TempoTracker does the same job as
+onsets are captured, with state bounded however long the set runs:
+
+    histogram: decaying votes over log spaced tempo bins between min_qpm and max_qpm. Each onset votes
+               with its interval to the last few onsets, folded into the range by doubling / halving
+               (as ContextWindow folds its tempo), nearer onsets voting more
+    prior:     the peak is picked after weighting the bins by a log normal preference around
+               prior_qpm, so subdivisions played as often as beats don't double the tempo
+    phase:     circular mean of the last phase_history onsets at the tracked beat period, recent onsets
+               weighing more. Beats carry more onsets than any subdivision, so the mean lands on them
+
+Each onset costs O(history + bins) and estimate() O(phase_history + bins), so it can run every tick.
+"""
+import math
+from collections import deque
+
+import numpy as np
+
+DEFAULT_QUARTERS_PER_MINUTE = 120.0
+# "rhythmic information is provided by IOIs in the range of approximately 50 ms to 2 s", as estimate_tempi
+MIN_INTERVAL, MAX_INTERVAL = 0.05, 2.0
+# onsets closer than this are one chord, not two events
+CHORD_INTERVAL = 0.03
+
+
+class TempoTracker:
+
+    def __init__(self, min_qpm=60.0, max_qpm=240.0, bins_per_octave=48, history=6, half_life=8.0,
+                 smoothing=1.5, phase_history=32, initial_qpm=DEFAULT_QUARTERS_PER_MINUTE,
+                 prior_qpm=DEFAULT_QUARTERS_PER_MINUTE, prior_octaves=1.0):
+        """
+        min_qpm, max_qpm: tempo range, max_qpm should be at least twice min_qpm so any interval folds into it
+        bins_per_octave: histogram resolution
+        history: previous onsets each onset is paired with
+        half_life: seconds of performance for votes to lose half their weight
+        smoothing: standard deviation of each vote, in bins
+        phase_history: recent onsets the beat phase is estimated from
+        prior_qpm, prior_octaves: center and standard deviation (in octaves) of the tempo preference
+        """
+        self.min_qpm = min_qpm
+        self.max_qpm = max_qpm
+        self.bins_per_octave = bins_per_octave
+        self.half_life = half_life
+        self.initial_qpm = initial_qpm
+        num_bins = int(math.ceil(math.log2(max_qpm / min_qpm) * bins_per_octave)) + 1
+        self.bin_qpms = min_qpm * 2.0 ** (np.arange(num_bins) / bins_per_octave)
+        self.prior = np.exp(-0.5 * (np.log2(self.bin_qpms / prior_qpm) / prior_octaves) ** 2)
+        radius = int(math.ceil(3 * smoothing))
+        self._kernel_offsets = np.arange(-radius, radius + 1)
+        self._kernel = np.exp(-0.5 * (self._kernel_offsets / smoothing) ** 2)
+        self._onsets = deque(maxlen=history)
+        self._phase_onsets = deque(maxlen=phase_history)
+        self.reset()
+
+    def reset(self):
+        self.histogram = np.zeros(len(self.bin_qpms))
+        self._onsets.clear()
+        self._phase_onsets.clear()
+        self._last_time = None
+        self.onset_count = 0
+
+    def _fold(self, interval):
+        """
+        :return: (float) qpm of the interval as a beat, doubled or halved into [min_qpm, max_qpm]
+        """
+        qpm = 60.0 / interval
+        while qpm < self.min_qpm:
+            qpm *= 2
+        while qpm > self.max_qpm:
+            qpm /= 2
+        return qpm
+
+    def _vote(self, qpm, weight):
+        center = int(round(math.log2(qpm / self.min_qpm) * self.bins_per_octave))
+        bins = center + self._kernel_offsets
+        inside = (bins >= 0) & (bins < len(self.histogram))
+        self.histogram[bins[inside]] += weight * self._kernel[inside]
+
+    def add_onset(self, time):
+        """
+        time: onset time in seconds, onsets must arrive in order
+        """
+        if self._onsets and time - self._onsets[-1] < CHORD_INTERVAL:
+            return
+        if self._last_time is not None and time > self._last_time:
+            self.histogram *= 0.5 ** ((time - self._last_time) / self.half_life)
+        self._last_time = time
+
+        for k, previous in enumerate(reversed(self._onsets)):
+            interval = time - previous
+            if interval > MAX_INTERVAL:
+                break
+            if interval >= MIN_INTERVAL:
+                self._vote(self._fold(interval), 1.0 / (k + 1))
+        self._onsets.append(time)
+        self._phase_onsets.append(time)
+        self.onset_count += 1
+
+    def add_onsets(self, times):
+        for time in times:
+            self.add_onset(time)
+
+    def qpm(self):
+        """
+        :return: (float) peak of the weighted histogram, refined between bins, initial_qpm until intervals
+            have been seen
+        """
+        weighted = self.histogram * self.prior
+        peak = int(np.argmax(weighted))
+        if weighted[peak] <= 0:
+            return self.initial_qpm
+        offset = 0.0
+        if 0 < peak < len(weighted) - 1:
+            left, center, right = weighted[peak - 1:peak + 2]
+            curvature = left - 2 * center + right
+            if curvature < 0:
+                offset = 0.5 * (left - right) / curvature
+        return float(self.min_qpm * 2.0 ** ((peak + offset) / self.bins_per_octave))
+
+    def confidence(self):
+        """
+        :return: (float) share of the votes within a smoothing kernel of the peak, in [0, 1]
+        """
+        weighted = self.histogram * self.prior
+        total = weighted.sum()
+        if total <= 0:
+            return 0.0
+        peak = int(np.argmax(weighted))
+        low, high = max(0, peak + self._kernel_offsets[0]), peak + self._kernel_offsets[-1] + 1
+        return float(weighted[low:high].sum() / total)
+
+    def beat_time(self):
+        """
+        :return: (float) time of a tracked beat near the latest onset, None before any onset
+        """
+        if not self._phase_onsets:
+            return None
+        period = 60.0 / self.qpm()
+        onsets = np.array(self._phase_onsets)
+        weights = 0.5 ** ((onsets[-1] - onsets) / self.half_life)
+        angle = np.angle(np.sum(weights * np.exp(2j * np.pi * (onsets - onsets[-1]) / period)))
+        return float(onsets[-1] + angle / (2 * np.pi) * period)
+
+    def next_beat_time(self, now):
+        """
+        :return: (float) time of the first tracked beat at or after now, None before any onset
+        """
+        beat_time = self.beat_time()
+        if beat_time is None:
+            return None
+        period = 60.0 / self.qpm()
+        return beat_time + math.ceil((now - beat_time) / period) * period
+
+    def estimate(self, now):
+        """
+        :return: (qpm, next beat time, confidence)
+        """
+        return self.qpm(), self.next_beat_time(now), self.confidence()
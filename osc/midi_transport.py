@@ -0,0 +1,181 @@
+"""
+chunked MIDI-over-OSC transport
+
+A whole midi file does not fit in one UDP datagram once generated phrases get long, so
+midi bytes are split into chunks whose encoded message fits in the datagrams the receiving
+server reads (RECEIVER_MAX_PACKET, socketserver's limit, which cuts longer datagrams short):
+
+    /midi/0/chunk  [msg_id (int), seq (int), total (int), payload (blob)]
+
+The receiver reassembles chunks per (sender address, msg_id), and senders start their ids at random,
+so a restarted sender's messages aren't mistaken for duplicates. When a message stalls with chunks
+missing, it asks the sender to resend only those chunks, sent back to the address the chunks came
+from (the sender listens on the socket it sends chunks from):
+
+    /midi/0/resend [msg_id (int), seq (int), seq (int), ...]
+
+Messages that are still incomplete after the reassembly timeout are dropped and counted.
+"""
+import random
+import socketserver
+import threading
+import time
+from collections import OrderedDict
+
+from pythonosc import osc_message_builder
+
+MIDI_CHUNK_ADDRESS = "/midi/0/chunk"
+MIDI_RESEND_ADDRESS = "/midi/0/resend"
+
+# ThreadingOSCUDPServer reads datagrams with recvfrom(max_packet_size)
+RECEIVER_MAX_PACKET = socketserver.UDPServer.max_packet_size
+
+
+def chunk_header_bytes(address=MIDI_CHUNK_ADDRESS):
+    """
+    :return: (int) encoded size of a chunk message with an empty payload: address, type tags,
+        three int32 and the blob size
+    """
+    msg = osc_message_builder.OscMessageBuilder(address=address)
+    # measured with a one word payload, some python-osc versions refuse empty blobs
+    for value in (0, 0, 0, b"\0" * 4):
+        msg.add_arg(value)
+    return msg.build().size - 4
+
+
+class MidiChunker:
+    """
+    splits midi bytes into chunk messages and keeps the most recent ones around for resends
+    """
+
+    def __init__(self, max_packet=RECEIVER_MAX_PACKET, history=32):
+        # blobs are padded to 4 bytes
+        self.chunk_size = (min(max_packet, RECEIVER_MAX_PACKET) - chunk_header_bytes()) // 4 * 4
+        self.history = history
+        # a restarted sender doesn't reuse the ids of its last session
+        self._next_msg_id = random.randrange(2 ** 31)
+        self._sent = OrderedDict()
+        self._lock = threading.Lock()
+
+    def chunk(self, midi_bytes):
+        """
+        :return: (msg_id, list of [msg_id, seq, total, payload] argument lists)
+        """
+        with self._lock:
+            msg_id = self._next_msg_id
+            self._next_msg_id = (self._next_msg_id + 1) % 2 ** 31
+            view = memoryview(midi_bytes)
+            total = max(1, -(-len(view) // self.chunk_size))
+            chunks = [
+                [msg_id, seq, total, bytes(view[seq * self.chunk_size:(seq + 1) * self.chunk_size])]
+                for seq in range(total)
+            ]
+            self._sent[msg_id] = chunks
+            while len(self._sent) > self.history:
+                self._sent.popitem(last=False)
+        return msg_id, chunks
+
+    def resend(self, msg_id, seqs):
+        """
+        :return: (list) of the requested chunks that are still in the send history
+        """
+        with self._lock:
+            chunks = self._sent.get(msg_id)
+        if chunks is None:
+            return []
+        return [chunks[seq] for seq in seqs if 0 <= seq < len(chunks)]
+
+
+class _PartialMessage:
+    def __init__(self, total, now):
+        self.total = total
+        self.chunks = {}
+        self.first_seen = now
+        self.last_seen = now
+        self.resends = 0
+
+    def missing(self):
+        return [seq for seq in range(self.total) if seq not in self.chunks]
+
+
+class MidiReassembler:
+    """
+    reassembly buffer for chunked midi messages
+
+    Args:
+      timeout: seconds after the first chunk before an incomplete message is dropped.
+      resend_after: seconds without a new chunk before missing chunks are requested again.
+      max_resends: resend requests per message before waiting out the timeout.
+      max_pending: incomplete messages kept at once, the oldest is dropped beyond that.
+    """
+
+    def __init__(self, timeout=1.0, resend_after=0.1, max_resends=3, max_pending=16):
+        self.timeout = timeout
+        self.resend_after = resend_after
+        self.max_resends = max_resends
+        self.max_pending = max_pending
+        self._pending = OrderedDict()
+        self._completed = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {
+            "chunks_received": 0,
+            "duplicate_chunks": 0,
+            "messages_completed": 0,
+            "messages_dropped": 0,
+            "resend_requests": 0,
+        }
+
+    def add_chunk(self, msg_id, seq, total, payload, now=None, source=None):
+        """
+        source: (ip, port) the chunk came from, where resend requests for its message go
+        :return: (bytes) the reassembled midi message once its last chunk arrives, else None
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self.stats["chunks_received"] += 1
+            key = (source, msg_id)
+            if key in self._completed:
+                self.stats["duplicate_chunks"] += 1
+                return None
+            message = self._pending.get(key)
+            if message is None:
+                message = self._pending[key] = _PartialMessage(total, now)
+                while len(self._pending) > self.max_pending:
+                    self._pending.popitem(last=False)
+                    self.stats["messages_dropped"] += 1
+            if seq in message.chunks:
+                self.stats["duplicate_chunks"] += 1
+                return None
+            message.chunks[seq] = payload
+            message.last_seen = now
+            if len(message.chunks) < message.total:
+                return None
+            del self._pending[key]
+            self._completed[key] = now
+            while len(self._completed) > self.max_pending * 4:
+                self._completed.popitem(last=False)
+            self.stats["messages_completed"] += 1
+        return b"".join(message.chunks[seq] for seq in range(message.total))
+
+    def poll(self, now=None):
+        """
+        drop timed out messages and collect resend requests for stalled ones
+        :return: (list) of (source, msg_id, missing seqs) to request from the sender
+        """
+        now = time.time() if now is None else now
+        requests = []
+        with self._lock:
+            for (source, msg_id), message in list(self._pending.items()):
+                if now - message.first_seen >= self.timeout:
+                    del self._pending[(source, msg_id)]
+                    self.stats["messages_dropped"] += 1
+                elif now - message.last_seen >= self.resend_after and message.resends < self.max_resends:
+                    message.resends += 1
+                    message.last_seen = now
+                    requests.append((source, msg_id, message.missing()))
+            self.stats["resend_requests"] += len(requests)
+        return requests
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
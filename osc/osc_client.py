@@ -1,9 +1,15 @@
 import random
+from itertools import groupby
 from pythonosc import udp_client
 from pythonosc import osc_bundle_builder
 from pythonosc import osc_message_builder
 
 from osc.osc_helper import OscHandler
+from osc.osc_encoding import MessageTemplateCache, typetags_for
+from osc.midi_transport import RECEIVER_MAX_PACKET
+
+BUNDLE_HEADER_BYTES = 16  # "#bundle\0" + 8 byte NTP timetag
+BUNDLE_ELEMENT_SIZE_BYTES = 4
 
 
 class OscClient(OscHandler):
@@ -13,45 +19,111 @@ class OscClient(OscHandler):
     https://python-osc.readthedocs.io/en/latest/
     """
 
+    # length of bytes http://opensoundcontrol.org/topic/247, capped at what our ThreadingOSCUDPServer reads
+    MAX_PACKET = RECEIVER_MAX_PACKET
+
     def __init__(self, ip, port):
         OscHandler.__init__(self, ip, port)
         self.ip = ip
         self.port = port
         self.client = self.get_udp_client()
+        self.message_templates = MessageTemplateCache()
 
     def generate_messages(self):
-        self.client.send_message("/volume", 1)
-        self.client.send_message("/filter", random.random())
+        self.send_message("/volume", 1)
+        self.send_message("/filter", random.random())
         pass
 
+    def send_message(self, address, value):
+        """
+        same call as SimpleUDPClient.send_message(), but through a cached MessageTemplate
+        so the address and type tags are only encoded once per (address, type tags)
+        """
+        args = value if isinstance(value, (list, tuple)) else (value,)
+        self.send_template(self.message_templates.get(address, typetags_for(args)), *args)
+
+    def message_template(self, address, typetags):
+        return self.message_templates.get(address, typetags)
+
+    def send_template(self, template, *args):
+        with template.lock:
+            template.encode(*args)
+            self.client.send(template.message)
+
     def get_udp_client(self):
         client = udp_client.SimpleUDPClient(self.ip, self.port)
         return client
 
-    def generate_bundles(self):
-        # TODO learn about bundles
-        pass
+    @staticmethod
+    def build_message(address, args):
+        msg = osc_message_builder.OscMessageBuilder(address=address)
+        if not isinstance(args, (list, tuple)):
+            args = [args]
+        for arg in args:
+            msg.add_arg(arg)
+        return msg.build()
+
+    def build_bundle(self, messages, timetag=osc_bundle_builder.IMMEDIATELY):
+        """
+        messages: iterable of (address, args)
+        timetag: system time (seconds since epoch) the receiver should apply the messages at,
+                 written as an NTP timetag, or IMMEDIATELY
+        """
+        bundle = osc_bundle_builder.OscBundleBuilder(timetag)
+        for address, args in messages:
+            bundle.add_content(self.build_message(address, args))
+        return bundle.build()
+
+    def generate_bundles(self, timed_messages):
+        """
+        batch many timed messages into as few datagrams as possible
+
+        Messages sharing a timetag go into one bundle with that timetag, and those bundles are nested
+        in IMMEDIATELY bundles that each stay under MAX_PACKET, so a whole response of note events
+        goes out in a few datagrams and receivers apply each event at its scheduled time.
+
+        timed_messages: iterable of (timetag, address, args), timetag as in build_bundle()
+        :return: (list) of OscBundles, one per datagram
+        """
+        timed_messages = sorted(timed_messages, key=lambda timed_message: timed_message[0])
+        max_content = self.MAX_PACKET - BUNDLE_HEADER_BYTES - BUNDLE_ELEMENT_SIZE_BYTES
+
+        timed_bundles = []
+        for timetag, group in groupby(timed_messages, key=lambda timed_message: timed_message[0]):
+            bundle = osc_bundle_builder.OscBundleBuilder(timetag)
+            size = BUNDLE_HEADER_BYTES
+            for _, address, args in group:
+                msg = self.build_message(address, args)
+                if size > BUNDLE_HEADER_BYTES and size + BUNDLE_ELEMENT_SIZE_BYTES + msg.size > max_content:
+                    timed_bundles.append(bundle.build())
+                    bundle = osc_bundle_builder.OscBundleBuilder(timetag)
+                    size = BUNDLE_HEADER_BYTES
+                bundle.add_content(msg)
+                size += BUNDLE_ELEMENT_SIZE_BYTES + msg.size
+            timed_bundles.append(bundle.build())
+
+        bundles = []
+        outer = osc_bundle_builder.OscBundleBuilder(osc_bundle_builder.IMMEDIATELY)
+        size = BUNDLE_HEADER_BYTES
+        for timed_bundle in timed_bundles:
+            if size > BUNDLE_HEADER_BYTES and size + BUNDLE_ELEMENT_SIZE_BYTES + timed_bundle.size > self.MAX_PACKET:
+                bundles.append(outer.build())
+                outer = osc_bundle_builder.OscBundleBuilder(osc_bundle_builder.IMMEDIATELY)
+                size = BUNDLE_HEADER_BYTES
+            outer.add_content(timed_bundle)
+            size += BUNDLE_ELEMENT_SIZE_BYTES + timed_bundle.size
+        if size > BUNDLE_HEADER_BYTES:
+            bundles.append(outer.build())
+        return bundles
 
-    def build_bundle(self):
-        bundle = osc_bundle_builder.OscBundleBuilder(osc_bundle_builder.IMMEDIATELY)
-        msg = osc_message_builder.OscMessageBuilder(address="/SYNC")
-        msg.add_arg(4.0)
-        # Add 4 messages in the bundle, each with more arguments.
-        bundle.add_content(msg.build())
-        msg.add_arg(2)
-        bundle.add_content(msg.build())
-        msg.add_arg("value")
-        bundle.add_content(msg.build())
-        msg.add_arg(b"\x01\x02\x03")
-        bundle.add_content(msg.build())
-
-        sub_bundle = bundle.build()
-        # Now add the same bundle inside itself.
-        bundle.add_content(sub_bundle)
-        # The bundle has 5 elements in total now.
-
-        bundle = bundle.build()
-        # You can now send it via a client as described in other examples.
+    def send_bundles(self, timed_messages):
+        """
+        :return: (int) number of datagrams sent
+        """
+        bundles = self.generate_bundles(timed_messages)
+        for bundle in bundles:
+            self.client.send(bundle)
+        return len(bundles)
 
 
 def build_client():
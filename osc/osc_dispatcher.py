@@ -0,0 +1,153 @@
+"""
+trie-indexed OSC address dispatcher
+
+python-osc's Dispatcher matches every incoming address pattern against every mapped
+address, so lookups get slower with each route. TrieDispatcher indexes mapped addresses
+by path segment: literal segments are dict lookups, and only the children of a node are
+scanned when a segment holds a wildcard. Resolved addresses are cached until the next
+map()/unmap().
+
+OSC address pattern syntax (http://opensoundcontrol.org/spec-1_0), within one segment:
+    ?        any single character
+    *        any sequence of zero or more characters
+    [abc]    any character in the set, ranges like [a-z], negated with [!abc]
+    {foo,ba} any of the comma separated strings
+Wildcards work in incoming address patterns as well as in mapped addresses.
+"""
+import functools
+import re
+
+from pythonosc import dispatcher
+
+_WILDCARD_CHARS = frozenset("?*[]{}")
+
+
+def is_pattern(segment):
+    return not _WILDCARD_CHARS.isdisjoint(segment)
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_segment(segment):
+    """
+    :return: compiled regex for one OSC address pattern segment
+    """
+    out = []
+    i = 0
+    while i < len(segment):
+        c = segment[i]
+        if c == "*":
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[" and "]" in segment[i + 1:]:
+            end = segment.index("]", i + 1)
+            body = segment[i + 1:end]
+            negate = body.startswith("!")
+            if negate:
+                body = body[1:]
+            body = body.replace("\\", "\\\\").replace("^", "\\^")
+            out.append("[" + ("^" if negate else "") + body + "]")
+            i = end
+        elif c == "{" and "}" in segment[i + 1:]:
+            end = segment.index("}", i + 1)
+            alternatives = segment[i + 1:end].split(",")
+            out.append("(?:" + "|".join(re.escape(a) for a in alternatives) + ")")
+            i = end
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return re.compile("".join(out))
+
+
+class _Node:
+    __slots__ = ("literals", "patterns", "address")
+
+    def __init__(self):
+        self.literals = {}
+        self.patterns = {}
+        self.address = None
+
+
+class TrieDispatcher(dispatcher.Dispatcher):
+    """
+    drop-in replacement for pythonosc.dispatcher.Dispatcher with flat lookup cost
+    """
+
+    def __init__(self, cache_size=4096):
+        super(TrieDispatcher, self).__init__()
+        self._root = _Node()
+        self._resolve = functools.lru_cache(maxsize=cache_size)(self._resolve_uncached)
+
+    def map(self, address, handler, *args, **kwargs):
+        mapped = super(TrieDispatcher, self).map(address, handler, *args, **kwargs)
+        node = self._root
+        for segment in address.split("/")[1:]:
+            children = node.patterns if is_pattern(segment) else node.literals
+            node = children.setdefault(segment, _Node())
+        node.address = address
+        self._resolve.cache_clear()
+        return mapped
+
+    def unmap(self, address, handler, *args, **kwargs):
+        super(TrieDispatcher, self).unmap(address, handler, *args, **kwargs)
+        if not self._map.get(address):
+            self._remove(address)
+        self._resolve.cache_clear()
+
+    def _remove(self, address):
+        path = [self._root]
+        segments = address.split("/")[1:]
+        for segment in segments:
+            children = path[-1].patterns if is_pattern(segment) else path[-1].literals
+            node = children.get(segment)
+            if node is None:
+                return
+            path.append(node)
+        path[-1].address = None
+        # prune nodes left without routes
+        for segment, node, parent in zip(reversed(segments), reversed(path[1:]), reversed(path[:-1])):
+            if node.address is not None or node.literals or node.patterns:
+                break
+            children = parent.patterns if is_pattern(segment) else parent.literals
+            del children[segment]
+
+    def _resolve_uncached(self, address_pattern):
+        """
+        :return: (tuple) of mapped addresses the incoming address pattern matches
+        """
+        matches = []
+        self._match(self._root, address_pattern.split("/")[1:], 0, matches)
+        return tuple(matches)
+
+    def _match(self, node, segments, i, matches):
+        if i == len(segments):
+            if node.address is not None:
+                matches.append(node.address)
+            return
+        segment = segments[i]
+        if is_pattern(segment):
+            regex = compile_segment(segment)
+            for literal, child in node.literals.items():
+                if regex.fullmatch(literal):
+                    self._match(child, segments, i + 1, matches)
+            child = node.patterns.get(segment)
+            if child is not None:
+                self._match(child, segments, i + 1, matches)
+        else:
+            child = node.literals.get(segment)
+            if child is not None:
+                self._match(child, segments, i + 1, matches)
+            for pattern, child in node.patterns.items():
+                if compile_segment(pattern).fullmatch(segment):
+                    self._match(child, segments, i + 1, matches)
+
+    def handlers_for_address(self, address_pattern):
+        handlers = []
+        for address in self._resolve(address_pattern):
+            handlers.extend(self._map.get(address, ()))
+        if not handlers and self._default_handler is not None:
+            default = self._default_handler
+            if not isinstance(default, dispatcher.Handler):
+                default = dispatcher.Handler(default, [])
+            handlers.append(default)
+        return handlers
@@ -0,0 +1,160 @@
+"""
+precompiled OSC message encoding for hot addresses
+
+OscMessageBuilder pads the address and type tag string again for every message. For the
+handful of addresses sent thousands of times a minute (/volume, /filter, /midi/0) the
+address and type tags are encoded once into a MessageTemplate, and each send only packs
+the arguments into the template's reusable buffer with struct.pack_into.
+
+Type tags follow the OSC 1.0 spec: http://opensoundcontrol.org/spec-1_0
+    i: int32, f: float32, d: float64, s: string, b: blob, T/F: True/False (no payload)
+"""
+import struct
+import threading
+
+_FIXED_FORMATS = {"i": "i", "f": "f", "d": "d", "T": "", "F": ""}
+
+
+def _padded_length(length):
+    return (length + 4) & ~0x03
+
+
+def _padded(data):
+    return data + b"\x00" * (_padded_length(len(data)) - len(data))
+
+
+def _blob_length(length):
+    return (length + 3) & ~0x03
+
+
+def typetags_for(args):
+    """
+    :return: (str) OSC type tags for the python values, without the leading comma
+    """
+    tags = []
+    for arg in args:
+        if arg is True:
+            tags.append("T")
+        elif arg is False:
+            tags.append("F")
+        elif isinstance(arg, int):
+            tags.append("i")
+        elif isinstance(arg, float):
+            tags.append("f")
+        elif isinstance(arg, str):
+            tags.append("s")
+        elif isinstance(arg, (bytes, bytearray, memoryview)):
+            tags.append("b")
+        else:
+            raise ValueError(f"unsupported OSC argument type: {type(arg)}")
+    return "".join(tags)
+
+
+class EncodedMessage:
+    """
+    quacks like a python-osc OscMessage for UDPClient.send(): exposes the encoded datagram as .dgram
+    """
+    __slots__ = ("dgram",)
+
+    def __init__(self, dgram):
+        self.dgram = dgram
+
+
+class MessageTemplate:
+    """
+    an address and type tag string encoded once, with a reusable buffer for the arguments
+    """
+
+    def __init__(self, address, typetags):
+        self.address = address
+        self.typetags = typetags
+        self.lock = threading.Lock()
+        self._head = _padded(address.encode()) + _padded(("," + typetags).encode())
+        self._fixed = all(tag in _FIXED_FORMATS for tag in typetags)
+        self._values = [i for i, tag in enumerate(typetags) if tag not in "TF"]
+        if self._fixed:
+            self._struct = struct.Struct(">" + "".join(_FIXED_FORMATS[tag] for tag in typetags))
+            self._buffer = bytearray(len(self._head) + self._struct.size)
+        else:
+            self._struct = None
+            self._buffer = bytearray(len(self._head) + 64)
+        self._buffer[:len(self._head)] = self._head
+        self._view = memoryview(self._buffer)
+        self.message = EncodedMessage(self._view)
+
+    def encode(self, *args):
+        """
+        pack the arguments into the template buffer, the returned view is only valid until the next encode()
+        :return: (memoryview) the encoded message
+        """
+        if self._fixed:
+            if len(self._values) == len(args):
+                self._struct.pack_into(self._buffer, len(self._head), *args)
+            else:
+                self._struct.pack_into(self._buffer, len(self._head), *[args[i] for i in self._values])
+            self.message.dgram = self._view
+            return self._view
+        return self._encode_variable(args)
+
+    def _encode_variable(self, args):
+        size = len(self._head)
+        for tag, arg in zip(self.typetags, args):
+            if tag == "s":
+                size += _padded_length(len(arg.encode()))
+            elif tag == "b":
+                size += 4 + _blob_length(len(arg))
+            elif tag in _FIXED_FORMATS:
+                size += struct.calcsize(_FIXED_FORMATS[tag])
+        if size > len(self._buffer):
+            # views handed out earlier keep the old buffer alive, so grow into a new one
+            self._buffer = bytearray(size * 2)
+            self._buffer[:len(self._head)] = self._head
+            self._view = memoryview(self._buffer)
+
+        offset = len(self._head)
+        for tag, arg in zip(self.typetags, args):
+            if tag == "i":
+                struct.pack_into(">i", self._buffer, offset, arg)
+                offset += 4
+            elif tag == "f":
+                struct.pack_into(">f", self._buffer, offset, arg)
+                offset += 4
+            elif tag == "d":
+                struct.pack_into(">d", self._buffer, offset, arg)
+                offset += 8
+            elif tag == "s":
+                data = arg.encode()
+                end = offset + _padded_length(len(data))
+                self._buffer[offset:offset + len(data)] = data
+                self._buffer[offset + len(data):end] = bytes(end - offset - len(data))
+                offset = end
+            elif tag == "b":
+                struct.pack_into(">i", self._buffer, offset, len(arg))
+                offset += 4
+                end = offset + _blob_length(len(arg))
+                self._buffer[offset:offset + len(arg)] = arg
+                self._buffer[offset + len(arg):end] = bytes(end - offset - len(arg))
+                offset = end
+        view = self._view[:offset]
+        self.message.dgram = view
+        return view
+
+
+class MessageTemplateCache:
+    """
+    MessageTemplates keyed by (address, type tags), built on first use
+    """
+
+    def __init__(self):
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def get(self, address, typetags):
+        template = self._templates.get((address, typetags))
+        if template is None:
+            with self._lock:
+                template = self._templates.setdefault((address, typetags), MessageTemplate(address, typetags))
+        return template
+
+    def __len__(self):
+        return len(self._templates)
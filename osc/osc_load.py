@@ -0,0 +1,219 @@
+"""
+OSC load generator and measurement harness
+
+Starts a local OscServer, drives it from a separate sender process with a weighted mix of
+messages at a target rate, and reports achieved throughput, drop rate and latency percentiles
+per message kind:
+
+    cc:     /bench/cc     float control change
+    midi:   /bench/midi   midi blob, size drawn from --midi_sizes, at most MAX_MIDI_BLOB bytes
+    bundle: /bench/note   --bundle_size note messages in one IMMEDIATELY bundle
+
+Every message carries its send time (seconds since the run's base time, as a double) and a
+sequence number, so the server side handler can measure latency and count what arrived.
+
+usage:
+    python -m osc.osc_load --mix cc:0.8,midi:0.15,bundle:0.05 --rate 2000 --duration 10
+    invoke bench-osc --rate 5000 --mode asyncio
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import time
+
+from pythonosc import osc_message_builder
+
+from osc.midi_transport import RECEIVER_MAX_PACKET
+from osc.osc_client import OscClient
+from osc.osc_server import OscServer, SERVER_MODES
+
+KINDS = ("cc", "midi", "bundle")
+ADDRESSES = {"cc": "/bench/cc", "midi": "/bench/midi", "bundle": "/bench/note"}
+
+
+def midi_header_bytes():
+    """
+    :return: (int) encoded size of a /bench/midi message with an empty blob: address, type tags,
+        the send time, the sequence number and the blob size
+    """
+    msg = osc_message_builder.OscMessageBuilder(address=ADDRESSES["midi"])
+    msg.add_arg(0.0, arg_type="d")
+    msg.add_arg(0)
+    # measured with a one word blob, some python-osc versions refuse empty blobs
+    msg.add_arg(b"\0" * 4)
+    return msg.build().size - 4
+
+
+# largest blob whose message the server reads whole, longer datagrams are cut short
+MAX_MIDI_BLOB = (RECEIVER_MAX_PACKET - midi_header_bytes()) // 4 * 4
+DEFAULT_MIDI_SIZES = (256, 2048, MAX_MIDI_BLOB)
+
+
+def parse_mix(mix):
+    """
+    "cc:0.8,midi:0.2" -> {"cc": 0.8, "midi": 0.2}
+    """
+    weights = {}
+    for part in mix.split(","):
+        kind, weight = part.split(":")
+        if kind not in KINDS:
+            raise ValueError(f"unknown message kind '{kind}', expected one of {KINDS}")
+        weights[kind] = float(weight)
+    return weights
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100.0))]
+
+
+def send_load(ip, port, base_time, weights, rate, duration, midi_sizes, bundle_size, results, seed=0):
+    """
+    sender process: sends the message mix at the target rate, puts per kind send counts on results
+    """
+    rng = random.Random(seed)
+    client = OscClient(ip, port)
+    cc = client.message_template(ADDRESSES["cc"], "dif")
+    midi = client.message_template(ADDRESSES["midi"], "dib")
+    blobs = [os.urandom(size) for size in midi_sizes]
+    kinds = list(weights)
+    cumulative = [sum(list(weights.values())[:i + 1]) for i in range(len(kinds))]
+    sent = dict.fromkeys(KINDS, 0)
+
+    interval = 1.0 / rate
+    next_send = time.time()
+    end = next_send + duration
+    seq = 0
+    while next_send < end:
+        kind = rng.choices(kinds, cum_weights=cumulative)[0]
+        now = time.time() - base_time
+        if kind == "cc":
+            client.send_template(cc, now, seq, rng.random())
+            sent[kind] += 1
+        elif kind == "midi":
+            client.send_template(midi, now, seq, rng.choice(blobs))
+            sent[kind] += 1
+        else:
+            client.client.send(client.build_bundle(
+                [(ADDRESSES["bundle"], [now, seq, 60 + i % 12, 100]) for i in range(bundle_size)]))
+            sent[kind] += bundle_size
+        seq += 1
+        next_send += interval
+        delay = next_send - time.time()
+        if delay > 0:
+            time.sleep(delay)
+    results.put(sent)
+
+
+class LoadReceiver:
+    """
+    server side handlers recording latency per message kind
+    """
+
+    def __init__(self, base_time):
+        self.base_time = base_time
+        self.latencies = {kind: [] for kind in KINDS}
+        self.first_received = None
+        self.last_received = None
+
+    def _record(self, kind, sent_at):
+        now = time.time()
+        if self.first_received is None:
+            self.first_received = now
+        self.last_received = now
+        self.latencies[kind].append(now - self.base_time - sent_at)
+
+    def on_cc(self, unused_addr, sent_at, seq, value):
+        self._record("cc", sent_at)
+
+    def on_midi(self, unused_addr, sent_at, seq, payload):
+        self._record("midi", sent_at)
+
+    def on_note(self, unused_addr, sent_at, seq, pitch, velocity):
+        self._record("bundle", sent_at)
+
+    def map(self, dispatcher):
+        dispatcher.map(ADDRESSES["cc"], self.on_cc)
+        dispatcher.map(ADDRESSES["midi"], self.on_midi)
+        dispatcher.map(ADDRESSES["bundle"], self.on_note)
+
+
+def run_load(ip="127.0.0.1", port=5305, mode="threading", mix="cc:0.8,midi:0.15,bundle:0.05", rate=2000.0,
+             duration=5.0, midi_sizes=DEFAULT_MIDI_SIZES, bundle_size=16, drain=1.0):
+    """
+    :return: (dict) per kind {sent, received, drop_rate, throughput, p50, p90, p99, max}, latencies in seconds
+    """
+    weights = parse_mix(mix)
+    if max(midi_sizes) > MAX_MIDI_BLOB:
+        raise ValueError(f"midi sizes above {MAX_MIDI_BLOB} bytes don't fit in one {RECEIVER_MAX_PACKET} byte "
+                         f"datagram, send larger midi through MidiChunker")
+    base_time = time.time()
+    receiver = LoadReceiver(base_time)
+    server = OscServer(ip, port, mode=mode)
+    receiver.map(server.dispatcher)
+    server.daemon = True
+    server.start()
+    time.sleep(0.2)
+
+    results = multiprocessing.Queue()
+    sender = multiprocessing.Process(
+        target=send_load,
+        args=(ip, port, base_time, weights, rate, duration, list(midi_sizes), bundle_size, results))
+    sender.start()
+    sent = results.get(timeout=duration + 10)
+    sender.join()
+    time.sleep(drain)
+    server.shutdown()
+
+    elapsed = (receiver.last_received - receiver.first_received) if receiver.first_received else duration
+    report = {}
+    for kind in KINDS:
+        latencies = sorted(receiver.latencies[kind])
+        if not sent[kind]:
+            continue
+        report[kind] = {
+            "sent": sent[kind],
+            "received": len(latencies),
+            "drop_rate": 1 - len(latencies) / sent[kind],
+            "throughput": len(latencies) / elapsed if elapsed else float("nan"),
+            "p50": percentile(latencies, 50),
+            "p90": percentile(latencies, 90),
+            "p99": percentile(latencies, 99),
+            "max": latencies[-1] if latencies else float("nan"),
+        }
+    return report
+
+
+def print_report(report, mode, rate):
+    print("mode={} target_rate={:.0f}/s".format(mode, rate))
+    print("{:<7} {:>8} {:>9} {:>7} {:>10} {:>9} {:>9} {:>9} {:>9}".format(
+        "kind", "sent", "received", "drop", "msgs/s", "p50 ms", "p90 ms", "p99 ms", "max ms"))
+    for kind, stats in report.items():
+        print("{:<7} {:>8} {:>9} {:>6.2%} {:>10.0f} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f}".format(
+            kind, stats["sent"], stats["received"], stats["drop_rate"], stats["throughput"],
+            1000 * stats["p50"], 1000 * stats["p90"], 1000 * stats["p99"], 1000 * stats["max"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ip", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5305)
+    parser.add_argument("--mode", default="threading", choices=SERVER_MODES)
+    parser.add_argument("--mix", default="cc:0.8,midi:0.15,bundle:0.05", help="kind:weight,...")
+    parser.add_argument("--rate", type=float, default=2000.0, help="target sends per second")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds")
+    parser.add_argument("--midi_sizes", default=",".join(map(str, DEFAULT_MIDI_SIZES)),
+                        help=f"midi blob sizes in bytes, at most {MAX_MIDI_BLOB}")
+    parser.add_argument("--bundle_size", type=int, default=16, help="note messages per bundle")
+    args = parser.parse_args(argv)
+
+    report = run_load(args.ip, args.port, args.mode, args.mix, args.rate, args.duration,
+                      [int(size) for size in args.midi_sizes.split(",")], args.bundle_size)
+    print_report(report, args.mode, args.rate)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,35 @@
+import asyncio
 import math
-from pythonosc import dispatcher
 from pythonosc import osc_server
 
 from osc.osc_helper import OscHandler
+from osc.osc_dispatcher import TrieDispatcher
+
+SERVER_MODES = ("threading", "asyncio")
 
 
 class OscServer(OscHandler):
     """
     must override: construct_dispatchers()
     https://python-osc.readthedocs.io/en/latest/
+
+    mode:
+        threading: ThreadingOSCUDPServer, a thread per datagram
+        asyncio: AsyncIOOSCUDPServer, every handler runs on one event loop.
+                 Slow work (e.g. generation) should be handed off by the handler, as
+                 SynOscServer does with its GenerationQueue
     """
 
-    def __init__(self, ip, port):
+    def __init__(self, ip, port, mode="threading"):
         OscHandler.__init__(self, ip, port)
+        if mode not in SERVER_MODES:
+            raise ValueError(f"unknown OSC server mode '{mode}', expected one of {SERVER_MODES}")
         self.ip = ip
         self.port = port
-        self.dispatcher = dispatcher.Dispatcher()
+        self.mode = mode
+        self.dispatcher = TrieDispatcher()
+        self.server = None
+        self.loop = None
 
     def construct_dispatchers(self):
         # override
@@ -32,9 +46,34 @@ class OscServer(OscHandler):
         TODO: handle params to start different kinds of servers
         with SynMagEther(gen_muse, qpm, start_time, signals=None, channel=None) as sme:
         """
-        server = osc_server.ThreadingOSCUDPServer((self.ip, self.port), self.dispatcher)
-        print("Serving on {}".format(server.server_address))
-        server.serve_forever()
+        if self.mode == "asyncio":
+            self.run_asyncio_server()
+        else:
+            self.run_threading_server()
+
+    def run_threading_server(self):
+        self.server = osc_server.ThreadingOSCUDPServer((self.ip, self.port), self.dispatcher)
+        print("Serving on {}".format(self.server.server_address))
+        self.server.serve_forever()
+
+    def run_asyncio_server(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.server = osc_server.AsyncIOOSCUDPServer((self.ip, self.port), self.dispatcher, self.loop)
+        transport, _ = self.loop.run_until_complete(self.server.create_serve_endpoint())
+        print("Serving on {}".format(transport.get_extra_info("sockname")))
+        try:
+            self.loop.run_forever()
+        finally:
+            transport.close()
+            self.loop.close()
+
+    def shutdown(self):
+        if self.mode == "asyncio":
+            if self.loop is not None:
+                self.loop.call_soon_threadsafe(self.loop.stop)
+        elif self.server is not None:
+            self.server.shutdown()
 
     def print_volume_handler(self, unused_addr, args, volume):
         print("[{0}] ~ {1}".format(args[0], volume))
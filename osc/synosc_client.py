@@ -1,14 +1,22 @@
 from osc.osc_client import OscClient
+from osc.midi_transport import MidiChunker, MIDI_CHUNK_ADDRESS, MIDI_RESEND_ADDRESS, RECEIVER_MAX_PACKET
 from generators.models.melody_rnn import SynMelodyRNN
 from utils.wrench import get_abs_fnames_in_dir
+from pythonosc import osc_message
+import logging
 import os
+import select
+import threading
 
-class SynOscClient(OscClient):
+logger = logging.getLogger(__name__)
 
-    MAX_PACKET = 9200  # length of bytes http://opensoundcontrol.org/topic/247
+class SynOscClient(OscClient):
 
     def __init__(self, ip, port):
         OscClient.__init__(self, ip, port)
+        self.midi_chunker = MidiChunker(self.MAX_PACKET)
+        self.resend_listener = None
+        self.stop_signal = threading.Event()
 
     def generate_messages(self):
         midi_fname = f"{os.environ['SYNOSC_PATH']}/data/primer.mid"
@@ -17,34 +25,77 @@ class SynOscClient(OscClient):
         out_dir = os.path.join(os.path.dirname(__file__), "..", "tmp", "data")
         self.send_midi_dir(out_dir)
 
+    def send_midi_bytes(self, midi_bytes):
+        """
+        send midi bytes as chunks that fit the receiving server's datagrams, see osc.midi_transport
+        """
+        msg_id, chunks = self.midi_chunker.chunk(midi_bytes)
+        for chunk in chunks:
+            self.send_message(MIDI_CHUNK_ADDRESS, chunk)
+        if self.resend_listener is None:
+            # the socket is only bound to a port by its first send
+            self.resend_listener = threading.Thread(target=self.listen_for_resends, daemon=True)
+            self.resend_listener.start()
+        return msg_id
+
+    def resend_midi_chunks(self, unused_addr, msg_id, *seqs):
+        """
+        handler for resend requests from the receiving SynOscServer
+        """
+        for chunk in self.midi_chunker.resend(msg_id, seqs):
+            self.send_message(MIDI_CHUNK_ADDRESS, chunk)
+
+    def listen_for_resends(self, poll_interval=0.1):
+        """
+        serve the receiver's resend requests, which come back to the (non blocking) socket chunks are sent from
+        """
+        sock = self.client._sock
+        while not self.stop_signal.is_set():
+            readable, _, _ = select.select([sock], [], [], poll_interval)
+            if not readable:
+                continue
+            try:
+                data, _ = sock.recvfrom(RECEIVER_MAX_PACKET)
+                message = osc_message.OscMessage(data)
+            except BlockingIOError:
+                continue
+            except (OSError, osc_message.ParseError) as e:
+                logger.warning("unreadable datagram on the midi send socket: %s", e)
+                continue
+            if message.address == MIDI_RESEND_ADDRESS:
+                self.resend_midi_chunks(message.address, *message.params)
+
+    def shutdown(self):
+        self.stop_signal.set()
+
     def send_midi_dir(self, out_midi_dir):
-        for midi_file in get_abs_fnames_in_dir(out_midi_dir):
-            with open(midi_file, "rb") as f:
-                midi_bytes = f.read()
-                self.client.send_message("/midi/0", [midi_bytes])
-            break
-    # def build_bundle(self):
-    #     bundle = osc_bundle_builder.OscBundleBuilder(osc_bundle_builder.IMMEDIATELY)
-    #     msg = osc_message_builder.OscMessageBuilder(address="/SYNC")
-    #     msg.add_arg(4.0)
-    #     # Add 4 messages in the bundle, each with more arguments.
-    #     bundle.add_content(msg.build())
-    #     msg.add_arg(2)
-    #     bundle.add_content(msg.build())
-    #     msg.add_arg("value")
-    #     bundle.add_content(msg.build())
-    #     msg.add_arg(b"\x01\x02\x03")
-    #     bundle.add_content(msg.build())
-    #
-    #     sub_bundle = bundle.build()
-    #     # Now add the same bundle inside itself.
-    #     bundle.add_content(sub_bundle)
-    #     # The bundle has 5 elements in total now.
-    #
-    #     bundle = bundle.build()
-    #     # You can now send it via a client as described in other examples.
+        """
+        send the first output of the latest run in the directory
+        """
+        # melody_rnn_generate names its outputs <date_time>_<number>.mid, ranked outputs are numbered best first
+        midi_files = sorted(get_abs_fnames_in_dir(out_midi_dir))
+        if not midi_files:
+            return
+        latest_run = os.path.basename(midi_files[-1]).rsplit("_", 1)[0]
+        for midi_file in midi_files:
+            if os.path.basename(midi_file).rsplit("_", 1)[0] == latest_run:
+                return self.send_midi_file(midi_file)
 
+    def send_midi_file(self, midi_file):
+        with open(midi_file, "rb") as f:
+            return self.send_midi_bytes(f.read())
 
+    def send_note_events(self, sequence, start_time, address="/note"):
+        """
+        schedule a NoteSequence as timetagged /note [pitch, velocity] events, velocity 0 for note off
+        start_time: system time of the sequence's time 0, e.g. SynMetronome.next_beat_time()
+        :return: (int) number of datagrams sent
+        """
+        timed_messages = []
+        for note in sequence.notes:
+            timed_messages.append((start_time + note.start_time, address, [note.pitch, note.velocity]))
+            timed_messages.append((start_time + note.end_time, address, [note.pitch, 0]))
+        return self.send_bundles(timed_messages)
 
 
 def build_client():
@@ -1,42 +1,114 @@
-import pretty_midi
 import logging
+import socket
+import threading
 
 from generators.orchestrator import build_ether
+from generators.generation_queue import GenerationQueue
+from osc.osc_client import OscClient
 from osc.osc_server import OscServer
+from osc.midi_transport import MidiReassembler, MIDI_CHUNK_ADDRESS, MIDI_RESEND_ADDRESS
 
 logger = logging.getLogger( __name__)
-ether = build_ether()
 
 
 class SynOscServer(OscServer):
     def __init__(self, ether):
+        self.ether = ether
         ip = ether.muse.syn_config['default_ip']
         port = ether.muse.syn_config['default_port']
-        OscServer.__init__(self, ip, port)
+        OscServer.__init__(self, ip, port, mode=ether.muse.syn_config['osc_server_mode'])
+        transport_config = ether.muse.syn_config['midi_transport']
+        self.midi_reassembler = MidiReassembler(
+            timeout=transport_config['reassembly_timeout'],
+            resend_after=transport_config['resend_after'],
+            max_resends=transport_config['max_resends'],
+        )
+        # resend requests go back to the address chunks came from unless overridden
+        self.resend_ip = transport_config.get('resend_ip')
+        self.resend_port = transport_config.get('resend_port')
+        self.resend_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.stop_signal = threading.Event()
+        # non blocking synth streams still open, closed once they finish or on shutdown
+        self.synth_streams = set()
+        self.synth_streams_lock = threading.Lock()
+        self.generation_queue = GenerationQueue.from_config(ether.muse.play_from_midi_bytes, ether.muse.syn_config)
+
+    def run(self):
+        threading.Thread(target=self.poll_midi_reassembler, daemon=True).start()
+        self.generation_queue.start()
+        OscServer.run(self)
 
     def synthesize(self, unused_addr, args):
+        """
+        play a midi file through the default output device, streamed a block at a time
+        """
+        from utils.note_array import NoteArray
+        from utils.streaming_synth import StreamingSynth
+
         # TODO take the midi file as an argument
         print(f"args: {args}")
         midi_fname = args
-        midi_data = pretty_midi.PrettyMIDI(midi_fname)
-        audio_data = midi_data.synthesize()
-        print(f"audio_data: {audio_data}")
-        # sd.play(audio_data, sps)
-        return audio_data
+        syn_config = self.ether.muse.syn_config
+        synth_config = syn_config['synth']
+        synth = StreamingSynth(NoteArray.from_file(midi_fname), fs=syn_config['sps'],
+                               block_size=synth_config['block_size'], max_voices=synth_config['max_voices'])
+        stream = synth.play(block=False, finished_callback=self._synth_finished)
+        with self.synth_streams_lock:
+            self.synth_streams.add(stream)
+        return synth
+
+    def _synth_finished(self, stream):
+        # portaudio can't close a stream from its own finished callback
+        threading.Thread(target=self.close_synth_stream, args=(stream,), daemon=True).start()
+
+    def close_synth_stream(self, stream):
+        with self.synth_streams_lock:
+            if stream not in self.synth_streams:
+                return
+            self.synth_streams.discard(stream)
+        stream.close(ignore_errors=True)
+
+    def receive_midi_chunk(self, client_address, unused_addr, msg_id, seq, total, payload):
+        midi_bytes = self.midi_reassembler.add_chunk(msg_id, seq, total, payload, source=client_address)
+        if midi_bytes is not None:
+            self.receive_midi_bytes(unused_addr, midi_bytes)
+
+    def shutdown(self):
+        self.stop_signal.set()
+        self.generation_queue.stop()
+        with self.synth_streams_lock:
+            streams = list(self.synth_streams)
+        for stream in streams:
+            self.close_synth_stream(stream)
+        OscServer.shutdown(self)
+
+    def poll_midi_reassembler(self):
+        """
+        drop timed out chunked messages and ask the sender for missing chunks
+        """
+        while not self.stop_signal.wait(self.midi_reassembler.resend_after / 2):
+            for source, msg_id, missing in self.midi_reassembler.poll():
+                logger.info("requesting %d missing chunks of midi message %d from %s", len(missing), msg_id, source)
+                address = (self.resend_ip or source[0], self.resend_port or source[1])
+                self.resend_sock.sendto(OscClient.build_message(MIDI_RESEND_ADDRESS, [msg_id] + missing).dgram, address)
 
     def receive_midi_bytes(self, unused_addr, args):
-        print(f"args: {args}")
+        """
+        queue the phrase for the generation worker instead of generating inside the UDP handler
+        """
         midi_bytes = args
-        ether.muse.play_from_midi_mock(midi_bytes)
+        self.generation_queue.submit(midi_bytes)
+        logger.debug("generation queue: %s", self.generation_queue.metrics())
 
     def construct_dispatchers(self):
         self.dispatcher.map("/midi/0", self.receive_midi_bytes)
+        self.dispatcher.map(MIDI_CHUNK_ADDRESS, self.receive_midi_chunk, needs_reply_address=True)
         # self.dispatcher.map("/midi/1", self.magenta)
         return self
 
 
 def build_server():
-    server = SynOscServer(ether)
+    server = SynOscServer(build_ether())
     server = server.construct_dispatchers()
     server.start()
 
@@ -0,0 +1,55 @@
+"""
+cold vs warm melody generation latency
+
+cold: SynMelodyRNN.midi_prior_generates_midi_melody (generate-rnn-midi.sh subprocess per request)
+warm: SynMelodyRNN instance with the bundle loaded once in-process
+
+usage:
+    python scripts/bench_generation.py --primer $SYNOSC_PATH/data/primer.mid --runs 5
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from generators.models.melody_rnn import SynMelodyRNN
+
+
+def time_calls(fn, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(name, timings):
+    print("{:<6} runs={:<3} mean={:.3f}s median={:.3f}s min={:.3f}s max={:.3f}s".format(
+        name, len(timings), statistics.mean(timings), statistics.median(timings), min(timings), max(timings)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--primer", default=os.path.join(os.environ.get("SYNOSC_PATH", "."), "data", "primer.mid"),
+                        help="primer midi file")
+    parser.add_argument("--runs", type=int, default=5, help="requests per mode")
+    parser.add_argument("--num_outputs", type=int, default=10, help="melodies per request")
+    parser.add_argument("--skip_cold", action="store_true", help="only measure the warm generator")
+    args = parser.parse_args()
+
+    if not args.skip_cold:
+        with tempfile.TemporaryDirectory() as out_dir:
+            report("cold", time_calls(
+                lambda: SynMelodyRNN.midi_prior_generates_midi_melody(args.primer, out_dir), args.runs))
+
+    melody_rnn = SynMelodyRNN(num_outputs=args.num_outputs)
+    load_time = time_calls(melody_rnn.load, 1)[0]
+    print("warm bundle load (paid once): {:.3f}s".format(load_time))
+    with tempfile.TemporaryDirectory() as out_dir:
+        report("warm", time_calls(lambda: melody_rnn.generate_to_dir(args.primer, out_dir), args.runs))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+per tick cost of key estimation, and agreement with get_musical_key on offline files
+
+    offline: ChromaAccumulator over each file's NoteArray vs get_musical_key(PrettyMIDI)
+    per tick: each file is replayed one note per tick into a ChromaAccumulator, estimating the key
+              every tick, against recomputing get_musical_key + estimate_key on a PrettyMIDI holding
+              the notes so far (sampled every --batch_every notes, it grows quadratically)
+
+usage:
+    python scripts/bench_key_estimation.py $SYNOSC_PATH/data
+"""
+import argparse
+import io
+import os
+import time
+
+import numpy as np
+import pretty_midi
+
+from utils.key_estimator import ChromaAccumulator, estimate_key
+from utils.midi_util import get_musical_key
+from utils.note_array import NoteArray
+
+
+def midi_files(directories):
+    for directory in directories:
+        for root, _, fnames in os.walk(directory):
+            for fname in sorted(fnames):
+                if fname.lower().endswith((".mid", ".midi")):
+                    yield os.path.join(root, fname)
+
+
+def replay_incremental(note_array):
+    """
+    :return: (seconds per tick, final key)
+    """
+    accumulator = ChromaAccumulator()
+    notes = note_array.notes
+    key = None
+    started = time.perf_counter()
+    for pitch, velocity, start, end, is_drum in zip(notes["pitch"].tolist(), notes["velocity"].tolist(),
+                                                    notes["start"].tolist(), notes["end"].tolist(),
+                                                    notes["is_drum"].tolist()):
+        accumulator.add(pitch, velocity, start, end, is_drum)
+        key = accumulator.key()
+    return (time.perf_counter() - started) / max(len(notes), 1), key
+
+
+def replay_batch(note_array, every):
+    """
+    :return: (seconds per tick) recomputing the key from a PrettyMIDI of the notes so far
+    """
+    midi_data = pretty_midi.PrettyMIDI()
+    instrument = pretty_midi.Instrument(0)
+    midi_data.instruments.append(instrument)
+    timings = []
+    for i, note in enumerate(note_array.notes[~note_array.notes["is_drum"]]):
+        instrument.notes.append(pretty_midi.Note(int(note["velocity"]), int(note["pitch"]),
+                                                 float(note["start"]), float(note["end"])))
+        if i % every == 0:
+            started = time.perf_counter()
+            estimate_key(get_musical_key(midi_data))
+            timings.append(time.perf_counter() - started)
+    return float(np.mean(timings)) if timings else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("corpus", nargs="+", help="directories searched for .mid files")
+    parser.add_argument("--batch_every", type=int, default=100, help="notes between timed batch recomputations")
+    args = parser.parse_args()
+
+    print("{:<32} {:>6} {:>12} {:>14} {:>14} {:>12}".format(
+        "file", "notes", "max diff", "us/tick incr", "us/tick batch", "key"))
+    for fname in midi_files(args.corpus):
+        with open(fname, "rb") as f:
+            midi_bytes = f.read()
+        note_array = NoteArray.from_midi_bytes(midi_bytes)
+        midi_data = pretty_midi.PrettyMIDI(io.BytesIO(midi_bytes))
+        if not len(note_array):
+            continue
+
+        accumulator = ChromaAccumulator()
+        accumulator.add_note_array(note_array)
+        difference = np.abs(accumulator.profile() - np.array(get_musical_key(midi_data))).max()
+        incremental, (key_name, _) = replay_incremental(note_array)
+        batch = replay_batch(note_array, args.batch_every)
+        print("{:<32} {:>6} {:>12.2e} {:>14.1f} {:>14.1f} {:>12}".format(
+            os.path.basename(fname)[:32], len(note_array), difference, incremental * 1e6, batch * 1e6, key_name))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+throughput and loss of the chunked MIDI-over-OSC transport through a lossy UDP proxy
+
+    sender --> proxy (drops --loss of datagrams) --> receiver
+       ^                                                |
+       +------------- /midi/0/resend requests ----------+
+
+usage:
+    python scripts/bench_midi_transport.py --loss 0.05 --size 65536 --messages 200
+"""
+import argparse
+import os
+import random
+import socket
+import threading
+import time
+
+from pythonosc import dispatcher
+from pythonosc import osc_server
+from pythonosc import udp_client
+
+from osc.midi_transport import MidiChunker, MidiReassembler, MIDI_CHUNK_ADDRESS, MIDI_RESEND_ADDRESS
+from osc.synosc_client import SynOscClient
+
+
+class LossyUdpProxy(threading.Thread):
+    """
+    forwards datagrams from listen_port to target_port, dropping a fraction of them
+    """
+
+    def __init__(self, ip, listen_port, target_port, loss, seed=0):
+        super(LossyUdpProxy, self).__init__(daemon=True)
+        self.target = (ip, target_port)
+        self.loss = loss
+        self.random = random.Random(seed)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((ip, listen_port))
+        self.forwarded = 0
+        self.dropped = 0
+
+    def run(self):
+        out = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        while True:
+            data = self.sock.recv(65536)
+            if self.random.random() < self.loss:
+                self.dropped += 1
+            else:
+                self.forwarded += 1
+                out.sendto(data, self.target)
+
+
+def serve(ip, port, disp):
+    server = osc_server.ThreadingOSCUDPServer((ip, port), disp)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ip", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5105, help="first of three consecutive ports to use")
+    parser.add_argument("--loss", type=float, default=0.05, help="fraction of datagrams the proxy drops")
+    parser.add_argument("--size", type=int, default=64 * 1024, help="bytes per midi message")
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=50.0, help="messages per second")
+    parser.add_argument("--timeout", type=float, default=1.0, help="reassembly timeout in seconds")
+    args = parser.parse_args()
+
+    receiver_port, proxy_port, sender_port = args.port, args.port + 1, args.port + 2
+    proxy = LossyUdpProxy(args.ip, proxy_port, receiver_port, args.loss)
+    proxy.start()
+
+    chunker = MidiChunker(SynOscClient.MAX_PACKET, history=args.messages)
+    sender = udp_client.SimpleUDPClient(args.ip, proxy_port)
+    reassembler = MidiReassembler(timeout=args.timeout)
+    delivered = []
+
+    def on_chunk(unused_addr, msg_id, seq, total, payload):
+        if reassembler.add_chunk(msg_id, seq, total, payload) is not None:
+            delivered.append(time.perf_counter())
+
+    def on_resend(unused_addr, msg_id, *seqs):
+        for chunk in chunker.resend(msg_id, seqs):
+            sender.send_message(MIDI_CHUNK_ADDRESS, chunk)
+
+    receive_dispatcher = dispatcher.Dispatcher()
+    receive_dispatcher.map(MIDI_CHUNK_ADDRESS, on_chunk)
+    receiver = serve(args.ip, receiver_port, receive_dispatcher)
+    resend_dispatcher = dispatcher.Dispatcher()
+    resend_dispatcher.map(MIDI_RESEND_ADDRESS, on_resend)
+    resend_server = serve(args.ip, sender_port, resend_dispatcher)
+    resend_client = udp_client.SimpleUDPClient(args.ip, sender_port)
+
+    stop = threading.Event()
+
+    def poll():
+        while not stop.wait(reassembler.resend_after / 2):
+            # chunks arrive from the proxy, so resends go to the sender's own port as with resend_ip / resend_port
+            for _, msg_id, missing in reassembler.poll():
+                resend_client.send_message(MIDI_RESEND_ADDRESS, [msg_id] + missing)
+
+    threading.Thread(target=poll, daemon=True).start()
+
+    payload = os.urandom(args.size)
+    start = time.perf_counter()
+    for _ in range(args.messages):
+        _, chunks = chunker.chunk(payload)
+        for chunk in chunks:
+            sender.send_message(MIDI_CHUNK_ADDRESS, chunk)
+        time.sleep(1.0 / args.rate)
+    deadline = time.perf_counter() + args.timeout * 2
+    while reassembler.pending() and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    stop.set()
+    receiver.shutdown()
+    resend_server.shutdown()
+
+    elapsed = (delivered[-1] if delivered else time.perf_counter()) - start
+    stats = reassembler.stats
+    print("proxy: forwarded={} dropped={} ({:.1%} configured loss)".format(
+        proxy.forwarded, proxy.dropped, args.loss))
+    print("messages: sent={} delivered={} dropped={} ({:.2%} loss)".format(
+        args.messages, stats["messages_completed"], stats["messages_dropped"],
+        1 - stats["messages_completed"] / args.messages))
+    print("chunks: received={} duplicates={} resend_requests={}".format(
+        stats["chunks_received"], stats["duplicate_chunks"], stats["resend_requests"]))
+    print("throughput: {:.1f} messages/s, {:.2f} MB/s".format(
+        len(delivered) / elapsed, len(delivered) * args.size / elapsed / 1e6))
+
+
+if __name__ == "__main__":
+    main()
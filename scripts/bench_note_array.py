@@ -0,0 +1,89 @@
+"""
+NoteArray vs PrettyMIDI: parse time and memory per 100k notes
+
+Every .mid file under the corpus directories is parsed from bytes by both. Memory is the peak traced
+allocation while parsing and keeping the result, so it covers the per-note objects PrettyMIDI holds.
+The utilities of utils.midi_util are run on both to check they agree.
+
+usage:
+    python scripts/bench_note_array.py $SYNOSC_PATH/data --repeat 3
+"""
+import argparse
+import io
+import os
+import time
+import tracemalloc
+
+import numpy as np
+import pretty_midi
+
+from utils.midi_util import estimate_tempo, get_musical_key
+from utils.note_array import NoteArray
+
+PER_NOTES = 100000
+
+
+def midi_files(directories):
+    for directory in directories:
+        for root, _, fnames in os.walk(directory):
+            for fname in sorted(fnames):
+                if fname.lower().endswith((".mid", ".midi")):
+                    yield os.path.join(root, fname)
+
+
+def measure(parse, corpus, repeat):
+    """
+    :return: (best seconds, peak traced bytes, parsed objects) to parse the whole corpus
+    """
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for midi_bytes in corpus:
+            parse(midi_bytes)
+        timings.append(time.perf_counter() - started)
+    tracemalloc.start()
+    parsed = [parse(midi_bytes) for midi_bytes in corpus]
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(timings), peak, parsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("corpus", nargs="+", help="directories searched for .mid files")
+    parser.add_argument("--repeat", type=int, default=3, help="timed passes over the corpus, the best is reported")
+    args = parser.parse_args()
+
+    corpus = []
+    for fname in midi_files(args.corpus):
+        with open(fname, "rb") as f:
+            corpus.append(f.read())
+    if not corpus:
+        parser.error("no midi files found")
+
+    note_seconds, note_peak, note_arrays = measure(NoteArray.from_midi_bytes, corpus, args.repeat)
+    pretty_seconds, pretty_peak, pretty_midis = measure(
+        lambda midi_bytes: pretty_midi.PrettyMIDI(io.BytesIO(midi_bytes)), corpus, args.repeat)
+
+    notes = sum(len(note_array) for note_array in note_arrays)
+    pretty_notes = sum(len(instrument.notes) for midi_data in pretty_midis for instrument in midi_data.instruments)
+    print("files={} notes={} (pretty_midi notes={}) bytes={}".format(
+        len(corpus), notes, pretty_notes, sum(len(midi_bytes) for midi_bytes in corpus)))
+    scale = PER_NOTES / max(notes, 1)
+    print("{:<12} {:>16} {:>16}".format("parser", "s / 100k notes", "MB / 100k notes"))
+    for name, seconds, peak in (("NoteArray", note_seconds, note_peak), ("pretty_midi", pretty_seconds, pretty_peak)):
+        print("{:<12} {:>16.3f} {:>16.2f}".format(name, seconds * scale, peak * scale / 1e6))
+    print("speedup x{:.1f}, memory x{:.1f}".format(pretty_seconds / note_seconds, pretty_peak / max(note_peak, 1)))
+
+    tempo_mismatches = key_errors = 0
+    for note_array, midi_data in zip(note_arrays, pretty_midis):
+        if len(note_array.get_onsets()) < 2:
+            continue
+        tempo_mismatches += not np.isclose(estimate_tempo(note_array), estimate_tempo(midi_data), rtol=1e-3)
+        key_errors = max(key_errors, np.abs(np.subtract(get_musical_key(note_array),
+                                                        get_musical_key(midi_data))).max())
+    print("estimate_tempo mismatches={} get_musical_key max difference={:.2e}".format(tempo_mismatches, key_errors))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+address lookup cost of python-osc's Dispatcher vs TrieDispatcher as routes grow
+
+routes follow the per-channel/instrument/parameter address space: /ch/<n>/<instrument>/<parameter>
+
+usage:
+    python scripts/bench_osc_dispatcher.py --lookups 20000
+"""
+import argparse
+import random
+import timeit
+
+from pythonosc import dispatcher
+
+from osc.osc_dispatcher import TrieDispatcher
+
+INSTRUMENTS = ["piano", "drums", "cello", "bass", "synth"]
+PARAMETERS = ["volume", "filter", "pan", "reverb", "delay", "attack", "release", "cutoff"]
+
+
+def routes(count):
+    channel = 0
+    while True:
+        for instrument in INSTRUMENTS:
+            for parameter in PARAMETERS:
+                yield "/ch/{}/{}/{}".format(channel, instrument, parameter)
+                count -= 1
+                if not count:
+                    return
+        channel += 1
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lookups", type=int, default=20000)
+    parser.add_argument("--sizes", default="10,100,1000,5000")
+    args = parser.parse_args()
+
+    for size in [int(size) for size in args.sizes.split(",")]:
+        addresses = list(routes(size))
+        incoming = [random.choice(addresses) for _ in range(args.lookups)]
+        wildcard = ["/ch/{}/*/volume".format(random.randrange(size // 40 + 1)) for _ in range(args.lookups)]
+        for name, disp in (("Dispatcher", dispatcher.Dispatcher()), ("TrieDispatcher", TrieDispatcher())):
+            for address in addresses:
+                disp.map(address, print)
+            literal = timeit.timeit(lambda: [list(disp.handlers_for_address(a)) for a in incoming], number=1)
+            pattern = timeit.timeit(lambda: [list(disp.handlers_for_address(a)) for a in wildcard], number=1)
+            print("routes={:<6} {:<15} literal {:>8.2f} us/lookup  wildcard {:>8.2f} us/lookup".format(
+                size, name, 1e6 * literal / args.lookups, 1e6 * pattern / args.lookups))
+
+
+if __name__ == "__main__":
+    main()
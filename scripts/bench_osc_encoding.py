@@ -0,0 +1,60 @@
+"""
+micro-benchmark: OscMessageBuilder vs cached MessageTemplate encoding
+
+usage:
+    python scripts/bench_osc_encoding.py --number 100000
+"""
+import argparse
+import timeit
+import tracemalloc
+
+from pythonosc import osc_message_builder
+
+from osc.osc_encoding import MessageTemplateCache, typetags_for
+
+CASES = [
+    ("/filter", [0.5]),
+    ("/volume", [1]),
+    ("/midi/0", [bytes(range(256)) * 8]),
+]
+
+
+def build_message(address, args):
+    msg = osc_message_builder.OscMessageBuilder(address=address)
+    for arg in args:
+        msg.add_arg(arg)
+    return msg.build().dgram
+
+
+def allocations(fn, number):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for _ in range(number):
+        fn()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    return sum(stat.count_diff for stat in after.compare_to(before, "filename") if stat.count_diff > 0)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=100000, help="encodes per case")
+    args = parser.parse_args()
+
+    templates = MessageTemplateCache()
+    for address, values in CASES:
+        template = templates.get(address, typetags_for(values))
+        assert bytes(template.encode(*values)) == build_message(address, values)
+
+        builder = lambda: build_message(address, values)
+        cached = lambda: templates.get(address, typetags_for(values)).encode(*values)
+        precompiled = lambda: template.encode(*values)
+        print(address)
+        for name, fn in (("builder", builder), ("cached", cached), ("precompiled", precompiled)):
+            elapsed = timeit.timeit(fn, number=args.number)
+            print("    {:<12} {:>8.3f} us/msg  {:>6} live allocations after {} msgs".format(
+                name, 1e6 * elapsed / args.number, allocations(fn, 1000), 1000))
+
+
+if __name__ == "__main__":
+    main()
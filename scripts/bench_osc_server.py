@@ -0,0 +1,84 @@
+"""
+messages/sec and handler latency of OscServer in threading vs asyncio mode
+
+A sender process blasts /filter messages carrying their send time at the server,
+the handler records time.time() - send time.
+
+usage:
+    python scripts/bench_osc_server.py --messages 20000 --rate 10000
+"""
+import argparse
+import multiprocessing
+import statistics
+import threading
+import time
+
+from pythonosc import udp_client
+
+from osc.osc_server import OscServer, SERVER_MODES
+
+
+def send(ip, port, messages, rate):
+    client = udp_client.SimpleUDPClient(ip, port)
+    interval = 1.0 / rate
+    next_send = time.time()
+    for i in range(messages):
+        client.send_message("/filter", [time.time(), i / messages])
+        next_send += interval
+        delay = next_send - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def percentile(sorted_values, pct):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100.0))]
+
+
+def bench(mode, ip, port, messages, rate):
+    latencies = []
+    done = threading.Event()
+
+    def on_filter(unused_addr, sent_at, value):
+        latencies.append(time.time() - sent_at)
+        if len(latencies) >= messages:
+            done.set()
+
+    server = OscServer(ip, port, mode=mode)
+    server.dispatcher.map("/filter", on_filter)
+    server.daemon = True
+    server.start()
+    time.sleep(0.2)
+
+    sender = multiprocessing.Process(target=send, args=(ip, port, messages, rate))
+    start = time.time()
+    sender.start()
+    sender.join()
+    done.wait(timeout=5.0)
+    elapsed = time.time() - start
+    server.shutdown()
+
+    latencies.sort()
+    received = len(latencies)
+    if not received:
+        print("{:<9} received nothing".format(mode))
+        return
+    print("{:<9} received={}/{} ({:.2%} dropped) {:.0f} msgs/s  p50={:.2f}ms p99={:.2f}ms max={:.2f}ms".format(
+        mode, received, messages, 1 - received / messages, received / elapsed,
+        1000 * statistics.median(latencies), 1000 * percentile(latencies, 99), 1000 * latencies[-1]))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ip", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5205)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--rate", type=float, default=10000.0, help="target messages per second")
+    parser.add_argument("--modes", default=",".join(SERVER_MODES))
+    args = parser.parse_args()
+
+    for i, mode in enumerate(args.modes.split(",")):
+        bench(mode, args.ip, args.port + i, args.messages, args.rate)
+
+
+if __name__ == "__main__":
+    main()
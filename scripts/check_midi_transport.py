@@ -0,0 +1,81 @@
+"""
+round trip check: chunked midi through the threading OscServer
+
+Payloads of several sizes (one chunk, just over one chunk, several) are sent with
+SynOscClient.send_midi_bytes to an OscServer in threading mode (socketserver, which cuts datagrams
+longer than RECEIVER_MAX_PACKET short) and must come out of the MidiReassembler byte for byte.
+Missing chunks are requested from the address they came from, as SynOscServer does, so bursts that
+overflow the socket buffer are recovered by the client's resend listener.
+
+usage:
+    python scripts/check_midi_transport.py --sizes 100 8192 30000 200000
+"""
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+
+from osc.midi_transport import MidiReassembler, MIDI_CHUNK_ADDRESS, MIDI_RESEND_ADDRESS
+from osc.osc_client import OscClient
+from osc.osc_server import OscServer
+from osc.synosc_client import SynOscClient
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ip", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5108)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 8152, 8153, 30000, 200000], help="payload bytes")
+    parser.add_argument("--timeout", type=float, default=2.0, help="seconds to wait for each payload")
+    args = parser.parse_args()
+
+    reassembler = MidiReassembler(timeout=args.timeout)
+    delivered = {}
+    arrived = threading.Condition()
+
+    def on_chunk(client_address, unused_addr, msg_id, seq, total, payload):
+        midi_bytes = reassembler.add_chunk(msg_id, seq, total, payload, source=client_address)
+        if midi_bytes is not None:
+            with arrived:
+                delivered[msg_id] = midi_bytes
+                arrived.notify_all()
+
+    server = OscServer(args.ip, args.port, mode="threading")
+    server.dispatcher.map(MIDI_CHUNK_ADDRESS, on_chunk, needs_reply_address=True)
+    server.daemon = True
+    server.start()
+    while server.server is None:
+        time.sleep(0.01)
+
+    stop = threading.Event()
+    resend_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def poll():
+        while not stop.wait(reassembler.resend_after / 2):
+            for source, msg_id, missing in reassembler.poll():
+                resend_sock.sendto(OscClient.build_message(MIDI_RESEND_ADDRESS, [msg_id] + missing).dgram, source)
+
+    threading.Thread(target=poll, daemon=True).start()
+
+    client = SynOscClient(args.ip, args.port)
+    print("chunk payload: {} bytes".format(client.midi_chunker.chunk_size))
+    failed = False
+    for size in args.sizes:
+        payload = os.urandom(size)
+        msg_id = client.send_midi_bytes(payload)
+        with arrived:
+            arrived.wait_for(lambda: msg_id in delivered, timeout=args.timeout)
+        ok = delivered.get(msg_id) == payload
+        failed |= not ok
+        print("{:>8} bytes: {}".format(size, "ok" if ok else "FAILED"))
+    print("stats: {}".format(reassembler.stats))
+    stop.set()
+    client.shutdown()
+    server.shutdown()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
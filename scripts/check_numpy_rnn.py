@@ -0,0 +1,100 @@
+"""
+parity check: numpy melody_rnn backend vs the TensorFlow generator
+
+For the same bundle and primer:
+    softmax: max abs difference of the next event distribution at every primer step
+    sampling: generated events with the same numpy seed, both backends draw through
+              encoder_decoder.extend_event_sequences so identical softmaxes give identical melodies
+
+usage:
+    python scripts/check_numpy_rnn.py --bundle $SYNOSC_PATH/data/mags/attention_rnn.mag --seeds 5
+"""
+import argparse
+import copy
+import os
+import sys
+import time
+
+import numpy as np
+
+from generators.interfaces.synmag_midi import _load_generator_from_bundle_file
+from generators.models.numpy_rnn import _softmax
+
+
+def tf_softmax(generator, melody):
+    """next event distributions for every primer step from the TensorFlow session"""
+    model = generator._model
+    session = model._session
+    graph = session.graph
+    inputs = model._config.encoder_decoder.get_inputs_batch([melody], full_length=True)
+    graph_inputs = graph.get_collection('inputs')[0]
+    batch_size = graph_inputs.shape[0].value
+    feed_dict = {graph_inputs: inputs * batch_size}
+    temperature = graph.get_collection('temperature')
+    if temperature:
+        feed_dict[temperature[0]] = 1.0
+    return session.run(graph.get_collection('softmax')[0], feed_dict)[0]
+
+
+def np_softmax(generator, melody):
+    rnn = generator._model.rnn
+    inputs = np.asarray(generator._model._config.encoder_decoder.get_inputs_batch([melody], full_length=True),
+                        dtype=np.float32)
+    state = rnn.zero_state(1)
+    softmaxes = []
+    for t in range(inputs.shape[1]):
+        logits, state = rnn.step(inputs[:, t, :], state)
+        softmaxes.append(_softmax(logits[0]))
+    return np.array(softmaxes)
+
+
+def primer_melody(generator):
+    import magenta.music as mm
+
+    melody = mm.Melody([60, -2, 62, -2, 64, -1, 67, -2, 65, -2, 64, -2, 62, -1, 60, -2],
+                       steps_per_quarter=generator.steps_per_quarter)
+    melody.squash(generator._model._config.min_note, generator._model._config.max_note,
+                  generator._model._config.transpose_to_key)
+    return melody
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bundle", default=os.path.join(os.environ.get("SYNOSC_PATH", "."), "data", "mags",
+                                                         "attention_rnn.mag"))
+    parser.add_argument("--seeds", type=int, default=5)
+    parser.add_argument("--num_steps", type=int, default=64)
+    parser.add_argument("--tolerance", type=float, default=1e-4, help="max abs softmax difference")
+    args = parser.parse_args()
+
+    tf_generator = _load_generator_from_bundle_file(args.bundle, backend="tensorflow")
+    np_generator = _load_generator_from_bundle_file(args.bundle, backend="numpy")
+    melody = primer_melody(tf_generator)
+
+    softmax_diff = float(np.max(np.abs(tf_softmax(tf_generator, melody) - np_softmax(np_generator, melody))))
+    print("softmax max abs diff: {:.2e}".format(softmax_diff))
+
+    matched = 0
+    tf_time = np_time = 0.0
+    for seed in range(args.seeds):
+        np.random.seed(seed)
+        started = time.perf_counter()
+        tf_melody = tf_generator._model.generate_melody(args.num_steps, copy.deepcopy(melody))
+        tf_time += time.perf_counter() - started
+        np.random.seed(seed)
+        started = time.perf_counter()
+        np_melody = np_generator._model.generate_melody(args.num_steps, copy.deepcopy(melody))
+        np_time += time.perf_counter() - started
+        same = list(tf_melody) == list(np_melody)
+        matched += same
+        print("seed {}: {}".format(seed, "match" if same else "differ"))
+    print("sampling: {}/{} seeds identical, tf {:.3f}s numpy {:.3f}s per melody".format(
+        matched, args.seeds, tf_time / args.seeds, np_time / args.seeds))
+
+    ok = softmax_diff <= args.tolerance and matched == args.seeds
+    print("parity", "ok" if ok else "FAILED")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
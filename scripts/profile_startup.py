@@ -0,0 +1,85 @@
+"""
+startup time profile
+
+Each step runs in a fresh interpreter, so every measurement is a cold start as after a crash:
+
+    import: time to import each entry point module
+    build:  time to construct the objects a restart builds (Ether, SynOscServer)
+
+With --importtime the slowest imports of each module are listed from python -X importtime.
+
+usage:
+    python scripts/profile_startup.py
+    python scripts/profile_startup.py --importtime --top 10
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = (
+    "osc.synosc_server",
+    "osc.synosc_client",
+    "generators.orchestrator",
+    "generators.music_generator",
+    "generators.interfaces.synmag_midi",
+    "generators.models.melody_rnn",
+)
+
+BUILDS = {
+    "build_ether": "from generators.orchestrator import build_ether; build_ether()",
+    "SynOscServer": "from generators.orchestrator import build_ether; from osc.synosc_server import SynOscServer; "
+                    "SynOscServer(build_ether()).construct_dispatchers()",
+}
+
+TIMER = "import time; _t = time.perf_counter(); {}; print(time.perf_counter() - _t)"
+
+
+def run_timed(statement):
+    """
+    :return: (seconds, error) for the statement in a fresh interpreter
+    """
+    result = subprocess.run([sys.executable, "-c", TIMER.format(statement)], cwd=ROOT,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if result.returncode != 0:
+        return None, result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "failed"
+    return float(result.stdout.strip().splitlines()[-1]), None
+
+
+def slowest_imports(module, top):
+    """
+    :return: (list) of (cumulative seconds, imported module) from python -X importtime
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=ROOT,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    timings = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        timings.append((int(cumulative) / 1e6, name))
+    return sorted(timings, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--importtime", action="store_true", help="list the slowest imports per module")
+    parser.add_argument("--top", type=int, default=5)
+    args = parser.parse_args()
+
+    print("{:<8} {:<40} {:>10}".format("step", "target", "seconds"))
+    for module in MODULES:
+        seconds, error = run_timed(f"import {module}")
+        print("{:<8} {:<40} {:>10}".format("import", module, error or "{:.3f}".format(seconds)))
+        if args.importtime and error is None:
+            for cumulative, name in slowest_imports(module, args.top):
+                print("{:<8} {:<40} {:>10.3f}".format("", "  " + name, cumulative))
+    for name, statement in BUILDS.items():
+        seconds, error = run_timed(statement)
+        print("{:<8} {:<40} {:>10}".format("build", name, error or "{:.3f}".format(seconds)))
+
+
+if __name__ == "__main__":
+    main()
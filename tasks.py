@@ -5,3 +5,12 @@ from generators import music_generator
 @task
 def test(c):
     music_generator.test()
+
+
+@task
+def bench_osc(c, mode="threading", mix="cc:0.8,midi:0.15,bundle:0.05", rate=2000, duration=5):
+    """
+    drive a local OscServer with a message mix and report throughput, drops and latency percentiles
+    """
+    from osc import osc_load
+    osc_load.main(["--mode", mode, "--mix", mix, "--rate", str(rate), "--duration", str(duration)])
@@ -0,0 +1,135 @@
+"""
+incremental chroma and key estimation
+
+ChromaAccumulator keeps the 12 pitch class weights get_musical_key computes from a whole piano roll
+(velocity times frames sounding, drums excluded), but updates them per note in O(1), so the key can
+be re-estimated every tick of a live performance. With a half_life the weights decay, so the key
+follows modulations instead of averaging over the whole set.
+
+The key is the Krumhansl-Kessler profile best correlated with the chroma. All 24 rotated profiles are
+standardized once into a [24, 12] matrix, so the correlations for one chroma, or a batch of them, are
+a single matrix product.
+"""
+import numpy as np
+
+PITCH_CLASSES = ("C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B")
+KEY_NAMES = tuple(f"{p} major" for p in PITCH_CLASSES) + tuple(f"{p} minor" for p in PITCH_CLASSES)
+
+# Krumhansl & Kessler 1982 probe tone ratings, tonic first
+KRUMHANSL_MAJOR = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
+KRUMHANSL_MINOR = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
+
+
+def _standardize(x):
+    """
+    :return: x with zero mean and unit standard deviation along the last axis, constant rows become 0
+    """
+    x = np.asarray(x, np.float64)
+    centered = x - x.mean(axis=-1, keepdims=True)
+    std = centered.std(axis=-1, keepdims=True)
+    return np.divide(centered, std, out=np.zeros_like(centered), where=std > 0)
+
+
+# row k < 12: major key with tonic k, row 12 + k: minor key with tonic k
+KEY_MATRIX = _standardize(np.stack([np.roll(KRUMHANSL_MAJOR, k) for k in range(12)] +
+                                   [np.roll(KRUMHANSL_MINOR, k) for k in range(12)])) / 12
+
+
+def key_correlations(chroma):
+    """
+    chroma: [12] or [n, 12] pitch class weights
+    :return: [24] or [n, 24] Pearson correlation with each key profile, in KEY_NAMES order
+    """
+    return _standardize(chroma) @ KEY_MATRIX.T
+
+
+def estimate_key(chroma):
+    """
+    :return: (key name, correlation), ("", 0.0) for a chroma without pitch class differences
+    """
+    correlations = key_correlations(chroma)
+    best = int(np.argmax(correlations))
+    if correlations[best] <= 0:
+        return "", 0.0
+    return KEY_NAMES[best], float(correlations[best])
+
+
+def note_frames(start, end, fs):
+    """
+    :return: piano roll frames a note sounds for, as PrettyMIDI.get_piano_roll counts them
+    """
+    return max(0, int(end * fs) - int(start * fs))
+
+
+class ChromaAccumulator:
+
+    def __init__(self, half_life=None, fs=100):
+        """
+        half_life: seconds for weights to lose half their weight, None keeps everything as get_musical_key
+        fs: piano roll frames per second the weights are counted in
+        """
+        self.half_life = half_life
+        self.fs = fs
+        self.reset()
+
+    def reset(self):
+        self.weights = np.zeros(12)
+        self._time = None
+
+    def decay(self, time):
+        """
+        age the weights to time, earlier times than the last one are ignored
+        """
+        if self.half_life is None:
+            return
+        if self._time is not None and time > self._time:
+            self.weights *= 0.5 ** ((time - self._time) / self.half_life)
+        if self._time is None or time > self._time:
+            self._time = time
+
+    def add(self, pitch, velocity, start, end, is_drum=False):
+        """
+        add a note, O(1)
+        """
+        if is_drum:
+            return
+        self.decay(start)
+        self.weights[pitch % 12] += velocity * note_frames(start, end, self.fs)
+
+    def extend(self, pitch, velocity, start, previous_end, end, is_drum=False):
+        """
+        account for a note added with previous_end that has kept sounding until end, O(1)
+        """
+        if is_drum:
+            return
+        self.weights[pitch % 12] += velocity * (note_frames(start, end, self.fs) -
+                                                note_frames(start, previous_end, self.fs))
+
+    def add_note_array(self, note_array):
+        """
+        add every note of a NoteArray in one vectorized pass
+        """
+        melodic = note_array.notes[~note_array.notes["is_drum"]]
+        if not len(melodic):
+            return
+        frames = np.maximum(0, (melodic["end"] * self.fs).astype(np.int64) -
+                            (melodic["start"] * self.fs).astype(np.int64))
+        weights = melodic["velocity"] * frames.astype(np.float64)
+        if self.half_life is not None:
+            last = float(melodic["start"].max())
+            self.decay(last)
+            weights *= 0.5 ** ((last - melodic["start"]) / self.half_life)
+        self.weights += np.bincount(melodic["pitch"] % 12, weights=weights, minlength=12)
+
+    def profile(self):
+        """
+        :return: (12 array) relative amount of each pitch class, as get_musical_key
+        """
+        total = self.weights.sum()
+        return self.weights / total if total > 0 else np.zeros(12)
+
+    def key(self):
+        """
+        :return: (key name, correlation) of the accumulated chroma
+        """
+        return estimate_key(self.weights)
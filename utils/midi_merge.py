@@ -0,0 +1,272 @@
+"""
+streaming merge of standard MIDI files
+
+Merges the track chunks of several files into one valid file without loading any of them whole.
+Events are read one at a time from each input (running status expanded, so events can be reordered
+safely) and written straight to the output, whose chunk lengths and track count are patched in once
+known. Memory is bounded by the largest single event, plus one open reader per track when tracks are
+interleaved.
+
+    sequential: each file starts where the previous one ended (its last end of track), as if played
+                one after the other
+    parallel:   every file starts at tick 0
+
+    single_track=False: format 1, the tempo, time and key signature events of every file are
+                        interleaved into a first conductor track, then every input track
+                        becomes an output track
+    single_track=True:  format 0, the tracks are interleaved by time into one track
+
+Sequential files that don't set a tempo at their start get the default tempo written there, so
+they don't inherit the previous file's.
+
+Delta times are rescaled to the division of the output, which is the first file's unless given.
+"""
+import heapq
+import struct
+
+DEFAULT_DIVISION = 220
+END_OF_TRACK = b"\xff\x2f\x00"
+DEFAULT_TEMPO = b"\xff\x51\x03\x07\xa1\x20"  # 500000 microseconds per quarter
+# tempo, time signature and key signature meta events, which belong in the first track of format 1
+CONDUCTOR_META_TYPES = (0x51, 0x58, 0x59)
+# data bytes following each channel message status, by high nibble
+_DATA_LENGTHS = {0x80: 2, 0x90: 2, 0xA0: 2, 0xB0: 2, 0xC0: 1, 0xD0: 1, 0xE0: 2}
+
+
+class MidiMergeError(ValueError):
+    pass
+
+
+def _varlen(value):
+    if value < 0x80:
+        return bytes((value,))
+    out = [value & 0x7F]
+    value >>= 7
+    while value:
+        out.append(0x80 | (value & 0x7F))
+        value >>= 7
+    return bytes(reversed(out))
+
+
+def _read_exact(f, n):
+    data = f.read(n)
+    if len(data) != n:
+        raise MidiMergeError(f"{getattr(f, 'name', 'midi file')} ends inside a chunk")
+    return data
+
+
+def _read_varlen(f):
+    """
+    :return: (value, raw bytes)
+    """
+    raw = bytearray()
+    value = 0
+    while True:
+        byte = _read_exact(f, 1)[0]
+        raw.append(byte)
+        value = (value << 7) | (byte & 0x7F)
+        if byte < 0x80:
+            return value, bytes(raw)
+
+
+def read_header(f):
+    """
+    read the MThd chunk of a file positioned at its start
+    :return: (format, number of tracks, division)
+    """
+    chunk_type, length = struct.unpack(">4sI", _read_exact(f, 8))
+    if chunk_type != b"MThd" or length < 6:
+        raise MidiMergeError(f"{getattr(f, 'name', 'midi file')} is not a standard MIDI file")
+    midi_format, num_tracks, division = struct.unpack(">HHH", _read_exact(f, 6))
+    f.seek(length - 6, 1)
+    if division & 0x8000:
+        raise MidiMergeError("SMPTE time division is not supported")
+    return midi_format, num_tracks, division
+
+
+def track_offsets(fname):
+    """
+    :return: (division, list of (offset, length) of each MTrk chunk's data), found by seeking past chunks
+    """
+    offsets = []
+    with open(fname, "rb") as f:
+        _, _, division = read_header(f)
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                break
+            chunk_type, length = struct.unpack(">4sI", header)
+            if chunk_type == b"MTrk":
+                offsets.append((f.tell(), length))
+            f.seek(length, 1)
+    return division, offsets
+
+
+class TrackReader:
+    """
+    iterates the events of one track chunk as (absolute tick in the output division, event bytes with
+    status), end_tick is set to the tick of its end of track once exhausted
+    conductor: None for every event, True for only conductor meta events, False for all others
+    """
+
+    def __init__(self, fname, offset, length, division, out_division, tick_offset=0, conductor=None):
+        self.fname = fname
+        self.offset = offset
+        self.length = length
+        self.division = division
+        self.out_division = out_division
+        self.tick_offset = tick_offset
+        self.conductor = conductor
+        self.end_tick = None
+
+    def _scale(self, tick):
+        if self.division == self.out_division:
+            return self.tick_offset + tick
+        return self.tick_offset + (tick * self.out_division + self.division // 2) // self.division
+
+    def __iter__(self):
+        with open(self.fname, "rb") as f:
+            f.seek(self.offset)
+            end = self.offset + self.length
+            tick = 0
+            status = 0
+            while f.tell() < end:
+                delta, _ = _read_varlen(f)
+                tick += delta
+                byte = _read_exact(f, 1)[0]
+                if byte & 0x80:
+                    first = b""
+                    if byte < 0xF0:
+                        status = byte
+                elif status == 0:
+                    raise MidiMergeError(f"running status without a status byte in {self.fname}")
+                else:
+                    first = bytes((byte,))
+                    byte = status
+
+                if byte == 0xFF:
+                    meta_type = _read_exact(f, 1)
+                    length, raw_length = _read_varlen(f)
+                    data = _read_exact(f, length)
+                    if meta_type == b"\x2f":
+                        break
+                    if self.conductor is None or self.conductor == (meta_type[0] in CONDUCTOR_META_TYPES):
+                        yield self._scale(tick), b"\xff" + meta_type + raw_length + data
+                elif byte == 0xF0 or byte == 0xF7:
+                    length, raw_length = _read_varlen(f)
+                    data = _read_exact(f, length)
+                    if not self.conductor:
+                        yield self._scale(tick), bytes((byte,)) + raw_length + data
+                else:
+                    data = first + _read_exact(f, _DATA_LENGTHS[byte & 0xF0] - len(first))
+                    if not self.conductor:
+                        yield self._scale(tick), bytes((byte,)) + data
+            self.end_tick = self._scale(tick)
+
+
+def _write_track(out, reader):
+    """
+    write a TrackReader's events as an MTrk chunk, patching in its length
+    :return: (int) tick of the written end of track
+    """
+    out.write(b"MTrk\x00\x00\x00\x00")
+    start = out.tell()
+    last = 0
+    for tick, event in reader:
+        out.write(_varlen(tick - last))
+        out.write(event)
+        last = tick
+    end_tick = max(last, reader.end_tick)
+    out.write(_varlen(end_tick - last) + END_OF_TRACK)
+    _patch_length(out, start)
+    return end_tick
+
+
+def _patch_length(out, start):
+    """
+    write the length of the chunk whose data starts at start and ends at the current position
+    """
+    end = out.tell()
+    out.seek(start - 4)
+    out.write(struct.pack(">I", end - start))
+    out.seek(end)
+
+
+def _write_events(out, events, last, tempo_at=None):
+    """
+    write (absolute tick, event bytes) in tick order as delta timed events of the current track
+    tempo_at: tick to write the default tempo at, unless the events set a tempo there first
+    :return: (int) tick of the last event written
+    """
+    for tick, event in events:
+        if tempo_at is not None:
+            if tick != tempo_at or event[:2] != DEFAULT_TEMPO[:2]:
+                out.write(_varlen(tempo_at - last) + DEFAULT_TEMPO)
+                last = tempo_at
+            tempo_at = None
+        out.write(_varlen(tick - last))
+        out.write(event)
+        last = tick
+    if tempo_at is not None:
+        out.write(_varlen(tempo_at - last) + DEFAULT_TEMPO)
+        last = tempo_at
+    return last
+
+
+def _interleave(out, inputs, division, sequential, conductor):
+    """
+    write the events of every track of the inputs into the current track, in tick order
+    :return: (last written tick, end tick, list of the tick each input starts at)
+    """
+    last = 0
+    end_tick = 0
+    starts = []
+    # parallel files are interleaved together, sequential ones one file at a time
+    groups = [inputs] if not sequential else [[file_input] for file_input in inputs]
+    for group in groups:
+        tick_offset = end_tick if sequential else 0
+        starts.extend([tick_offset] * len(group))
+        readers = [TrackReader(fname, offset, length, file_division, division, tick_offset, conductor)
+                   for fname, file_division, offsets in group for offset, length in offsets]
+        last = _write_events(out, heapq.merge(*readers, key=lambda tick_event: tick_event[0]), last,
+                             tempo_at=tick_offset if sequential else None)
+        end_tick = max([end_tick, last] + [reader.end_tick for reader in readers if reader.end_tick is not None])
+    return last, end_tick, starts
+
+
+def merge_midi_files(fnames, out_f, sequential=True, single_track=False, division=None):
+    """
+    merge midi files into out_f, a path or a seekable binary file
+    :return: (int) number of tracks written
+    """
+    if isinstance(out_f, str):
+        with open(out_f, "wb") as f:
+            return merge_midi_files(fnames, f, sequential, single_track, division)
+
+    inputs = [(fname,) + track_offsets(fname) for fname in fnames]
+    if division is None:
+        division = inputs[0][1] if inputs else DEFAULT_DIVISION
+    header_start = out_f.tell()
+    out_f.write(b"MThd" + struct.pack(">IHHH", 6, 0 if single_track else 1, 0, division))
+
+    # all events for format 0, the conductor track for format 1, which also finds where each file starts
+    out_f.write(b"MTrk\x00\x00\x00\x00")
+    track_start = out_f.tell()
+    last, end_tick, starts = _interleave(out_f, inputs, division, sequential,
+                                         conductor=None if single_track else True)
+    out_f.write(_varlen(end_tick - last) + END_OF_TRACK)
+    _patch_length(out_f, track_start)
+    num_tracks = 1
+
+    if not single_track:
+        for (fname, file_division, offsets), tick_offset in zip(inputs, starts):
+            for offset, length in offsets:
+                _write_track(out_f, TrackReader(fname, offset, length, file_division, division, tick_offset,
+                                                conductor=False))
+                num_tracks += 1
+
+    end = out_f.tell()
+    out_f.seek(header_start + 10)
+    out_f.write(struct.pack(">H", num_tracks))
+    out_f.seek(end)
+    return num_tracks
@@ -2,10 +2,15 @@ import pretty_midi
 import mido
 from mido import sockets
 from mido.ports import MultiPort
+import io
 import os
 import time
 from queue import Queue
 
+from utils.key_estimator import ChromaAccumulator, estimate_key
+from utils.midi_merge import merge_midi_files
+from utils.note_array import NoteArray
+from utils.streaming_synth import StreamingSynth
 from utils.wrench import get_abs_fnames_in_dir
 """
 pretty_midi examples: https://github.com/craffel/pretty-midi/tree/master/examples
@@ -54,17 +59,17 @@ def bpm_to_qpm():
 
 
 
-def get_midi_aggr_dir(in_dir, out_f):
-    midi_files = get_abs_fnames_in_dir(in_dir)
-    ml = list()
-    for midif in midi_files:
-        with open(midif, "rb") as f:
-            m = f.read()
-        ml.append(m)
-    b = "\n".encode().join(ml)
-    with open(out_f, "wb") as f:
-        f.write(b)
-    return b
+def get_midi_aggr_dir(in_dir, out_f, sequential=True, single_track=False):
+    """
+    merge the midi files of in_dir, in name order, into the single midi file out_f, streaming them
+    sequential: each file starts where the previous one ends, otherwise all start together
+    single_track: one format 0 track instead of a format 1 track per input track
+    :return: (str) out_f, for get_midi / estimate_tempo or to send as is
+    """
+    midi_files = sorted(f for f in get_abs_fnames_in_dir(in_dir)
+                        if f.lower().endswith((".mid", ".midi")) and os.path.abspath(f) != os.path.abspath(out_f))
+    merge_midi_files(midi_files, out_f, sequential=sequential, single_track=single_track)
+    return out_f
 
 
 def serve_ports():
@@ -90,7 +95,30 @@ def print_ports():
     _print_ports("Output Ports:", mido.get_output_names())
 
 
-def get_midi(fname="example.mid"):
+def midi_bytes_to_sequence(midi_bytes):
+    """
+    parse the contents of a midi file into a NoteSequence without touching disk
+    """
+    from magenta.music import midi_io
+    return midi_io.midi_to_sequence_proto(bytes(midi_bytes))
+
+
+def sequence_to_midi_bytes(sequence):
+    """
+    serialize a NoteSequence to the contents of a midi file without touching disk
+    """
+    from magenta.music import midi_io
+    buffer = io.BytesIO()
+    midi_io.sequence_proto_to_pretty_midi(sequence).write(buffer)
+    return buffer.getvalue()
+
+
+def get_midi(fname="example.mid", note_array=False):
+    """
+    note_array: load into a NoteArray instead of a PrettyMIDI, the utilities below accept either
+    """
+    if note_array:
+        return NoteArray.from_file(fname)
     midi_data = pretty_midi.PrettyMIDI(fname)
     return midi_data
 
@@ -135,17 +163,32 @@ def create_midi():
 
 def estimate_tempo(midi_data):
     # Print an empirical estimate of its global tempo
+    if isinstance(midi_data, str):
+        midi_data = NoteArray.from_file(midi_data)
     return midi_data.estimate_tempo()
 
 
 def get_musical_key(midi_data):
     # Compute the relative amount of each semitone across the entire song, a proxy for key
-    total_velocity = sum(sum(midi_data.get_chroma()))
-    return [sum(semitone) / total_velocity for semitone in midi_data.get_chroma()]
+    if isinstance(midi_data, NoteArray):
+        accumulator = ChromaAccumulator()
+        accumulator.add_note_array(midi_data)
+        return list(accumulator.profile())
+    chroma = midi_data.get_chroma().sum(axis=1)
+    return list(chroma / chroma.sum())
+
+
+def estimate_musical_key(midi_data):
+    # Name of the key whose Krumhansl-Kessler profile best matches the semitone amounts
+    key_name, _ = estimate_key(get_musical_key(midi_data))
+    return key_name
 
 
 def shift_instrument_notes(midi_data, n):
     # Shift all notes up by n semitones
+    if isinstance(midi_data, NoteArray):
+        midi_data.shift_pitches(n)
+        return
     for instrument in midi_data.instruments:
         # Don't want to shift drum notes
         if not instrument.is_drum:
@@ -157,3 +200,10 @@ def synthesize_midi(midi_data):
     # Synthesize the resulting MIDI data using sine waves
     audio_data = midi_data.synthesize()
     return audio_data
+
+
+def stream_midi(midi_data, fs=44100, block_size=512, max_voices=32):
+    # Synthesize a block at a time instead of the whole file, for playback as it renders
+    if not isinstance(midi_data, NoteArray):
+        midi_data = NoteArray.from_pretty_midi(midi_data)
+    return StreamingSynth(midi_data, fs=fs, block_size=block_size, max_voices=max_voices)
@@ -0,0 +1,371 @@
+"""
+array backed note store
+
+PrettyMIDI keeps a Python object per note and per MIDI message, which dominates parse time and memory
+for the few utilities we use it for. NoteArray holds the notes of a file in one NumPy structured array:
+
+    pitch, velocity, start, end (seconds), channel, program, is_drum
+
+plus the tempo map, and parses / serializes standard MIDI file bytes directly. Its methods mirror the
+PrettyMIDI ones utils.midi_util uses (estimate_tempo, synthesize, get_end_time), so the utilities run
+on either.
+
+Note pairing follows pretty_midi: a note off closes every open note of its channel and pitch that
+started on an earlier tick. Sustain pedal, pitch bends and lyrics are ignored.
+"""
+import struct
+
+import numpy as np
+
+DEFAULT_RESOLUTION = 220
+DEFAULT_MICROSECONDS_PER_QUARTER = 500000
+DRUM_CHANNEL = 9
+
+NOTE_DTYPE = np.dtype([
+    ("pitch", np.uint8),
+    ("velocity", np.uint8),
+    ("start", np.float64),
+    ("end", np.float64),
+    ("channel", np.uint8),
+    ("program", np.uint8),
+    ("is_drum", np.bool_),
+])
+
+# data bytes following each channel message status, by high nibble
+_DATA_LENGTHS = {0x80: 2, 0x90: 2, 0xA0: 2, 0xB0: 2, 0xC0: 1, 0xD0: 1, 0xE0: 2}
+
+
+class MidiParseError(ValueError):
+    pass
+
+
+def _varlen(value):
+    """
+    :return: (bytes) MIDI variable length quantity
+    """
+    if value < 0x80:
+        return bytes((value,))
+    out = [value & 0x7F]
+    value >>= 7
+    while value:
+        out.append(0x80 | (value & 0x7F))
+        value >>= 7
+    return bytes(reversed(out))
+
+
+def _iter_chunks(data):
+    """
+    :return: (generator) of (chunk type, start, end) offsets of the chunks in a MIDI file
+    """
+    pos = 0
+    while pos + 8 <= len(data):
+        chunk_type = bytes(data[pos:pos + 4])
+        length, = struct.unpack(">I", data[pos + 4:pos + 8])
+        yield chunk_type, pos + 8, min(len(data), pos + 8 + length)
+        pos += 8 + length
+
+
+def _parse_track(data, pos, end, track):
+    """
+    :return: (list) of (on tick, off tick, pitch, velocity, channel, program) and (list) of (tick, microseconds
+        per quarter) tempo changes in one MTrk chunk
+    """
+    notes = []
+    tempos = []
+    open_notes = {}
+    programs = [0] * 16
+    tick = 0
+    status = 0
+    while pos < end:
+        # delta time
+        byte = data[pos]
+        pos += 1
+        delta = byte & 0x7F
+        while byte & 0x80:
+            byte = data[pos]
+            pos += 1
+            delta = (delta << 7) | (byte & 0x7F)
+        tick += delta
+
+        byte = data[pos]
+        if byte & 0x80:
+            pos += 1
+            if byte < 0xF0:
+                status = byte
+        elif status == 0:
+            raise MidiParseError(f"running status without a status byte in track {track}")
+        else:
+            byte = status
+
+        if byte == 0xFF:
+            meta_type = data[pos]
+            pos += 1
+            length = 0
+            while True:
+                value = data[pos]
+                pos += 1
+                length = (length << 7) | (value & 0x7F)
+                if value < 0x80:
+                    break
+            if meta_type == 0x51 and length == 3:
+                tempos.append((tick, (data[pos] << 16) | (data[pos + 1] << 8) | data[pos + 2]))
+            elif meta_type == 0x2F:
+                break
+            pos += length
+            continue
+        if byte == 0xF0 or byte == 0xF7:
+            length = 0
+            while True:
+                value = data[pos]
+                pos += 1
+                length = (length << 7) | (value & 0x7F)
+                if value < 0x80:
+                    break
+            pos += length
+            continue
+
+        kind = byte & 0xF0
+        channel = byte & 0x0F
+        if kind == 0x90 or kind == 0x80:
+            pitch = data[pos]
+            velocity = data[pos + 1]
+            pos += 2
+            key = (channel << 7) | pitch
+            if kind == 0x90 and velocity > 0:
+                open_notes.setdefault(key, []).append((tick, velocity, programs[channel]))
+                continue
+            starts = open_notes.get(key)
+            if not starts:
+                continue
+            earlier = [note for note in starts if note[0] != tick]
+            closing = earlier or starts
+            for on_tick, on_velocity, program in closing:
+                notes.append((on_tick, tick, pitch, on_velocity, channel, program))
+            if earlier and len(earlier) < len(starts):
+                open_notes[key] = [note for note in starts if note[0] == tick]
+            else:
+                del open_notes[key]
+        elif kind == 0xC0:
+            programs[channel] = data[pos]
+            pos += 1
+        else:
+            pos += _DATA_LENGTHS[kind]
+    return notes, tempos
+
+
+class NoteArray:
+
+    def __init__(self, notes=None, tempo_times=None, tempo_qpms=None, resolution=DEFAULT_RESOLUTION):
+        """
+        notes: NOTE_DTYPE structured array, sorted by start
+        tempo_times, tempo_qpms: tempo changes in seconds and quarters per minute, the first at 0
+        """
+        self.notes = np.zeros(0, NOTE_DTYPE) if notes is None else notes
+        self.tempo_times = np.zeros(1) if tempo_times is None else np.asarray(tempo_times, np.float64)
+        self.tempo_qpms = (np.array([60e6 / DEFAULT_MICROSECONDS_PER_QUARTER]) if tempo_qpms is None
+                           else np.asarray(tempo_qpms, np.float64))
+        self.resolution = resolution
+
+    def __len__(self):
+        return len(self.notes)
+
+    @classmethod
+    def from_midi_bytes(cls, midi_bytes):
+        data = memoryview(midi_bytes)
+        chunks = list(_iter_chunks(data))
+        if not chunks or chunks[0][0] != b"MThd":
+            raise MidiParseError("not a standard MIDI file")
+        _, header_start, _ = chunks[0]
+        _, _, division = struct.unpack(">HHH", data[header_start:header_start + 6])
+        if division & 0x8000:
+            raise MidiParseError("SMPTE time division is not supported")
+
+        rows = []
+        tempos = []
+        track = 0
+        for chunk_type, start, end in chunks[1:]:
+            if chunk_type != b"MTrk":
+                continue
+            try:
+                track_notes, track_tempos = _parse_track(data, start, end, track)
+            except IndexError:
+                raise MidiParseError(f"track {track} ends inside an event")
+            rows.extend(track_notes)
+            tempos.extend(track_tempos)
+            track += 1
+
+        tempo_ticks, seconds_per_tick = cls._tempo_map(tempos, division)
+        tempo_offsets = np.concatenate([[0.0], np.cumsum(np.diff(tempo_ticks) * seconds_per_tick[:-1])])
+
+        notes = np.zeros(len(rows), NOTE_DTYPE)
+        if rows:
+            columns = np.array(rows, np.int64).T
+            notes["start"] = cls._ticks_to_seconds(columns[0], tempo_ticks, tempo_offsets, seconds_per_tick)
+            notes["end"] = cls._ticks_to_seconds(columns[1], tempo_ticks, tempo_offsets, seconds_per_tick)
+            notes["pitch"] = columns[2]
+            notes["velocity"] = columns[3]
+            notes["channel"] = columns[4]
+            notes["program"] = columns[5]
+            notes["is_drum"] = columns[4] == DRUM_CHANNEL
+            notes = notes[np.argsort(notes["start"], kind="stable")]
+        return cls(notes, tempo_offsets, 60.0 / (seconds_per_tick * division), division)
+
+    @classmethod
+    def from_file(cls, fname):
+        with open(fname, "rb") as f:
+            return cls.from_midi_bytes(f.read())
+
+    @classmethod
+    def from_pretty_midi(cls, midi_data):
+        rows = [(note.pitch, note.velocity, note.start, note.end, DRUM_CHANNEL if instrument.is_drum else 0,
+                 instrument.program, instrument.is_drum)
+                for instrument in midi_data.instruments for note in instrument.notes]
+        notes = np.array(rows, NOTE_DTYPE)
+        tempo_times, tempo_qpms = midi_data.get_tempo_changes()
+        if not len(tempo_times):
+            tempo_times, tempo_qpms = None, None
+        return cls(notes[np.argsort(notes["start"], kind="stable")], tempo_times, tempo_qpms,
+                   midi_data.resolution)
+
+    @staticmethod
+    def _tempo_map(tempos, resolution):
+        """
+        :return: (tempo change ticks, seconds per tick from each change), starting at tick 0
+        """
+        tempos = sorted(dict(sorted(tempos)).items())
+        if not tempos or tempos[0][0] > 0:
+            tempos.insert(0, (0, DEFAULT_MICROSECONDS_PER_QUARTER))
+        ticks, microseconds = (np.array(column, np.float64) for column in zip(*tempos))
+        return ticks, microseconds / 1e6 / resolution
+
+    @staticmethod
+    def _ticks_to_seconds(ticks, tempo_ticks, tempo_offsets, seconds_per_tick):
+        index = np.searchsorted(tempo_ticks, ticks, side="right") - 1
+        return tempo_offsets[index] + (ticks - tempo_ticks[index]) * seconds_per_tick[index]
+
+    def seconds_to_ticks(self, seconds, resolution=None):
+        """
+        :return: (int array) ticks of the times under this tempo map
+        """
+        resolution = resolution or self.resolution
+        ticks_per_second = self.tempo_qpms / 60.0 * resolution
+        tempo_ticks = np.concatenate([[0.0], np.cumsum(np.diff(self.tempo_times) * ticks_per_second[:-1])])
+        index = np.maximum(np.searchsorted(self.tempo_times, seconds, side="right") - 1, 0)
+        return np.round(tempo_ticks[index] + (seconds - self.tempo_times[index]) * ticks_per_second[index]
+                        ).astype(np.int64)
+
+    def to_midi_bytes(self, resolution=None):
+        """
+        :return: (bytes) format 1 MIDI file, a tempo track then one track per (channel, program)
+        """
+        resolution = resolution or self.resolution
+        tempo_ticks = self.seconds_to_ticks(self.tempo_times, resolution)
+        tempo_track = bytearray()
+        previous = 0
+        for tick, qpm in zip(tempo_ticks, self.tempo_qpms):
+            microseconds = int(round(60e6 / qpm))
+            tempo_track += _varlen(int(tick) - previous) + b"\xff\x51\x03" + microseconds.to_bytes(3, "big")
+            previous = int(tick)
+        tracks = [tempo_track]
+
+        starts = self.seconds_to_ticks(self.notes["start"], resolution)
+        ends = np.maximum(starts, self.seconds_to_ticks(self.notes["end"], resolution))
+        groups = self.notes["channel"].astype(np.int64) * 128 + self.notes["program"]
+        for group in np.unique(groups):
+            selected = groups == group
+            channel, program = divmod(int(group), 128)
+            notes = self.notes[selected]
+            ticks = np.concatenate([ends[selected], starts[selected]])
+            is_on = np.concatenate([np.zeros(len(notes), np.int64), np.ones(len(notes), np.int64)])
+            # note offs before note ons on the same tick, so repeated notes don't cut each other
+            order = np.lexsort((is_on, ticks))
+            deltas = np.diff(ticks[order], prepend=0)
+            statuses = np.where(is_on[order] == 1, 0x90 | channel, 0x80 | channel)
+            pitches = np.concatenate([notes["pitch"], notes["pitch"]])[order]
+            velocities = np.concatenate([np.zeros(len(notes), np.int64), notes["velocity"]])[order]
+
+            track = bytearray(b"\x00" + bytes((0xC0 | channel, program)))
+            for delta, status, pitch, velocity in zip(deltas.tolist(), statuses.tolist(), pitches.tolist(),
+                                                      velocities.tolist()):
+                track += _varlen(delta)
+                track.append(status)
+                track.append(pitch)
+                track.append(velocity)
+            tracks.append(track)
+
+        out = bytearray(b"MThd" + struct.pack(">IHHH", 6, 1, len(tracks), resolution))
+        for track in tracks:
+            track += b"\x00\xff\x2f\x00"
+            out += b"MTrk" + struct.pack(">I", len(track)) + track
+        return bytes(out)
+
+    def write(self, fname):
+        with open(fname, "wb") as f:
+            f.write(self.to_midi_bytes())
+
+    def get_end_time(self):
+        return float(self.notes["end"].max()) if len(self.notes) else 0.0
+
+    def get_onsets(self):
+        return np.unique(self.notes["start"])
+
+    def estimate_tempi(self):
+        """
+        inter onset interval clustering as PrettyMIDI.estimate_tempi (Dixon 2001)
+        :return: (tempi, strengths) sorted by strength
+        """
+        ioi = np.diff(self.get_onsets())
+        # "rhythmic information is provided by IOIs in the range of approximately 50 ms to 2 s"
+        ioi = ioi[(ioi > .05) & (ioi < 2)]
+        # double the short intervals into the 30...300 bpm range
+        short = ioi < .2
+        ioi[short] *= 2.0 ** np.ceil(np.log2(.2 / ioi[short]))
+        clusters = []
+        counts = []
+        for interval in ioi.tolist():
+            if any(abs(cluster - interval) < .025 for cluster in clusters):
+                # pretty_midi updates argmin(clusters - interval), the smallest cluster, kept for equal estimates
+                k = clusters.index(min(clusters))
+                clusters[k] = (counts[k] * clusters[k] + interval) / (counts[k] + 1)
+                counts[k] += 1
+            else:
+                clusters.append(interval)
+                counts.append(1.0)
+        clusters, counts = np.array(clusters), np.array(counts)
+        order = np.argsort(counts, kind="stable")[::-1]
+        return 60.0 / clusters[order], counts[order] / max(counts.sum(), 1.0)
+
+    def estimate_tempo(self):
+        tempi, _ = self.estimate_tempi()
+        if tempi.size == 0:
+            raise ValueError("Can't provide a global tempo estimate when there are fewer than two notes.")
+        return tempi[0]
+
+    def shift_pitches(self, n):
+        """
+        shift the non drum notes by n semitones, in place
+        """
+        melodic = ~self.notes["is_drum"]
+        self.notes["pitch"][melodic] = np.clip(self.notes["pitch"][melodic].astype(np.int64) + n, 0, 127)
+
+    def synthesize(self, fs=44100, wave=np.sin):
+        """
+        sine synthesis of the non drum notes as PrettyMIDI.synthesize, normalized to [-1, 1]
+        """
+        melodic = self.notes[~self.notes["is_drum"]]
+        synthesized = np.zeros(int(fs * (self.get_end_time() + 1)))
+        starts = (melodic["start"] * fs).astype(np.int64)
+        ends = (melodic["end"] * fs).astype(np.int64)
+        frequencies = 440.0 * 2.0 ** ((melodic["pitch"].astype(np.float64) - 69) / 12)
+        fade_out = np.linspace(1, 0, int(.1 * fs))
+        for start, end, frequency, velocity in zip(starts, ends, frequencies, melodic["velocity"]):
+            samples = np.arange(end - start)
+            # exponential decay, ending in a fade out so notes don't click
+            envelope = np.exp(-samples / float(fs))
+            if len(envelope) > len(fade_out):
+                envelope[-len(fade_out):] *= fade_out
+            else:
+                envelope *= np.linspace(1, 0, len(envelope))
+            synthesized[start:end] += velocity * envelope * wave(2 * np.pi * frequency * samples / fs)
+        peak = np.abs(synthesized).max() if len(synthesized) else 0.0
+        return synthesized / peak if peak > 0 else synthesized
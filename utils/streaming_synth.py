@@ -0,0 +1,148 @@
+"""
+block based streaming synthesizer
+
+PrettyMIDI.synthesize renders a whole file into one array before anything can play, minutes of audio
+for a long response. StreamingSynth renders the same sine voices a block at a time from the note
+schedule of a NoteArray:
+
+    schedule: note start / end samples, sorted by start, consumed with a cursor
+    voices:   max_voices slots of per voice state (frequency, amplitude, age, length), rendered
+              together as one [voices, block] array. A note starting with every voice busy steals the
+              oldest one
+    envelope: exponential decay ending in a 0.1s fade out, as PrettyMIDI.synthesize
+
+so memory stays at max_voices * block_size samples however long the file, and the first block is ready
+as soon as it is asked for. callback() has the sounddevice OutputStream callback signature.
+
+Output isn't normalized by the peak of the whole file as PrettyMIDI does, that needs the whole file;
+each voice is scaled by gain and the mix clipped to [-1, 1].
+"""
+import threading
+
+import numpy as np
+
+DEFAULT_SAMPLES_PER_SECOND = 44100
+FADE_OUT_SECONDS = 0.1
+
+
+class StreamingSynth:
+
+    def __init__(self, note_array, fs=DEFAULT_SAMPLES_PER_SECOND, block_size=512, max_voices=32, gain=0.2):
+        """
+        note_array: NoteArray to play, drum notes are silent as in PrettyMIDI.synthesize
+        fs: samples per second
+        block_size: samples per block when render() isn't given a size
+        max_voices: notes sounding at once, older notes are cut for new ones beyond it
+        gain: amplitude of a full velocity voice
+        """
+        self.fs = fs
+        self.block_size = block_size
+        self.max_voices = max_voices
+        self.gain = gain
+        melodic = note_array.notes[~note_array.notes["is_drum"]]
+        melodic = melodic[np.argsort(melodic["start"], kind="stable")]
+        self._starts = (melodic["start"] * fs).astype(np.int64)
+        self._lengths = np.maximum(0, (melodic["end"] * fs).astype(np.int64) - self._starts)
+        self._increments = 2 * np.pi * 440.0 * 2.0 ** ((melodic["pitch"].astype(np.float64) - 69) / 12) / fs
+        self._amplitudes = gain * melodic["velocity"] / 127.0
+        self.end = int((self._starts + self._lengths).max()) if len(melodic) else 0
+        self.reset()
+
+    def reset(self):
+        self.position = 0
+        self._cursor = 0
+        self._active = np.zeros(self.max_voices, np.bool_)
+        # age in samples at the start of the next block, negative for notes starting inside it
+        self._age = np.zeros(self.max_voices, np.int64)
+        self._length = np.zeros(self.max_voices, np.int64)
+        self._increment = np.zeros(self.max_voices)
+        self._amplitude = np.zeros(self.max_voices)
+        self.stolen = 0
+
+    @property
+    def finished(self):
+        return self.position >= self.end and not self._active.any()
+
+    def _start_notes(self, block_end):
+        """
+        assign the notes starting before block_end to voices
+        """
+        while self._cursor < len(self._starts) and self._starts[self._cursor] < block_end:
+            note = self._cursor
+            self._cursor += 1
+            if self._lengths[note] == 0:
+                continue
+            free = np.flatnonzero(~self._active)
+            if len(free):
+                voice = free[0]
+            else:
+                voice = int(np.argmax(self._age))
+                self.stolen += 1
+            self._active[voice] = True
+            self._age[voice] = self.position - self._starts[note]
+            self._length[voice] = self._lengths[note]
+            self._increment[voice] = self._increments[note]
+            self._amplitude[voice] = self._amplitudes[note]
+
+    def render(self, frames=None):
+        """
+        :return: (float32 array) the next frames samples, silence once finished
+        """
+        frames = frames or self.block_size
+        self._start_notes(self.position + frames)
+        block = np.zeros(frames, np.float32)
+        voices = np.flatnonzero(self._active)
+        if len(voices):
+            ages = self._age[voices, None] + np.arange(frames)
+            lengths = self._length[voices, None]
+            sounding = (ages >= 0) & (ages < lengths)
+            ages = np.maximum(ages, 0)
+            fade = np.maximum(1, np.minimum(int(FADE_OUT_SECONDS * self.fs), lengths))
+            envelope = (self._amplitude[voices, None] * np.exp(-ages / self.fs) *
+                        np.minimum(1.0, (lengths - ages) / fade))
+            samples = np.where(sounding, envelope * np.sin(self._increment[voices, None] * ages), 0.0)
+            np.clip(samples.sum(axis=0), -1.0, 1.0, out=block)
+            self._age[voices] += frames
+            self._active[voices] = self._age[voices] < self._length[voices]
+        self.position += frames
+        return block
+
+    def blocks(self):
+        """
+        :return: (generator) of blocks until the last note has ended
+        """
+        while not self.finished:
+            yield self.render()
+
+    def callback(self, outdata, frames, time, status):
+        """
+        sounddevice OutputStream callback, every channel gets the mono mix
+        """
+        import sounddevice as sd
+
+        outdata[:] = self.render(frames)[:, None]
+        if self.finished:
+            raise sd.CallbackStop
+
+    def play(self, block=True, finished_callback=None):
+        """
+        play through the default output device, returning at once when block is False
+        finished_callback: called with the stream once it stops, the stream can't be closed from inside it
+        :return: (sounddevice.OutputStream) the running stream, the caller closes it when block is False
+        """
+        import sounddevice as sd
+
+        done = threading.Event()
+
+        def finished():
+            done.set()
+            if finished_callback is not None:
+                finished_callback(stream)
+
+        stream = sd.OutputStream(samplerate=self.fs, blocksize=self.block_size, channels=1, dtype="float32",
+                                 callback=self.callback, finished_callback=finished)
+        stream.start()
+        if block:
+            done.wait()
+            stream.close()
+        return stream